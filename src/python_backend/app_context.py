@@ -1,14 +1,19 @@
 from pathlib import Path
 import os
+from services.history_compactor import HistoryCompactor
 from services.preset_manager import PresetManager
+from services.regex_batch import RegexBatchProcessor
 from services.regex_engine import RegexEngine
+from services.response_cache import response_cache
+from services.session_store import SessionStore
 
 # Define Paths
 BACKEND_DIR = Path(__file__).parent
-APP_DIR = BACKEND_DIR.parent  # localapp directory
-DATA_DIR = APP_DIR / "data"
+APP_DIR = BACKEND_DIR.parents[1]  # localapp directory
+DATA_DIR = Path(os.environ.get("LOCALAPP_DATA_DIR") or APP_DIR / "data")
 PRESETS_DIR = DATA_DIR / "presets"
 REGEX_DIR = DATA_DIR / "regex"
+CACHE_DIR = DATA_DIR / "cache"
 
 # Ensure directories exist
 os.makedirs(PRESETS_DIR, exist_ok=True)
@@ -17,3 +22,8 @@ os.makedirs(REGEX_DIR, exist_ok=True)
 # Instantiate Singletons
 preset_manager = PresetManager(str(PRESETS_DIR))
 regex_engine = RegexEngine(str(REGEX_DIR))
+regex_batch_processor = RegexBatchProcessor(regex_engine)
+history_compactor = HistoryCompactor(str(CACHE_DIR / "history_summaries.json"))
+session_store = SessionStore(spill_dir=str(CACHE_DIR / "sessions"))
+# Disk tier of llm_service's response cache
+response_cache.cache_dir = str(CACHE_DIR / "responses")
@@ -1,18 +1,58 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Any, Dict, List, Optional
 import os
 import argparse
+import multiprocessing
 import secrets
 import uvicorn
 
 # New Router Imports
-from routers import short_novel, long_novel, provider
-from services.llm_service import generate_response, get_default_model, normalize_provider
-from services.providers import provider_registry
-
-app = FastAPI()
+from app_context import preset_manager, regex_batch_processor, regex_engine, session_store
+from routers import short_novel, long_novel, provider, preset, regex, sessions
+from routers.chat_history import compact_history
+from routers.chat_regex import apply_input_regex, with_output_regex
+from routers.streaming import ndjson_stream_response, with_done_meta
+from services.llm_service import (
+    LayeredPrompt,
+    generate_response_async,
+    generation_flight,
+    resolve_chat_config,
+    resolve_generation_config,
+    resolve_response_cache_option,
+    stream_response_events,
+)
+from services.gemini_cache import gemini_context_cache
+from services.providers import client_pool, provider_registry, provider_store
+from services.providers.model_list_cache import model_list_cache
+from services.response_cache import response_cache
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    removed = provider_store.cleanup_stale_temp_files()
+    if removed:
+        print(f"[Startup] Removed {removed} stale provider store temp file(s).")
+    # Optional: reload presets / regex scripts automatically when their directories change.
+    watch_files = os.environ.get("LOCALAPP_WATCH_FILES") == "1"
+    if watch_files:
+        preset_manager.start_watching()
+        regex_engine.start_watching()
+    yield
+    if watch_files:
+        preset_manager.stop_watching()
+        regex_engine.stop_watching()
+    regex_batch_processor.shutdown()
+    flushed = session_store.flush()
+    if flushed:
+        print(f"[Shutdown] Saved {flushed} chat session(s).")
+    await client_pool.aclose_all()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # -------------------------------------------------------------------------
 # Dynamic Configuration (Filled at runtime)
@@ -62,7 +102,12 @@ app.add_middleware(
 # Include New Routers
 app.include_router(short_novel.router, prefix="/api/chat", tags=["Short Novel"])
 app.include_router(long_novel.router, prefix="/api/chat", tags=["Long Novel"])
+app.include_router(sessions.router, prefix="/api/chat/sessions", tags=["Chat Sessions"])
 app.include_router(provider.router, prefix="/api/providers", tags=["Providers"])
+app.include_router(preset.router, prefix="/api/settings/presets", tags=["Presets"])
+app.include_router(regex.router, prefix="/api/regex", tags=["Regex"])
+# Path used by the renderer's RegexDisplayService
+app.include_router(regex.router, prefix="/api/settings/regex", include_in_schema=False)
 
 class ChatMessage(BaseModel):
     role: str
@@ -118,6 +163,21 @@ def read_root():
 def health_check():
     return {"status": "ok", "env": os.environ.get("CONDA_DEFAULT_ENV", "unknown")}
 
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Hit / miss counters of the response, Gemini context and model list caches."""
+    return {
+        "responses": response_cache.get_stats(),
+        "gemini_context": gemini_context_cache.get_stats(),
+        "model_lists": model_list_cache.get_stats(),
+        "generation_single_flight": generation_flight.get_stats(),
+    }
+
+@app.post("/api/cache/responses/clear")
+def clear_response_cache():
+    response_cache.clear()
+    return {"status": "success"}
+
 @app.get("/api/config/api-key")
 def get_api_key_status(provider: Optional[str] = None):
     if provider:
@@ -128,9 +188,11 @@ def get_api_key_status(provider: Optional[str] = None):
 
         return _build_legacy_provider_payload(provider_module.get_status())
 
+    provider_states = provider_store.get_all_provider_states()
     providers_payload: Dict[str, Dict[str, Any]] = {}
     for provider_name, provider_module in provider_registry.PROVIDER_MODULES.items():
-        providers_payload[provider_name] = _build_legacy_provider_payload(provider_module.get_status())
+        status = provider_module.get_status(provider_states.get(provider_name, {}))
+        providers_payload[provider_name] = _build_legacy_provider_payload(status)
 
     return {"providers": providers_payload}
 
@@ -155,16 +217,20 @@ def update_api_key(payload: ApiKeyUpdateRequest):
             if not api_base_url:
                 api_base_url = None
 
-        provider_module.save_config(api_key=api_key, api_base_url=api_base_url)
-
-        if payload.models is not None:
-            provider_module.save_models(payload.models, payload.selected_model or "")
-
+        state = None
         if payload.state is not None:
             state = payload.state.strip().lower()
             if state not in {"connected", "disconnected", "error"}:
                 raise HTTPException(status_code=400, detail="Invalid state.")
-            provider_module.set_connection_state(state)
+
+        with provider_store.batch():
+            provider_module.save_config(api_key=api_key, api_base_url=api_base_url)
+
+            if payload.models is not None:
+                provider_module.save_models(payload.models, payload.selected_model or "")
+
+            if state is not None:
+                provider_module.set_connection_state(state)
     except HTTPException:
         raise
     except ValueError as error:
@@ -182,44 +248,76 @@ def update_api_key(payload: ApiKeyUpdateRequest):
     }
 
 # --- Legacy Interface (Kept as requested) ---
-@app.post("/api/chat")
-async def chat_endpoint(request: ChatRequest):
-    try:
-        # 使用新的 genai.Client API（根据官方文档）
-        config = request.config or {}
-        provider_name = normalize_provider(str(config.get("provider", "google")))
-        model_name = str(config.get("model") or get_default_model(provider_name))
-        temperature = float(config.get("temperature", 0.7))
-        
-        # 模型选择 - 使用官方推荐的模型名称
-        system_instruction = f"""You are an expert novel writing assistant. 
+LEGACY_SYSTEM_INSTRUCTION = """You are an expert novel writing assistant. 
         Your tone is encouraging, creative, and precise.
         You help with:
         1. Brainstorming plot points.
         2. Polishing prose.
         3. Developing character arcs.
-        
-        Current Context:
-        {request.context if request.context else "No context provided."}
         """
 
+
+def _build_legacy_system_instruction(context: Optional[str]) -> LayeredPrompt:
+    # The per-request context goes last so the fixed instruction stays a cacheable prefix
+    return LayeredPrompt(LEGACY_SYSTEM_INSTRUCTION, f"Current Context:\n{context if context else 'No context provided.'}")
+
+@app.post("/api/chat")
+async def chat_endpoint(request: ChatRequest):
+    try:
+        # 使用新的 genai.Client API（根据官方文档）
+        provider_name, model_name, temperature = resolve_chat_config(request.config)
+        history, message = apply_input_regex(request.config, request.history, request.message)
+        history, history_compaction = await compact_history(request.config, history, provider_name, model_name)
+        generation_config = resolve_generation_config(request.config, preset_manager.get_generation_config())
+        system_instruction = _build_legacy_system_instruction(request.context)
+
         # 转换历史记录格式
-        response_text = generate_response(
-            message=request.message,
-            history=request.history,
+        usage = {}
+        response_text = await generate_response_async(
+            message=message,
+            history=history,
             system_instruction=system_instruction,
             model_name=model_name,
             temperature=temperature,
             provider_name=provider_name,
+            generation_config=generation_config,
+            usage=usage,
+            use_cache=resolve_response_cache_option(request.config),
         )
 
-        return {"text": response_text}
+        return {"text": response_text, "meta": {
+            "generation_config": generation_config,
+            "history_compaction": history_compaction,
+            "usage": usage or None,
+        }}
         
     except Exception as e:
         print(f"Backend Error: {e}")
         return {"text": f"Backend Error: {str(e)}"}
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    provider_name, model_name, temperature = resolve_chat_config(request.config)
+    history, message = apply_input_regex(request.config, request.history, request.message)
+    history, history_compaction = await compact_history(request.config, history, provider_name, model_name)
+    generation_config = resolve_generation_config(request.config, preset_manager.get_generation_config())
+    system_instruction = _build_legacy_system_instruction(request.context)
+
+    events = with_output_regex(stream_response_events(
+        message=message,
+        history=history,
+        system_instruction=system_instruction,
+        model_name=model_name,
+        temperature=temperature,
+        provider_name=provider_name,
+        generation_config=generation_config,
+        use_cache=resolve_response_cache_option(request.config),
+    ), request.config)
+    return ndjson_stream_response(with_done_meta(events, {"history_compaction": history_compaction}))
+
 if __name__ == "__main__":
+    # Needed by the regex batch process pool in frozen (packaged) builds
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser(description="AI Novel Backend")
     parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
     parser.add_argument("--token", type=str, default=None, help="Authentication token")
@@ -48,6 +48,19 @@ class ChatRequestShort(BaseModel):
     state: ShortNovelState
     config: Optional[Dict[str, Any]] = None
 
+class SessionCreateRequest(BaseModel):
+    state: Dict[str, Any]
+    config: Optional[Dict[str, Any]] = None
+    history: List[ChatMessage] = []
+
+class SessionUpdateRequest(BaseModel):
+    # Deltas: nested dicts are merged into the session's state / config
+    state: Optional[Dict[str, Any]] = None
+    config: Optional[Dict[str, Any]] = None
+
+class SessionMessageRequest(SessionUpdateRequest):
+    message: str
+
 class ChatRequestLong(BaseModel):
     history: List[ChatMessage]
     message: str
@@ -0,0 +1,25 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_context import history_compactor
+from services.history_compactor import DEFAULT_KEEP_RECENT, DEFAULT_STEP, DEFAULT_THRESHOLD_TOKENS, llm_summarizer
+
+
+async def compact_history(config: Optional[Dict[str, Any]], history: List[Any], provider_name: str,
+                          model_name: str) -> Tuple[List[Any], Optional[Dict[str, Any]]]:
+    """
+    Optional history compaction, enabled by config["history_compaction"]: true, or a dict with
+    threshold_tokens / keep_recent / step. Older turns are replaced by a cached rolling summary
+    written by the chat's own model. Returns (history, report or None).
+    """
+    options = (config or {}).get("history_compaction")
+    if not options:
+        return history, None
+    options = options if isinstance(options, dict) else {}
+
+    return await history_compactor.compact(
+        history,
+        llm_summarizer(provider_name, model_name),
+        threshold_tokens=int(options.get("threshold_tokens", DEFAULT_THRESHOLD_TOKENS)),
+        keep_recent=max(1, int(options.get("keep_recent", DEFAULT_KEEP_RECENT))),
+        step=max(1, int(options.get("step", DEFAULT_STEP))),
+    )
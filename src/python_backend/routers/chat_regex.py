@@ -0,0 +1,55 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app_context import regex_engine
+from services.regex_engine import RegexPlacement
+from services.regex_stream import apply_to_events
+
+
+def _regex_options(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    options = (config or {}).get("regex")
+    return options if isinstance(options, dict) else None
+
+
+def apply_input_regex(config: Optional[Dict[str, Any]], history: List[Any],
+                      message: str) -> Tuple[List[Any], str]:
+    """
+    Apply prompt regex scripts to the chat history and the new message when the request
+    config has a "regex" entry. History turns are processed by depth (minDepth / maxDepth)
+    and memoized by the engine, so unchanged turns are not processed again.
+    """
+    options = _regex_options(config)
+    if options is None:
+        return history, message
+
+    context = options.get("context") or None
+    overrides = options.get("overrides") or None
+    processed_history = regex_engine.process_history(history, context=context, overrides=overrides)
+    processed_message = regex_engine.process_string(
+        message,
+        RegexPlacement.USER_INPUT,
+        is_prompt=True,
+        context=context,
+        overrides=overrides,
+        depth=0,
+    )
+    return processed_history, processed_message
+
+
+def with_output_regex(events: AsyncIterator[Dict[str, Any]],
+                      config: Optional[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Apply regex scripts to the streamed deltas when the request config has a "regex" entry:
+    {"placement": 2, "context": {...}, "overrides": {...}}. Deltas only carry text that no
+    script can change any more; the done event carries the processed full text.
+    """
+    options = _regex_options(config)
+    if options is None:
+        return events
+
+    processor = regex_engine.create_stream_processor(
+        options.get("placement", RegexPlacement.AI_OUTPUT),
+        is_markdown=bool(options.get("is_markdown", False)),
+        context=options.get("context") or None,
+        overrides=options.get("overrides") or None,
+    )
+    return apply_to_events(events, processor)
@@ -1,29 +1,65 @@
-
 from fastapi import APIRouter
 from models import ChatRequestLong
-from services.llm_service import generate_response, get_default_model, normalize_provider
+from app_context import preset_manager
+from routers.chat_history import compact_history
+from routers.chat_regex import apply_input_regex, with_output_regex
+from routers.streaming import ndjson_stream_response, with_done_meta
+from services.llm_service import (
+    generate_response_async,
+    resolve_chat_config,
+    resolve_generation_config,
+    resolve_response_cache_option,
+    stream_response_events,
+)
 
 router = APIRouter()
 
+# Placeholder Logic for Long Novel
+# Future implementation will handle Volumes, Sections, complex characters, etc.
+LONG_NOVEL_SYSTEM_INSTRUCTION = "You are an expert novel writing assistant for a Long Novel (Epic). Currently under development."
+
 @router.post("/long")
 async def chat_long_novel(request: ChatRequestLong):
-    # Placeholder Logic for Long Novel
-    # Future implementation will handle Volumes, Sections, complex characters, etc.
+    provider_name, model_name, temperature = resolve_chat_config(request.config)
+    history, message = apply_input_regex(request.config, request.history, request.message)
+    history, history_compaction = await compact_history(request.config, history, provider_name, model_name)
+    generation_config = resolve_generation_config(request.config, preset_manager.get_generation_config())
     
-    system_instruction = "You are an expert novel writing assistant for a Long Novel (Epic). Currently under development."
-
-    config = request.config or {}
-    provider_name = normalize_provider(str(config.get("provider", "google")))
-    model_name = str(config.get("model") or get_default_model(provider_name))
-    temperature = float(config.get("temperature", 0.7))
-    
-    response_text = generate_response(
-        message=request.message,
-        history=request.history,
-        system_instruction=system_instruction,
+    usage = {}
+    response_text = await generate_response_async(
+        message=message,
+        history=history,
+        system_instruction=LONG_NOVEL_SYSTEM_INSTRUCTION,
         model_name=model_name,
         temperature=temperature,
         provider_name=provider_name,
+        generation_config=generation_config,
+        usage=usage,
+        use_cache=resolve_response_cache_option(request.config),
     )
     
-    return {"text": response_text}
+    return {"text": response_text, "meta": {
+        "generation_config": generation_config,
+        "history_compaction": history_compaction,
+        "usage": usage or None,
+    }}
+
+
+@router.post("/long/stream")
+async def chat_long_novel_stream(request: ChatRequestLong):
+    provider_name, model_name, temperature = resolve_chat_config(request.config)
+    history, message = apply_input_regex(request.config, request.history, request.message)
+    history, history_compaction = await compact_history(request.config, history, provider_name, model_name)
+    generation_config = resolve_generation_config(request.config, preset_manager.get_generation_config())
+
+    events = with_output_regex(stream_response_events(
+        message=message,
+        history=history,
+        system_instruction=LONG_NOVEL_SYSTEM_INSTRUCTION,
+        model_name=model_name,
+        temperature=temperature,
+        provider_name=provider_name,
+        generation_config=generation_config,
+        use_cache=resolve_response_cache_option(request.config),
+    ), request.config)
+    return ndjson_stream_response(with_done_meta(events, {"history_compaction": history_compaction}))
@@ -8,7 +8,7 @@ router = APIRouter()
 
 @router.get("/list")
 async def list_presets():
-    # Reload to ensure we see file system changes
+    # Incremental reload: only stats the preset files, contents are parsed on first use
     preset_manager.reload_presets()
     return {"presets": preset_manager.get_preset_list(), "active": preset_manager.current_preset_name}
 
@@ -16,7 +16,7 @@ async def list_presets():
 async def get_active_preset():
     """Get full details of the active preset"""
     if not preset_manager.current_preset_name:
-         return {"name": None, "data": {}, "config": {}, "system_prompt": ""}
+         return {"name": None, "data": {}, "config": {}, "system_prompt": "", "system_prompt_tokens": 0, "revision": None}
     
     data = preset_manager.get_active_preset_data()
     # Also return the derived config and system prompt for convenience/preview
@@ -27,7 +27,9 @@ async def get_active_preset():
         "name": preset_manager.current_preset_name,
         "data": data,
         "config": config,
-        "system_prompt": sys_prompt
+        "system_prompt": sys_prompt,
+        "system_prompt_tokens": preset_manager.get_system_prompt_tokens(),
+        "revision": preset_manager.get_preset_revision(),
     }
 
 @router.post("/active")
@@ -78,4 +80,4 @@ async def import_preset(request: Request):
 async def reload_presets():
     """Reload presets from disk (called after Electron writes files)"""
     preset_manager.reload_presets()
-    return {"status": "success", "count": len(preset_manager.presets)}
+    return {"status": "success", "count": len(preset_manager.get_preset_list())}
@@ -3,7 +3,10 @@ from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from services.providers import deepseek_provider, google_provider, openai_compatible_provider
+from services.providers import deepseek_provider, google_provider, openai_compatible_provider, provider_store
+from services.providers.concurrency_limiter import provider_limiter
+from services.providers.model_list_cache import model_list_cache
+from services.retry_policy import PROVIDER_CALL_DEADLINE_SECONDS, call_with_retry, deadline_after
 
 router = APIRouter()
 
@@ -68,13 +71,15 @@ def handle_provider_status(provider_module):
     return build_provider_response(provider_module, True, "disconnected", "API key saved. Click Connect to validate.")
 
 
-def handle_provider_models(provider_module):
+def handle_provider_models(provider_module, refresh: bool = False):
     status = provider_module.get_status()
     if not status.get("configured"):
         raise HTTPException(status_code=400, detail="API key is not configured.")
 
     try:
-        models = provider_module.list_models()
+        models, cached = model_list_cache.list_models(provider_module, force_refresh=refresh)
+        if cached:
+            return {**build_provider_response(provider_module, True, "connected", "Models loaded from cache."), "cached": True}
         provider_module.save_models(models, status.get("selected_model", ""))
     except ValueError as error:
         provider_module.set_connection_state("error")
@@ -83,31 +88,32 @@ def handle_provider_models(provider_module):
         provider_module.set_connection_state("error")
         raise HTTPException(status_code=502, detail=f"Failed to fetch models: {error}")
 
-    return build_provider_response(provider_module, True, "connected", "Models fetched.")
+    return {**build_provider_response(provider_module, True, "connected", "Models fetched."), "cached": False}
 
 
 def handle_provider_connect(provider_module, payload: GenericConnectRequest):
     try:
-        provider_module.save_config(
-            api_key=payload.api_key.strip() if payload.api_key and payload.api_key.strip() else None,
-            api_base_url=payload.api_base_url.strip() if payload.api_base_url and payload.api_base_url.strip() else None,
-        )
+        with provider_store.batch():
+            provider_module.save_config(
+                api_key=payload.api_key.strip() if payload.api_key and payload.api_key.strip() else None,
+                api_base_url=payload.api_base_url.strip() if payload.api_base_url and payload.api_base_url.strip() else None,
+            )
+            status = provider_module.get_status()
+            if not status.get("configured") or not payload.verify:
+                provider_module.set_connection_state("disconnected")
     except ValueError as error:
         raise HTTPException(status_code=400, detail=str(error))
     except Exception as error:
         raise HTTPException(status_code=500, detail=f"Failed to save config: {error}")
 
-    status = provider_module.get_status()
     if not status.get("configured"):
-        provider_module.set_connection_state("disconnected")
         return build_provider_response(provider_module, False, "disconnected", "API key is not configured.")
 
     if not payload.verify:
-        provider_module.set_connection_state("disconnected")
         return build_provider_response(provider_module, True, "disconnected", "Configuration saved.")
 
     try:
-        models = provider_module.list_models()
+        models, _ = model_list_cache.list_models(provider_module, force_refresh=True)
         provider_module.save_models(models, status.get("selected_model", ""))
         return build_provider_response(provider_module, True, "connected", "Connect success.")
     except Exception as error:
@@ -121,16 +127,20 @@ def handle_provider_test(provider_module, payload: GenericTestRequest):
         raise HTTPException(status_code=400, detail="API key is not configured.")
 
     try:
-        text = provider_module.send_test_message(
-            model=payload.model or "",
-            message=payload.message or "",
+        text = call_with_retry(
+            lambda: provider_module.send_test_message(
+                model=payload.model or "",
+                message=payload.message or "",
+            ),
+            f"send_test_message {provider_module.PROVIDER_NAME}",
+            deadline=deadline_after(PROVIDER_CALL_DEADLINE_SECONDS),
         )
-        provider_module.set_connection_state("connected")
-
         saved_models = _normalize_models(status.get("models"))
         selected_model = str(payload.model or status.get("selected_model") or "").strip()
-        if saved_models:
-            provider_module.save_models(saved_models, selected_model)
+        with provider_store.batch():
+            provider_module.set_connection_state("connected")
+            if saved_models:
+                provider_module.save_models(saved_models, selected_model)
 
         return {
             "provider": status.get("provider"),
@@ -143,6 +153,12 @@ def handle_provider_test(provider_module, payload: GenericTestRequest):
         raise HTTPException(status_code=502, detail=f"Test message failed: {error}")
 
 
+@router.get("/concurrency")
+def get_provider_concurrency():
+    """Current adaptive concurrency limit, in-flight calls and queue depth per provider endpoint."""
+    return {"endpoints": provider_limiter.get_stats()}
+
+
 @router.get("/google/status")
 def get_google_status():
     return handle_provider_status(google_provider)
@@ -154,8 +170,8 @@ def connect_google(payload: GenericConnectRequest):
 
 
 @router.get("/google/models")
-def get_google_models():
-    return handle_provider_models(google_provider)
+def get_google_models(refresh: bool = False):
+    return handle_provider_models(google_provider, refresh)
 
 
 @router.post("/google/test")
@@ -174,8 +190,8 @@ def connect_openai_compatible(payload: GenericConnectRequest):
 
 
 @router.get("/openai-compatible/models")
-def get_openai_compatible_models():
-    return handle_provider_models(openai_compatible_provider)
+def get_openai_compatible_models(refresh: bool = False):
+    return handle_provider_models(openai_compatible_provider, refresh)
 
 
 @router.post("/openai-compatible/test")
@@ -194,8 +210,8 @@ def connect_deepseek(payload: GenericConnectRequest):
 
 
 @router.get("/deepseek/models")
-def get_deepseek_models():
-    return handle_provider_models(deepseek_provider)
+def get_deepseek_models(refresh: bool = False):
+    return handle_provider_models(deepseek_provider, refresh)
 
 
 @router.post("/deepseek/test")
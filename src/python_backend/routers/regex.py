@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
+from pydantic import BaseModel, Field
 from services.regex_engine import RegexEngine, RegexPlacement
-from app_context import regex_engine
+from app_context import regex_batch_processor, regex_engine
 
 router = APIRouter()
 
@@ -24,12 +25,37 @@ async def get_regex_scripts(placement: int = None, is_markdown: bool = None):
     
     return {"scripts": regex_engine.scripts}
 
+@router.get("/bundle")
+async def get_regex_bundle(request: Request):
+    """
+    Normalised scripts for the renderer (flags split out, JS replacement syntax,
+    placement index). Send the last ETag as If-None-Match to get a 304 when nothing changed.
+    """
+    regex_engine.reload_scripts()
+    etag, payload = regex_engine.get_bundle()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+@router.get("/stats")
+async def get_regex_stats():
+    """Per-script timing stats, time budgets and scripts skipped for exceeding them."""
+    return regex_engine.get_script_stats()
+
+@router.post("/stats/reset")
+async def reset_regex_stats():
+    """Clear the stats and re-enable scripts that were skipped for exceeding their budget."""
+    regex_engine.reset_script_stats()
+    return {"status": "success"}
+
 @router.post("/reload")
 async def reload_scripts():
     regex_engine.reload_scripts()
     return {"status": "success", "count": len(regex_engine.scripts)}
 
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Optional
 
 @router.post("/import")
 async def import_script(script_data: Union[Dict, List[Any]]):
@@ -42,3 +68,37 @@ async def delete_script(script_name: str):
     if regex_engine.delete_script(script_name):
         return {"status": "success"}
     return {"status": "error", "message": "Delete failed or script not found"}
+
+
+class ProcessBatchRequest(BaseModel):
+    texts: List[str]
+    placement: int = RegexPlacement.AI_OUTPUT
+    is_markdown: bool = False
+    is_prompt: bool = False
+    context: Dict[str, Any] = Field(default_factory=dict)
+    overrides: Optional[Dict[str, bool]] = None
+
+
+@router.post("/process-batch")
+async def process_batch(req: ProcessBatchRequest):
+    """
+    Apply the loaded scripts to many texts (e.g. every chapter of a project).
+    Results are returned in input order; large batches run on a process pool.
+    skipped[i] lists the scripts that did not run on texts[i] (flagged, timed out or failed);
+    complete[i] is true when there are none.
+    """
+    results, mode = await regex_batch_processor.process_batch(
+        req.texts,
+        req.placement,
+        is_markdown=req.is_markdown,
+        is_prompt=req.is_prompt,
+        context=req.context,
+        overrides=req.overrides,
+    )
+    return {
+        "results": [text for text, _ in results],
+        "complete": [not skipped for _, skipped in results],
+        "skipped": [skipped for _, skipped in results],
+        "count": len(results),
+        "mode": mode,
+    }
@@ -0,0 +1,98 @@
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import ValidationError
+
+from app_context import session_store
+from models import SessionCreateRequest, SessionMessageRequest, SessionUpdateRequest, ShortNovelState
+from routers.chat_regex import with_output_regex
+from routers.short_novel import prepare_short_chat
+from routers.streaming import ndjson_stream_response, with_done_meta
+from services.llm_service import ERROR_RESPONSE_PREFIX, generate_response_async, stream_response_events
+from services.session_store import ChatSession
+
+router = APIRouter()
+
+
+def _get_session(session_id: str) -> ChatSession:
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+def _apply_delta(session: ChatSession, state: Optional[Dict[str, Any]], config: Optional[Dict[str, Any]]) -> ShortNovelState:
+    """Merge a state / config delta; an invalid merged state is rejected and not kept."""
+    previous_state, previous_config = session.state, session.config
+    session.apply_delta(state, config)
+    try:
+        return session.state_as(ShortNovelState)
+    except ValidationError as e:
+        session.state, session.config = previous_state, previous_config
+        raise HTTPException(status_code=422, detail=e.errors())
+
+
+def _session_summary(session: ChatSession) -> Dict[str, Any]:
+    return {"session_id": session.session_id, "messages": len(session.history), "updated_at": session.updated_at}
+
+
+async def _append_turn_on_done(events: AsyncIterator[Dict[str, Any]], session: ChatSession,
+                               message: str) -> AsyncIterator[Dict[str, Any]]:
+    async for event in events:
+        if event.get("type") == "done":
+            session.append_turn(message, event.get("text", ""))
+            event = {**event, "session": _session_summary(session)}
+        yield event
+
+
+@router.post("")
+async def create_session(request: SessionCreateRequest):
+    try:
+        ShortNovelState(**request.state)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    session = session_store.create(request.state, request.config, request.history)
+    return _session_summary(session)
+
+
+@router.get("/{session_id}")
+async def get_session(session_id: str):
+    return _get_session(session_id).to_dict()
+
+
+@router.patch("/{session_id}")
+async def update_session(session_id: str, request: SessionUpdateRequest):
+    session = _get_session(session_id)
+    _apply_delta(session, request.state, request.config)
+    return _session_summary(session)
+
+
+@router.delete("/{session_id}")
+async def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "success"}
+
+
+@router.post("/{session_id}/short")
+async def chat_session_short(session_id: str, request: SessionMessageRequest):
+    session = _get_session(session_id)
+    state = _apply_delta(session, request.state, request.config)
+    generate_kwargs, meta = await prepare_short_chat(state, session.history, request.message, session.config)
+    usage: Dict[str, Any] = {}
+    response_text = await generate_response_async(**generate_kwargs, usage=usage)
+    # Failed generations are reported but not recorded, so the client can simply retry
+    if not response_text.startswith(ERROR_RESPONSE_PREFIX):
+        session.append_turn(request.message, response_text)
+    return {"text": response_text, "meta": {**meta, "usage": usage or None}, "session": _session_summary(session)}
+
+
+@router.post("/{session_id}/short/stream")
+async def chat_session_short_stream(session_id: str, request: SessionMessageRequest):
+    session = _get_session(session_id)
+    state = _apply_delta(session, request.state, request.config)
+    generate_kwargs, meta = await prepare_short_chat(state, session.history, request.message, session.config)
+    events = with_output_regex(stream_response_events(**generate_kwargs), session.config)
+    meta.pop("generation_config")
+    events = _append_turn_on_done(with_done_meta(events, meta), session, request.message)
+    return ndjson_stream_response(events)
@@ -1,16 +1,41 @@
 
 import json
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException
-from models import ChatRequestShort, NodeType
-from services.llm_service import generate_response, get_default_model, normalize_provider
+from models import ChatRequestShort, NodeType, ShortNovelState
+from app_context import preset_manager
+from routers.chat_history import compact_history
+from routers.chat_regex import apply_input_regex, with_output_regex
+from routers.streaming import ndjson_stream_response, with_done_meta
+from services.context_builder import fit_context, resolve_context_budget
+from services.gemini_cache import resolve_cache_options
+from services.llm_service import (
+    LayeredPrompt,
+    generate_response_async,
+    resolve_chat_config,
+    resolve_generation_config,
+    resolve_response_cache_option,
+    stream_response_events,
+)
+from services.token_estimator import estimate_tokens
 
 router = APIRouter()
 
-@router.post("/short")
-async def chat_short_novel(request: ChatRequestShort):
-    state = request.state
+
+def build_short_novel_system_instruction(state: ShortNovelState, context: Optional[Dict[str, str]] = None) -> LayeredPrompt:
+    """
+    context: fitted outline / summary / content (see build_short_novel_context); defaults to the full state.
+
+    The prompt is layered for provider prefix caching: the prefix holds what stays fixed
+    for a whole novel (base instruction, mode rules, title and outline), the suffix what
+    changes from turn to turn (focused node, chapter text, the concrete task).
+    """
     node = state.current_node
+    context = context or {}
+    novel_outline = context.get("outline", state.novel_outline)
+    node_summary = context.get("summary", node.summary)
+    node_content = context.get("content", node.content)
     current_node_title = (state.current_node_title or node.title or "").strip()
     novel_title = (state.novel_title or "").strip()
     chapter_title = (state.chapter_title or "").strip()
@@ -20,52 +45,9 @@ async def chat_short_novel(request: ChatRequestShort):
     你的目标是基于已提供的上下文，稳定且有创造性地协助作者完成写作任务。
     """
     
-    # 2. Dynamic Context Assembly
-    # 2. Dynamic Context Assembly
-    node_instruction = ""
-    
-    if node.type == NodeType.ROOT:
-        node_instruction = """
-        当前创作信息：
-        - 创作阶段：小说总纲
-        - 小说名：{novel_title}
-
-        故事总纲：
-        {novel_outline}
-
-        """.format(
-            novel_title=novel_title or current_node_title,
-            novel_outline=state.novel_outline
-        )
-        
-    elif node.type == NodeType.CHAPTER:
-        node_instruction = f"""
-        当前创作信息：
-        - 创作阶段：小说章节
-        - 小说名：{novel_title}
-        - 章节名：{chapter_title or current_node_title}
-
-        故事总纲：
-        {state.novel_outline}
-
-        章节摘要：
-        {node.summary}
-
-        当前章节正文：
-        {node.content}
-        """
-    else:
-        # Fallback for other types if any
-        node_instruction = f"""
-        当前焦点节点类型：{node.type}
-
-        当前节点标题：
-        {current_node_title}
-        """
-
-    # 4. Task Mode Instruction
+    # 2. Mode Instruction (stable for the whole conversation)
     if not state.active_task:
-        task_instruction = """
+        mode_instruction = """
         当前模式：聊天模式。
         你的任务是与用户对话，并基于用户输入和当前上下文提供创作建议。
 
@@ -80,7 +62,7 @@ async def chat_short_novel(request: ChatRequestShort):
         - 不要伪造设定；若上下文缺失，明确指出并给出合理假设方案。
         """
     else:
-        task_instruction = """
+        mode_instruction = """
         当前模式：写作模式。
         你的任务是按激活任务执行写作或润色。
 
@@ -90,10 +72,49 @@ async def chat_short_novel(request: ChatRequestShort):
         - 内容必须与当前节点上下文一致。
         """
 
+    # 3. Novel Context (stable per novel) and Node Context (volatile)
+    novel_instruction = ""
+    if node.type in (NodeType.ROOT, NodeType.CHAPTER):
+        novel_instruction = f"""
+        作品信息：
+        - 小说名：{novel_title or (current_node_title if node.type == NodeType.ROOT else "")}
+
+        故事总纲：
+        {novel_outline}
+        """
+
+    if node.type == NodeType.ROOT:
+        node_instruction = """
+        当前创作信息：
+        - 创作阶段：小说总纲
+        """
+    elif node.type == NodeType.CHAPTER:
+        node_instruction = f"""
+        当前创作信息：
+        - 创作阶段：小说章节
+        - 章节名：{chapter_title or current_node_title}
+
+        章节摘要：
+        {node_summary}
+
+        当前章节正文：
+        {node_content}
+        """
+    else:
+        # Fallback for other types if any
+        node_instruction = f"""
+        当前焦点节点类型：{node.type}
+
+        当前节点标题：
+        {current_node_title}
+        """
+
+    # 4. Task Instruction (volatile)
+    task_instruction = ""
+    if state.active_task:
         task = state.active_task
         if task.type == "SYNOPSIS":
-             task_instruction += """
-
+             task_instruction = """
              【立即执行】
              任务类型：摘要/大纲写作。
              - 为当前节点直接生成可用的摘要或大纲正文。
@@ -101,8 +122,7 @@ async def chat_short_novel(request: ChatRequestShort):
              - 输出目标文本本身，不添加任何解释。
              """
         elif task.type == "CONTENT":
-             task_instruction += """
-
+             task_instruction = """
              【立即执行】
              任务类型：正文写作。
              - 以当前节点摘要为蓝图，直接输出章节正文。
@@ -110,8 +130,7 @@ async def chat_short_novel(request: ChatRequestShort):
              - 输出目标文本本身，不添加任何解释。
              """
         elif task.type == "POLISH_SELECTION":
-             task_instruction += f"""
-
+             task_instruction = f"""
              【立即执行】
              任务类型：选中文本润色。
              - 只输出润色后的最终文本。
@@ -152,8 +171,7 @@ async def chat_short_novel(request: ChatRequestShort):
              counter_suffix = counter_suffix_map.get(target_node_type, "章")
 
              chapter_count_instruction = f"必须拆分为 {chapter_count} 个{target_label}。" if chapter_count else "数量以用户要求为准。"
-             task_instruction += f"""
-
+             task_instruction = f"""
              【立即执行】
              任务类型：当前节点拆分子节点。
              - 基于当前节点内容，输出 {target_label} 拆分结果。
@@ -172,21 +190,94 @@ async def chat_short_novel(request: ChatRequestShort):
              - 每个对象必须包含 title 和 summary 两个字符串字段。
              """
 
-    full_system_instruction = f"{base_instruction}\n\n{node_instruction}\n\n{task_instruction}"
-
-    # 3. Call LLM
-    config = request.config or {}
-    provider_name = normalize_provider(str(config.get("provider", "google")))
-    model_name = str(config.get("model") or get_default_model(provider_name))
-    temperature = float(config.get("temperature", 0.7))
-
-    response_text = generate_response(
-        message=request.message,
-        history=request.history,
-        system_instruction=full_system_instruction,
-        model_name=model_name,
-        temperature=temperature,
-        provider_name=provider_name,
+    return LayeredPrompt(
+        f"{base_instruction}\n\n{mode_instruction}\n\n{novel_instruction}",
+        f"{node_instruction}\n\n{task_instruction}",
     )
-    
-    return {"text": response_text}
+
+
+def build_short_novel_context(
+    state: ShortNovelState,
+    history: List[Any],
+    message: str,
+    model_name: str,
+    config: Optional[Dict[str, Any]] = None,
+) -> Tuple[LayeredPrompt, List[Any], Dict[str, Any]]:
+    """
+    Fit outline / summary / chapter text and history into the model's token budget.
+    Returns (system instruction, kept history, budget report).
+    """
+    node = state.current_node
+    if node.type == NodeType.CHAPTER:
+        texts = {"outline": state.novel_outline or "", "summary": node.summary or "", "content": node.content or ""}
+    elif node.type == NodeType.ROOT:
+        texts = {"outline": state.novel_outline or ""}
+    else:
+        texts = {}
+
+    empty_context = {"outline": "", "summary": "", "content": ""}
+    fixed_tokens = estimate_tokens(build_short_novel_system_instruction(state, empty_context)) + estimate_tokens(message)
+    plan = fit_context(resolve_context_budget(model_name, config), fixed_tokens, texts, history)
+    prompt = build_short_novel_system_instruction(state, plan.texts)
+    prompt = LayeredPrompt(prompt.prefix, prompt.suffix, cache=resolve_cache_options(config))
+    return prompt, plan.history, plan.report
+
+
+def _active_task_type(state: ShortNovelState) -> Optional[str]:
+    return state.active_task.type if state.active_task else None
+
+
+async def prepare_short_chat(
+    state: ShortNovelState,
+    history: List[Any],
+    message: str,
+    config: Optional[Dict[str, Any]],
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Run the request pipeline shared by the short novel endpoints (input regex, history
+    compaction, context budget, generation limits).
+    Returns (keyword arguments for generate_response_async / stream_response_events, meta).
+    """
+    provider_name, model_name, temperature = resolve_chat_config(config)
+    history, message = apply_input_regex(config, history, message)
+    history, history_compaction = await compact_history(config, history, provider_name, model_name)
+    system_instruction, history, context_budget = build_short_novel_context(
+        state, history, message, model_name, config
+    )
+    generation_config = resolve_generation_config(
+        config, preset_manager.get_generation_config(), _active_task_type(state)
+    )
+
+    generate_kwargs = {
+        "message": message,
+        "history": history,
+        "system_instruction": system_instruction,
+        "model_name": model_name,
+        "temperature": temperature,
+        "provider_name": provider_name,
+        "generation_config": generation_config,
+        "use_cache": resolve_response_cache_option(config),
+    }
+    meta = {
+        "generation_config": generation_config,
+        "context_budget": context_budget,
+        "history_compaction": history_compaction,
+    }
+    return generate_kwargs, meta
+
+
+@router.post("/short")
+async def chat_short_novel(request: ChatRequestShort):
+    generate_kwargs, meta = await prepare_short_chat(request.state, request.history, request.message, request.config)
+    usage: Dict[str, Any] = {}
+    response_text = await generate_response_async(**generate_kwargs, usage=usage)
+    return {"text": response_text, "meta": {**meta, "usage": usage or None}}
+
+
+@router.post("/short/stream")
+async def chat_short_novel_stream(request: ChatRequestShort):
+    generate_kwargs, meta = await prepare_short_chat(request.state, request.history, request.message, request.config)
+    events = with_output_regex(stream_response_events(**generate_kwargs), request.config)
+    # generation_config is already part of the stream's own done meta
+    meta.pop("generation_config")
+    return ndjson_stream_response(with_done_meta(events, meta))
@@ -0,0 +1,29 @@
+import json
+from typing import Any, AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def _encode_ndjson(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for event in events:
+        yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def ndjson_stream_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Wrap generation events as a chunked NDJSON response (one JSON object per line)."""
+    return StreamingResponse(
+        _encode_ndjson(events),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+async def with_done_meta(events: AsyncIterator[Dict[str, Any]], meta: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Attach request-level metadata (e.g. the context budget report) to the final done event."""
+    async for event in events:
+        if event.get("type") == "done":
+            event = {**event, "meta": {**event.get("meta", {}), **meta}}
+        yield event
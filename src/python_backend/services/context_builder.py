@@ -0,0 +1,156 @@
+"""
+Token-budgeted prompt context for the writing endpoints.
+
+The flexible part of a prompt (story outline, node summary, chapter text, chat
+history) is fitted into a per-model token budget. Every section is first guaranteed
+a share of the budget, then unused budget is handed out in priority order. Sections
+that still do not fit are cut deterministically: the chapter keeps its tail (the text
+right before the cursor), outline and summary keep their head, and the history keeps
+its most recent turns.
+"""
+from typing import Any, Dict, List, Optional
+
+from services.llm_service import infer_model_type
+from services.token_estimator import estimate_message_tokens, estimate_tokens, truncate_to_tokens
+
+# Prompt budgets (input tokens) per model family; chosen for prefill latency, not the context limit
+DEFAULT_CONTEXT_BUDGETS = {
+    "gemini": 32000,
+    "gpt": 16000,
+    "deepseek": 16000,
+}
+DEFAULT_CONTEXT_BUDGET = 12000
+MIN_CONTEXT_BUDGET = 1024
+
+# Guaranteed share of the flexible budget per section
+SECTION_SHARES = {
+    "summary": 0.15,
+    "content": 0.40,
+    "history": 0.30,
+    "outline": 0.15,
+}
+# Order in which budget left over by small sections is redistributed
+SECTION_PRIORITY = ("content", "history", "summary", "outline")
+# Which end of a text section is kept when it has to be cut
+SECTION_KEEP = {
+    "outline": "head",
+    "summary": "head",
+    "content": "tail",
+}
+ELIDED_HEAD_MARKER = "……（前文已省略）\n"
+ELIDED_TAIL_MARKER = "\n……（后文已省略）"
+# A cut is moved to the nearest line break within this fraction of the kept text
+LINE_SNAP_FRACTION = 0.1
+
+
+def resolve_context_budget(model_name: str, config: Optional[Dict[str, Any]] = None) -> int:
+    """Budget from config["context_budget_tokens"], otherwise the default of the model family."""
+    value = (config or {}).get("context_budget_tokens")
+    if value is not None:
+        try:
+            return max(MIN_CONTEXT_BUDGET, int(value))
+        except (TypeError, ValueError):
+            pass
+    return DEFAULT_CONTEXT_BUDGETS.get(infer_model_type(model_name), DEFAULT_CONTEXT_BUDGET)
+
+
+def _snap_to_line(text: str, keep: str) -> str:
+    window = int(len(text) * LINE_SNAP_FRACTION)
+    if keep == "tail":
+        index = text.find("\n", 0, window)
+        return text[index + 1:] if index >= 0 else text
+    index = text.rfind("\n", len(text) - window)
+    return text[:index] if index >= 0 else text
+
+
+def _fit_text(text: str, max_tokens: int, keep: str) -> str:
+    marker = ELIDED_HEAD_MARKER if keep == "tail" else ELIDED_TAIL_MARKER
+    room = max_tokens - estimate_tokens(marker)
+    if room <= 0:
+        return ""
+    kept = _snap_to_line(truncate_to_tokens(text, room, keep), keep)
+    return marker + kept if keep == "tail" else kept + marker
+
+
+def _fit_history(history: List[Any], max_tokens: int) -> List[Any]:
+    kept: List[Any] = []
+    used = 0
+    for message in reversed(history):
+        cost = _message_tokens(message)
+        if used + cost > max_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    # Start the window on a user turn so providers see a well-formed conversation
+    while kept and _message_role(kept[0]) != "user":
+        kept.pop(0)
+    return kept
+
+
+def _message_role(message: Any) -> str:
+    return str((message.get("role") if isinstance(message, dict) else getattr(message, "role", "")) or "")
+
+
+def _message_tokens(message: Any) -> int:
+    parts = message.get("parts") if isinstance(message, dict) else getattr(message, "parts", None)
+    return estimate_message_tokens(parts or [])
+
+
+class ContextPlan:
+    """Fitted sections, the kept history and a per-section budget report."""
+    __slots__ = ('texts', 'history', 'report')
+
+    def __init__(self, texts: Dict[str, str], history: List[Any], report: Dict[str, Any]):
+        self.texts = texts
+        self.history = history
+        self.report = report
+
+
+def fit_context(budget_tokens: int, fixed_tokens: int, texts: Dict[str, str], history: List[Any]) -> ContextPlan:
+    """
+    :param budget_tokens: total prompt budget
+    :param fixed_tokens: tokens that are always sent (instructions, the new message)
+    :param texts: text sections by name (outline / summary / content)
+    :param history: chat history, oldest first
+    """
+    needs = {name: estimate_tokens(text) for name, text in texts.items()}
+    needs["history"] = sum(_message_tokens(message) for message in history)
+    flexible = max(0, budget_tokens - fixed_tokens)
+
+    allocation = {name: min(need, int(flexible * SECTION_SHARES.get(name, 0))) for name, need in needs.items()}
+    leftover = flexible - sum(allocation.values())
+    for name in SECTION_PRIORITY:
+        if name in needs and leftover > 0:
+            extra = min(needs[name] - allocation[name], leftover)
+            allocation[name] += extra
+            leftover -= extra
+
+    fitted: Dict[str, str] = {}
+    sections: Dict[str, Dict[str, Any]] = {}
+    for name, text in texts.items():
+        truncated = allocation[name] < needs[name]
+        fitted[name] = _fit_text(text, allocation[name], SECTION_KEEP.get(name, "head")) if truncated else text
+        sections[name] = {
+            "tokens": estimate_tokens(fitted[name]),
+            "original_tokens": needs[name],
+            "truncated": truncated,
+        }
+
+    # Unchanged histories are passed through as-is (keeps SessionHistory format caches usable)
+    kept_history = _fit_history(history, allocation["history"]) if allocation["history"] < needs["history"] else history
+    sections["history"] = {
+        "tokens": sum(_message_tokens(message) for message in kept_history),
+        "original_tokens": needs["history"],
+        "truncated": len(kept_history) < len(history),
+        "kept_messages": len(kept_history),
+        "dropped_messages": len(history) - len(kept_history),
+    }
+
+    report = {
+        "budget_tokens": budget_tokens,
+        "fixed_tokens": fixed_tokens,
+        "used_tokens": fixed_tokens + sum(section["tokens"] for section in sections.values()),
+        "sections": sections,
+    }
+    return ContextPlan(fitted, kept_history, report)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import marshal
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Bumped when the sidecar layout changes; older sidecars are then ignored.
+SIDECAR_FORMAT = 1
+SIDECAR_SUFFIX = '.marshal'
+
+
+class FileEntry:
+    """Metadata and parsed content of one indexed JSON file."""
+    __slots__ = ('mtime_ns', 'size', 'digest', 'data', 'error', 'loaded')
+
+    def __init__(self, mtime_ns: int, size: int, digest: str, data: Any = None, error: Optional[str] = None,
+                 loaded: bool = True):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.data = data
+        self.error = error
+        # False in lazy indexes until load() parsed the file
+        self.loaded = loaded
+
+
+class JsonFileIndex:
+    """
+    Index of the *.json files in one directory: path -> (mtime, size, hash, parsed data).
+    refresh() stats every file but only reads files whose (mtime, size) changed,
+    and only re-parses them when the content hash changed too.
+
+    With lazy=True, refresh() never reads file contents: entries only carry the file
+    metadata until load() parses them. Parse results can then be kept in marshal
+    sidecars under cache_dir, keyed by (mtime, size), so restarts skip the JSON parse.
+    """
+
+    def __init__(self, directory: str, lazy: bool = False, cache_dir: Optional[str] = None):
+        self.directory = directory
+        self.lazy = lazy
+        self.cache_dir = cache_dir
+        self.entries: Dict[str, FileEntry] = {}
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        found: Dict[str, Tuple[int, int]] = {}
+        try:
+            iterator = os.scandir(self.directory)
+        except FileNotFoundError:
+            return found
+
+        with iterator:
+            for dir_entry in iterator:
+                # Same selection as glob("*.json"): hidden files are skipped.
+                if dir_entry.name.startswith('.') or not dir_entry.name.endswith('.json'):
+                    continue
+                try:
+                    if not dir_entry.is_file():
+                        continue
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                found[os.path.join(self.directory, dir_entry.name)] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def refresh(self) -> Dict[str, List[str]]:
+        """Sync the index with the directory. Returns the added / changed / removed paths."""
+        changes: Dict[str, List[str]] = {'added': [], 'changed': [], 'removed': []}
+        found = self._scan()
+
+        for path in [path for path in self.entries if path not in found]:
+            del self.entries[path]
+            changes['removed'].append(path)
+            self._remove_sidecar(path)
+
+        for path, (mtime_ns, size) in found.items():
+            entry = self.entries.get(path)
+            if entry and entry.mtime_ns == mtime_ns and entry.size == size:
+                continue
+
+            if self.lazy:
+                self.entries[path] = FileEntry(mtime_ns, size, '', loaded=False)
+                changes['changed' if entry else 'added'].append(path)
+                continue
+
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+            except OSError as e:
+                if entry:
+                    del self.entries[path]
+                    changes['removed'].append(path)
+                print(f"[FileIndex] Error reading {path}: {e}")
+                continue
+
+            digest = hashlib.sha1(raw).hexdigest()
+            if entry and entry.digest == digest:
+                entry.mtime_ns, entry.size = mtime_ns, size
+                continue
+
+            try:
+                data, error = json.loads(raw.decode('utf-8')), None
+            except Exception as e:
+                data, error = None, str(e)
+
+            self.entries[path] = FileEntry(mtime_ns, size, digest, data, error)
+            changes['changed' if entry else 'added'].append(path)
+
+        return changes
+
+    def load(self, path: str) -> FileEntry:
+        """Parse an indexed file on first use (lazy indexes); later calls return the cached entry."""
+        entry = self.entries[path]
+        if entry.loaded:
+            return entry
+
+        cached = self._read_sidecar(path, entry)
+        if cached is not None:
+            entry.data, entry.error = cached, None
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                entry.digest = hashlib.sha1(raw).hexdigest()
+                entry.data, entry.error = json.loads(raw.decode('utf-8')), None
+                self._write_sidecar(path, entry)
+            except Exception as e:
+                entry.data, entry.error = None, str(e)
+        entry.loaded = True
+        return entry
+
+    def _sidecar_path(self, path: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, os.path.basename(path) + SIDECAR_SUFFIX)
+
+    def _read_sidecar(self, path: str, entry: FileEntry) -> Any:
+        sidecar = self._sidecar_path(path)
+        if not sidecar:
+            return None
+        try:
+            with open(sidecar, 'rb') as f:
+                header, mtime_ns, size, digest, data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if (header, mtime_ns, size) != (SIDECAR_FORMAT, entry.mtime_ns, entry.size):
+            return None
+        entry.digest = digest
+        return data
+
+    def _write_sidecar(self, path: str, entry: FileEntry):
+        sidecar = self._sidecar_path(path)
+        if not sidecar:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{sidecar}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                marshal.dump((SIDECAR_FORMAT, entry.mtime_ns, entry.size, entry.digest, entry.data), f)
+            os.replace(temp_path, sidecar)
+        except (OSError, ValueError) as e:
+            # The sidecar is only a cache: failing to write it must not fail the load.
+            print(f"[FileIndex] Could not write parse cache for {path}: {e}")
+
+    def _remove_sidecar(self, path: str):
+        sidecar = self._sidecar_path(path)
+        if sidecar:
+            try:
+                os.remove(sidecar)
+            except OSError:
+                pass
+
+    def sorted_paths(self) -> List[str]:
+        return sorted(self.entries)
+
+    def signature(self) -> Tuple[Tuple[str, int, int], ...]:
+        """Cheap fingerprint of the directory listing (used by the polling watcher)."""
+        return tuple(sorted((path, mtime_ns, size) for path, (mtime_ns, size) in self._scan().items()))
@@ -0,0 +1,112 @@
+import os
+import threading
+from typing import Callable, Optional, Tuple
+
+try:
+    # Optional: inotify / FSEvents / ReadDirectoryChangesW backends via watchdog.
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover - depends on the environment
+    FileSystemEventHandler = object
+    Observer = None
+
+
+def _directory_signature(directory: str) -> Tuple[Tuple[str, int, int], ...]:
+    entries = []
+    try:
+        with os.scandir(directory) as iterator:
+            for dir_entry in iterator:
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                entries.append((dir_entry.name, stat.st_mtime_ns, stat.st_size))
+    except FileNotFoundError:
+        pass
+    return tuple(sorted(entries))
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, notify: Callable[[], None]):
+        super().__init__()
+        self._notify = notify
+
+    def on_any_event(self, event):
+        self._notify()
+
+
+class DirectoryWatcher:
+    """
+    Calls on_change() (debounced, from a background thread) when files in a directory change.
+    Uses native file-system events when watchdog is installed, otherwise polls.
+    """
+
+    def __init__(self, directory: str, on_change: Callable[[], None], poll_interval: float = 1.0,
+                 debounce: float = 0.2, use_native: bool = True):
+        self.directory = directory
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.backend = 'native' if use_native and Observer is not None else 'polling'
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+
+    def _fire(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"[FileWatcher] Change handler failed for {self.directory}: {e}")
+
+    def _schedule(self):
+        with self._lock:
+            if self._stop_event.is_set():
+                return
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _poll(self, last: Tuple[Tuple[str, int, int], ...]):
+        while not self._stop_event.wait(self.poll_interval):
+            current = _directory_signature(self.directory)
+            if current != last:
+                last = current
+                self._fire()
+
+    def start(self) -> 'DirectoryWatcher':
+        if self._thread or self._observer:
+            return self
+        self._stop_event.clear()
+        if self.backend == 'native':
+            self._observer = Observer()
+            self._observer.schedule(_ChangeHandler(self._schedule), self.directory, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            # Snapshot before returning so changes made right after start() are seen.
+            self._thread = threading.Thread(
+                target=self._poll,
+                args=(_directory_signature(self.directory),),
+                name=f"watch:{self.directory}",
+                daemon=True,
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+            self._observer = None
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
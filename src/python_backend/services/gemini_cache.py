@@ -0,0 +1,148 @@
+"""
+Explicit Gemini context caching for large, stable prompt prefixes.
+
+Gemini only reuses a prompt prefix across requests through a cached-content
+resource created up front. The stable prefix of a layered prompt (see
+llm_service.LayeredPrompt: base instruction, task mode rules, story outline) is
+stored as such a resource, keyed by a hash of model + prefix text, and reused
+until shortly before it expires. Prefixes below the provider's minimum size are
+never cached, and a failed creation is not retried for a while. Concurrent first
+requests for the same prefix share one creation.
+"""
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from google.genai import errors as genai_errors
+
+from services.single_flight import AsyncSingleFlight
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_TTL_SECONDS = 3600
+# Gemini rejects cached contents below a model-dependent minimum (1024 - 4096 tokens)
+DEFAULT_MIN_TOKENS = 4096
+# A cache is not handed out when it expires within this many seconds
+REFRESH_MARGIN_SECONDS = 60
+# After a failed creation the same prefix is sent uncached for this long
+FAILURE_BACKOFF_SECONDS = 300
+MAX_TRACKED_CACHES = 64
+# Errors of a request using a cached content that mean the cache itself was rejected
+# (deleted / expired early / invalid for the request); rate limits and 5xx are not among them
+CACHE_REJECTION_STATUS_CODES = frozenset({400, 403, 404})
+
+
+def resolve_cache_options(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    Options from config["gemini_context_cache"]: true, or a dict with ttl_seconds / min_tokens.
+    Returns None when explicit caching is not requested.
+    """
+    options = (config or {}).get("gemini_context_cache")
+    if not options:
+        return None
+    options = options if isinstance(options, dict) else {}
+    try:
+        return {
+            "ttl_seconds": max(REFRESH_MARGIN_SECONDS * 2, int(options.get("ttl_seconds", DEFAULT_TTL_SECONDS))),
+            "min_tokens": max(0, int(options.get("min_tokens", DEFAULT_MIN_TOKENS))),
+        }
+    except (TypeError, ValueError):
+        return None
+
+
+def is_cache_rejection(error: BaseException) -> bool:
+    """True when a request failed because its cached content was not usable."""
+    return isinstance(error, genai_errors.ClientError) and error.code in CACHE_REJECTION_STATUS_CODES
+
+
+def prefix_key(model_name: str, prefix: str) -> str:
+    return hashlib.sha1(f"{model_name}\0{prefix}".encode("utf-8")).hexdigest()
+
+
+def _expire_timestamp(cached_content: Any, fallback: float) -> float:
+    expire_time = getattr(cached_content, "expire_time", None)
+    if isinstance(expire_time, datetime):
+        return expire_time.timestamp()
+    return fallback
+
+
+class _CachedPrefix:
+    __slots__ = ('name', 'expires_at')
+
+    def __init__(self, name: str, expires_at: float):
+        self.name = name
+        self.expires_at = expires_at
+
+
+class GeminiContextCache:
+    """Tracks the cached contents created for prompt prefixes (see module docstring)."""
+
+    def __init__(self, max_entries: int = MAX_TRACKED_CACHES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _CachedPrefix]" = OrderedDict()
+        self._failures: Dict[str, float] = {}
+        self._stats = {"hits": 0, "created": 0, "failed": 0, "expired": 0}
+        self._flight = AsyncSingleFlight()
+
+    async def resolve(self, client: Any, model_name: str, prefix: str, ttl_seconds: int) -> Optional[str]:
+        """
+        Name of a live cached content holding `prefix` as system instruction, creating it
+        when needed. Returns None when the prefix has to be sent uncached.
+        """
+        key = prefix_key(model_name, prefix)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at - REFRESH_MARGIN_SECONDS > now:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.name
+            # Let the old resource run out on its own; a request may still be using it
+            del self._entries[key]
+            self._stats["expired"] += 1
+
+        if self._failures.get(key, 0) > now:
+            return None
+
+        return await self._flight.do(key, lambda: self._create(client, model_name, prefix, ttl_seconds, key))
+
+    async def _create(self, client: Any, model_name: str, prefix: str, ttl_seconds: int, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            cached_content = await client.caches.create(
+                model=model_name,
+                config={
+                    "system_instruction": prefix,
+                    "ttl": f"{ttl_seconds}s",
+                    "display_name": f"ainovel-{key[:16]}",
+                },
+            )
+        except Exception as e:
+            self._failures[key] = now + FAILURE_BACKOFF_SECONDS
+            self._stats["failed"] += 1
+            logger.warning("Gemini cached content creation failed model=%s error=%s", model_name, e)
+            return None
+
+        self._failures.pop(key, None)
+        self._entries[key] = _CachedPrefix(cached_content.name, _expire_timestamp(cached_content, now + ttl_seconds))
+        self._stats["created"] += 1
+        while len(self._entries) > self.max_entries:
+            # Untracked caches are simply left to expire server-side
+            self._entries.popitem(last=False)
+        return cached_content.name
+
+    def invalidate(self, model_name: str, prefix: str):
+        self._entries.pop(prefix_key(model_name, prefix), None)
+
+    def clear(self):
+        self._entries.clear()
+        self._failures.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), **self._stats, "single_flight": self._flight.get_stats()}
+
+
+gemini_context_cache = GeminiContextCache()
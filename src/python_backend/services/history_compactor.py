@@ -0,0 +1,234 @@
+"""
+Rolling summarization of long chat histories.
+
+Once a history grows past a token threshold, its older turns are replaced by a
+model-written summary and only the most recent turns are sent verbatim. The
+summarized prefix always ends on a multiple of `step` messages, and every aligned
+prefix is identified by a hash chain:
+
+    hash(L) = sha1(hash(L - step) + messages[L - step:L])
+
+A summary is stored under the hash of the prefix it covers. A later turn only has
+to summarize the messages added since the newest cached prefix, on top of that
+prefix's summary. Summaries are persisted in one JSON file, so the work is done
+once per prefix across restarts as well.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.llm_service import ERROR_RESPONSE_PREFIX, generate_response_async
+from services.token_estimator import estimate_message_tokens
+
+# Histories estimated above this many tokens are compacted
+DEFAULT_THRESHOLD_TOKENS = 6000
+# Number of most recent messages that are always sent verbatim (at least)
+DEFAULT_KEEP_RECENT = 8
+# Summarized prefixes are aligned to this many messages so consecutive turns share them
+DEFAULT_STEP = 8
+# Summaries kept in the persistent cache
+MAX_CACHED_SUMMARIES = 512
+
+# Output cap for one summary
+SUMMARY_MAX_OUTPUT_TOKENS = 1024
+# Retry budget of one summary; the chat turn itself still has to run afterwards
+SUMMARY_DEADLINE_SECONDS = 60
+SUMMARY_SYSTEM_INSTRUCTION = """你是一名小说写作对话的记录员。
+请将提供的对话压缩为简洁的前情提要，供后续对话参考。
+- 保留已确定的设定、人物、情节决定、用户的要求与偏好。
+- 省略寒暄与重复内容，不要添加对话中没有的信息。
+- 若提供了已有摘要，请在其基础上合并新的对话，输出一份完整的新摘要。
+- 只输出摘要正文。"""
+
+SUMMARY_PREFIX = "【前情提要】以下是此前对话的摘要：\n"
+SUMMARY_ACK = "好的，我已了解前情。"
+
+# summarize(previous summary or None, messages to add) -> new summary
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]]
+
+
+def llm_summarizer(provider_name: str, model_name: str) -> Summarizer:
+    """Summarizer backed by the chat's own provider / model."""
+
+    async def _summarize(previous_summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+        lines = []
+        if previous_summary:
+            lines.append(f"已有摘要：\n{previous_summary}\n")
+        lines.append("新的对话：")
+        for message in messages:
+            speaker = "用户" if message["role"] == "user" else "助手"
+            lines.append(f"{speaker}：{message['text']}")
+
+        text = await generate_response_async(
+            message="\n".join(lines),
+            history=[],
+            system_instruction=SUMMARY_SYSTEM_INSTRUCTION,
+            model_name=model_name,
+            temperature=0.2,
+            provider_name=provider_name,
+            generation_config={"max_output_tokens": SUMMARY_MAX_OUTPUT_TOKENS},
+            retry_budget_seconds=SUMMARY_DEADLINE_SECONDS,
+        )
+        if text.startswith(ERROR_RESPONSE_PREFIX):
+            raise RuntimeError(text[len(ERROR_RESPONSE_PREFIX):])
+        return text
+
+    return _summarize
+
+
+def _message_role(message: Any) -> str:
+    return str((message.get("role") if isinstance(message, dict) else getattr(message, "role", "")) or "")
+
+
+def _message_text(message: Any) -> str:
+    parts = message.get("parts") if isinstance(message, dict) else getattr(message, "parts", None)
+    texts = []
+    for part in parts or []:
+        text = part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+        if text:
+            texts.append(text)
+    return "\n".join(texts)
+
+
+def _plain_messages(history: List[Any]) -> List[Dict[str, str]]:
+    return [{"role": _message_role(message), "text": _message_text(message)} for message in history]
+
+
+def _chain(previous: str, chunk: List[Dict[str, str]]) -> str:
+    payload = json.dumps(chunk, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1((previous + payload).encode("utf-8")).hexdigest()
+
+
+class HistoryCompactor:
+    """Replaces old turns with a cached rolling summary (see module docstring)."""
+
+    def __init__(self, cache_path: Optional[str] = None, max_entries: int = MAX_CACHED_SUMMARIES):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes file writes; each write takes its snapshot inside it, so the newest one lands last
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[HistoryCompactor] Ignoring unreadable summary cache {self.cache_path}: {e}")
+            return
+        if isinstance(data, dict):
+            for key, summary in data.items():
+                if isinstance(summary, str):
+                    self._summaries[key] = summary
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        directory = os.path.dirname(self.cache_path) or "."
+        with self._save_lock:
+            with self._lock:
+                snapshot = dict(self._summaries)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False,
+                                                 prefix=".history_summaries.", suffix=".tmp") as tmp_file:
+                    json.dump(snapshot, tmp_file, ensure_ascii=False)
+                os.replace(tmp_file.name, self.cache_path)
+            except OSError as e:
+                print(f"[HistoryCompactor] Could not persist summary cache: {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _remember(self, key: str, summary: str):
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+
+    def put(self, key: str, summary: str):
+        self._remember(key, summary)
+        self._save()
+
+    async def put_async(self, key: str, summary: str):
+        """put for async callers: the file is rewritten on a worker thread, off the event loop."""
+        self._remember(key, summary)
+        await asyncio.get_running_loop().run_in_executor(None, self._save)
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    async def compact(
+        self,
+        history: List[Any],
+        summarize: Summarizer,
+        threshold_tokens: int = DEFAULT_THRESHOLD_TOKENS,
+        keep_recent: int = DEFAULT_KEEP_RECENT,
+        step: int = DEFAULT_STEP,
+    ) -> Tuple[List[Any], Optional[Dict[str, Any]]]:
+        """
+        Returns (history to send, report). The report is None when nothing was compacted.
+        If summarizing fails the history is returned unchanged.
+        """
+        history = history if history is not None else []
+        total_tokens = sum(estimate_message_tokens(_plain_parts(message)) for message in history)
+        boundary = ((len(history) - keep_recent) // step) * step
+        if total_tokens <= threshold_tokens or boundary <= 0:
+            return history, None
+
+        plain = _plain_messages(history[:boundary])
+        chain = [""]
+        for end in range(step, boundary + 1, step):
+            chain.append(_chain(chain[-1], plain[end - step:end]))
+
+        # Newest aligned prefix that is already summarized
+        cached_end, summary = 0, None
+        for index in range(len(chain) - 1, 0, -1):
+            summary = self.get(chain[index])
+            if summary is not None:
+                cached_end = index * step
+                break
+
+        summarized_now = 0
+        if cached_end < boundary:
+            try:
+                summary = (await summarize(summary, plain[cached_end:boundary])).strip()
+            except Exception as e:
+                print(f"[HistoryCompactor] Summarization failed, sending full history: {e}")
+                return history, None
+            if not summary:
+                return history, None
+            await self.put_async(chain[-1], summary)
+            summarized_now = boundary - cached_end
+
+        recent = list(history[boundary:])
+        compacted: List[Any] = [{"role": "user", "parts": [{"text": SUMMARY_PREFIX + summary}]}]
+        if recent and _message_role(recent[0]) == "user":
+            # Keep user / model turns alternating
+            compacted.append({"role": "model", "parts": [{"text": SUMMARY_ACK}]})
+        compacted.extend(recent)
+        return compacted, {
+            "summarized_messages": boundary,
+            "newly_summarized_messages": summarized_now,
+            "cached": summarized_now == 0,
+            "original_tokens": total_tokens,
+            "kept_messages": len(recent),
+        }
+
+
+def _plain_parts(message: Any) -> List[Dict[str, str]]:
+    return [{"text": _message_text(message)}]
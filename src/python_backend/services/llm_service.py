@@ -1,14 +1,28 @@
+import asyncio
 import logging
-from typing import Any, Dict, List
-
-from google import genai
-from openai import OpenAI
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from services.gemini_cache import gemini_context_cache, is_cache_rejection
 from services.providers import (
+    client_pool,
     deepseek_provider,
     google_provider,
     openai_compatible_provider,
 )
+from services.providers.concurrency_limiter import LimiterKey, provider_limiter
+from services.response_cache import response_cache, response_cache_key
+from services.retry_policy import (
+    DEFAULT_RETRY_POLICY,
+    GENERATION_DEADLINE_SECONDS,
+    call_with_retry,
+    call_with_retry_async,
+    deadline_after,
+    next_retry_wait,
+)
+from services.single_flight import AsyncSingleFlight
+from services.token_estimator import estimate_tokens
 
 DEFAULT_MODELS = {
     "google": "gemini-3-flash-preview",
@@ -16,6 +30,10 @@ DEFAULT_MODELS = {
     "deepseek": "deepseek-chat",
 }
 logger = logging.getLogger("uvicorn.error")
+# generate_response(_async) report failures as text starting with this prefix
+ERROR_RESPONSE_PREFIX = "Error generation response: "
+# Coalesces identical concurrent generate_response_async calls
+generation_flight = AsyncSingleFlight()
 
 
 def normalize_provider(provider_name: str) -> str:
@@ -36,6 +54,129 @@ def get_default_model(provider_name: str) -> str:
     return DEFAULT_MODELS.get(normalized, DEFAULT_MODELS["google"])
 
 
+def resolve_chat_config(config: Optional[Dict[str, Any]]) -> Tuple[str, str, float]:
+    """Resolve (provider, model, temperature) from a chat request's config dict."""
+    config = config or {}
+    provider_name = normalize_provider(str(config.get("provider", "google")))
+    model_name = str(config.get("model") or get_default_model(provider_name))
+    temperature = float(config.get("temperature", 0.7))
+    return provider_name, model_name, temperature
+
+
+def resolve_response_cache_option(config: Optional[Dict[str, Any]]) -> Optional[bool]:
+    """config["response_cache"]: true / false forces the response cache on / off; absent means automatic."""
+    value = (config or {}).get("response_cache")
+    return None if value is None else bool(value)
+
+
+# Sampling limits forwarded to the providers (Gemini naming, as produced by PresetManager)
+GENERATION_LIMIT_KEYS = ("max_output_tokens", "stop_sequences", "top_p", "top_k")
+# Request config aliases -> normalised key
+_GENERATION_CONFIG_ALIASES = {
+    "max_tokens": "max_output_tokens",
+    "max_output_tokens": "max_output_tokens",
+    "stop": "stop_sequences",
+    "stop_sequences": "stop_sequences",
+    "top_p": "top_p",
+    "top_k": "top_k",
+}
+# Per-task output caps: short tasks never need the preset's full output budget
+TASK_MAX_OUTPUT_TOKENS = {
+    "POLISH_SELECTION": 2048,
+    "SPLIT_CHAPTERS": 4096,
+    "SPLIT_CHILDREN": 4096,
+}
+# OpenAI-style APIs accept at most 4 stop sequences
+OPENAI_MAX_STOP_SEQUENCES = 4
+# Output token ceilings (longest matching model name prefix wins, then the provider's);
+# larger max_output_tokens values are rejected by the provider with a 400
+MODEL_MAX_OUTPUT_TOKENS = {
+    "deepseek-chat": 8192,
+    "deepseek-reasoner": 65536,
+    "gpt-4o": 16384,
+    "gpt-4o-mini": 16384,
+    "gpt-4.1": 32768,
+    "gpt-4-turbo": 4096,
+    "gpt-3.5-turbo": 4096,
+    "gemini-1.5": 8192,
+    "gemini-2.0": 8192,
+    "gemini-2.5": 65536,
+    "gemini-3": 65536,
+}
+PROVIDER_MAX_OUTPUT_TOKENS = {
+    "deepseek": 8192,
+}
+
+
+def _normalize_generation_value(key: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if key == "stop_sequences":
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            return None
+        return [str(item) for item in value if isinstance(item, str) and item] or None
+    if key in {"max_output_tokens", "top_k"}:
+        value = int(value)
+        return value if value > 0 else None
+    return float(value)
+
+
+def resolve_generation_config(
+    config: Optional[Dict[str, Any]],
+    preset_config: Optional[Dict[str, Any]] = None,
+    task_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Merge the sampling limits sent to the provider.
+    Priority: request config > per-task cap > active preset. Temperature is resolved by resolve_chat_config.
+    """
+    merged: Dict[str, Any] = {}
+    for key in GENERATION_LIMIT_KEYS:
+        if (preset_config or {}).get(key) is not None:
+            merged[key] = _normalize_generation_value(key, preset_config[key])
+
+    task_cap = TASK_MAX_OUTPUT_TOKENS.get(str(task_type or "").upper())
+    if task_cap:
+        current = merged.get("max_output_tokens")
+        merged["max_output_tokens"] = min(current, task_cap) if current else task_cap
+
+    for alias, key in _GENERATION_CONFIG_ALIASES.items():
+        if alias in (config or {}):
+            try:
+                merged[key] = _normalize_generation_value(key, config[alias])
+            except (TypeError, ValueError):
+                continue
+    return {key: value for key, value in merged.items() if value is not None}
+
+
+def max_output_tokens_ceiling(provider_name: str, model_name: str) -> Optional[int]:
+    normalized = (model_name or "").strip().lower()
+    matches = [prefix for prefix in MODEL_MAX_OUTPUT_TOKENS if normalized.startswith(prefix)]
+    if matches:
+        return MODEL_MAX_OUTPUT_TOKENS[max(matches, key=len)]
+    return PROVIDER_MAX_OUTPUT_TOKENS.get(normalize_provider(provider_name))
+
+
+def clamp_generation_config(
+    provider_name: str, model_name: str, generation_config: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Caps max_output_tokens at the model's ceiling (see MODEL_MAX_OUTPUT_TOKENS); unknown models are left alone."""
+    requested = (generation_config or {}).get("max_output_tokens")
+    ceiling = max_output_tokens_ceiling(provider_name, model_name)
+    if not requested or not ceiling or requested <= ceiling:
+        return generation_config
+    logger.warning(
+        "max_output_tokens=%d exceeds the limit of provider=%s model=%s, clamping to %d",
+        requested,
+        normalize_provider(provider_name),
+        model_name,
+        ceiling,
+    )
+    return {**generation_config, "max_output_tokens": ceiling}
+
+
 def infer_model_type(model_name: str) -> str:
     normalized = (model_name or "").strip().lower()
     if not normalized:
@@ -51,6 +192,56 @@ def infer_model_type(model_name: str) -> str:
     return normalized.split("-", 1)[0]
 
 
+class LayeredPrompt(str):
+    """
+    System instruction split into a stable prefix and a volatile suffix.
+    Provider prompt caches (DeepSeek / OpenAI automatic prefix caching, Gemini cached
+    contents) only reuse identical leading tokens, so providers send the prefix as the
+    system instruction and move the suffix into the final user turn, after the history.
+    As a plain string it reads prefix + suffix, which is what budgets and logs see.
+
+    cache: Gemini explicit caching options for the prefix (see gemini_cache.resolve_cache_options)
+    """
+
+    def __new__(cls, prefix: str, suffix: str = "", cache: Optional[Dict[str, int]] = None):
+        prompt = super().__new__(cls, f"{prefix}\n\n{suffix}" if suffix else prefix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        prompt.cache = cache
+        return prompt
+
+
+def _split_prompt(system_instruction: str, message: str) -> Tuple[str, str]:
+    """(system instruction, final user message) as sent to the provider."""
+    if isinstance(system_instruction, LayeredPrompt) and system_instruction.suffix:
+        return system_instruction.prefix, f"{system_instruction.suffix}\n\n{message}"
+    return str(system_instruction), message
+
+
+def _int_or_zero(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def _usage_from_openai(raw_usage: Any) -> Dict[str, int]:
+    """Token usage of an OpenAI-style response; DeepSeek reports cache hits as prompt_cache_hit_tokens."""
+    cached = getattr(raw_usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        cached = getattr(getattr(raw_usage, "prompt_tokens_details", None), "cached_tokens", None)
+    return {
+        "prompt_tokens": _int_or_zero(getattr(raw_usage, "prompt_tokens", None)),
+        "completion_tokens": _int_or_zero(getattr(raw_usage, "completion_tokens", None)),
+        "cached_tokens": _int_or_zero(cached),
+    }
+
+
+def _usage_from_google(usage_metadata: Any) -> Dict[str, int]:
+    return {
+        "prompt_tokens": _int_or_zero(getattr(usage_metadata, "prompt_token_count", None)),
+        "completion_tokens": _int_or_zero(getattr(usage_metadata, "candidates_token_count", None)),
+        "cached_tokens": _int_or_zero(getattr(usage_metadata, "cached_content_token_count", None)),
+    }
+
+
 def _extract_role(item: Any) -> str:
     if isinstance(item, dict):
         return str(item.get("role") or "")
@@ -71,7 +262,34 @@ def _extract_text(part: Any) -> str:
     return str(getattr(part, "text", "") or "")
 
 
+class SessionHistory(list):
+    """
+    Chat history kept server-side across turns (see services/session_store).
+    Provider formats are converted once per message and extended as turns are appended.
+    """
+
+    def __init__(self, items: Any = ()):
+        super().__init__(items)
+        # kind -> (number of source messages converted, converted messages)
+        self._formatted: Dict[str, Tuple[int, List[Any]]] = {}
+
+    def formatted(self, kind: str, formatter: Any) -> List[Any]:
+        count, converted = self._formatted.get(kind, (0, []))
+        if count > len(self):
+            count, converted = 0, []
+        if count < len(self):
+            converted = converted + formatter(self[count:])
+            self._formatted[kind] = (len(self), converted)
+        return list(converted)
+
+
 def _format_history_for_google(history: List[Any]) -> List[Dict[str, Any]]:
+    if isinstance(history, SessionHistory):
+        return history.formatted("google", _convert_history_for_google)
+    return _convert_history_for_google(history)
+
+
+def _convert_history_for_google(history: List[Any]) -> List[Dict[str, Any]]:
     chat_history: List[Dict[str, Any]] = []
 
     for item in history:
@@ -88,6 +306,12 @@ def _format_history_for_google(history: List[Any]) -> List[Dict[str, Any]]:
 
 
 def _format_history_for_openai(history: List[Any]) -> List[Dict[str, str]]:
+    if isinstance(history, SessionHistory):
+        return history.formatted("openai", _convert_history_for_openai)
+    return _convert_history_for_openai(history)
+
+
+def _convert_history_for_openai(history: List[Any]) -> List[Dict[str, str]]:
     messages: List[Dict[str, str]] = []
     for item in history:
         source_role = _extract_role(item).strip().lower()
@@ -127,16 +351,53 @@ def _extract_openai_content(raw_content: Any) -> str:
     return "\n".join(text_chunks).strip()
 
 
+def _resolve_google_api_key() -> str:
+    api_key = google_provider.get_current_api_key()
+    if not api_key:
+        raise ValueError("API key is not configured for provider: google")
+    return api_key
+
+
+def _build_google_chat_config(
+    system_instruction: str,
+    temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
+    cached_content: Optional[str] = None,
+) -> Dict[str, Any]:
+    chat_config: Dict[str, Any] = {"temperature": temperature}
+    if cached_content:
+        # The system instruction lives in the cached content and must not be repeated
+        chat_config["cached_content"] = cached_content
+    else:
+        chat_config["system_instruction"] = system_instruction
+    for key in GENERATION_LIMIT_KEYS:
+        if (generation_config or {}).get(key) is not None:
+            chat_config[key] = generation_config[key]
+    return chat_config
+
+
+def _build_openai_sampling_kwargs(generation_config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """OpenAI-style equivalents of the limits; top_k has no counterpart in the chat completions API."""
+    generation_config = generation_config or {}
+    kwargs: Dict[str, Any] = {}
+    if generation_config.get("max_output_tokens"):
+        kwargs["max_tokens"] = generation_config["max_output_tokens"]
+    if generation_config.get("top_p") is not None:
+        kwargs["top_p"] = generation_config["top_p"]
+    if generation_config.get("stop_sequences"):
+        kwargs["stop"] = generation_config["stop_sequences"][:OPENAI_MAX_STOP_SEQUENCES]
+    return kwargs
+
+
 def _generate_google_response(
     message: str,
     history: List[Any],
     system_instruction: str,
     model_name: str,
     temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
 ) -> str:
-    api_key = google_provider.get_current_api_key()
-    if not api_key:
-        raise ValueError("API key is not configured for provider: google")
+    api_key = _resolve_google_api_key()
 
     logger.info(
         "LLM request transport=google-genai provider=%s model=%s model_type=%s",
@@ -145,27 +406,83 @@ def _generate_google_response(
         infer_model_type(model_name),
     )
 
-    client = genai.Client(api_key=api_key)
+    system_instruction, message = _split_prompt(system_instruction, message)
+    client = client_pool.get_google_client(api_key)
     chat = client.chats.create(
         model=model_name,
-        config={
-            "system_instruction": system_instruction,
-            "temperature": temperature,
-        },
+        config=_build_google_chat_config(system_instruction, temperature, generation_config),
         history=_format_history_for_google(history),
     )
     response = chat.send_message(message)
     return (response.text or "").strip()
 
 
-def _generate_openai_style_response(
-    provider_name: str,
+async def _resolve_gemini_cached_content(client: Any, model_name: str, system_instruction: str) -> Optional[str]:
+    """Cached content for the prompt's stable prefix when explicit caching was requested and pays off."""
+    if not isinstance(system_instruction, LayeredPrompt) or not system_instruction.cache:
+        return None
+    if estimate_tokens(system_instruction.prefix) < system_instruction.cache["min_tokens"]:
+        return None
+    return await gemini_context_cache.resolve(
+        client, model_name, system_instruction.prefix, system_instruction.cache["ttl_seconds"]
+    )
+
+
+def _record_usage(usage: Optional[Dict[str, Any]], values: Dict[str, int], cached_content: Optional[str] = None):
+    if usage is None:
+        return
+    usage.update(values)
+    if cached_content:
+        usage["cached_content"] = cached_content
+
+
+async def _generate_google_response_async(
     message: str,
     history: List[Any],
     system_instruction: str,
     model_name: str,
     temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, Any]] = None,
 ) -> str:
+    api_key = _resolve_google_api_key()
+
+    logger.info(
+        "LLM request transport=google-genai-aio provider=%s model=%s model_type=%s",
+        "google",
+        model_name,
+        infer_model_type(model_name),
+    )
+
+    client = client_pool.get_async_google_client(api_key)
+    cached_content = await _resolve_gemini_cached_content(client, model_name, system_instruction)
+    prompt, message = _split_prompt(system_instruction, message)
+
+    async def _send(cached: Optional[str]) -> Any:
+        chat = client.chats.create(
+            model=model_name,
+            config=_build_google_chat_config(prompt, temperature, generation_config, cached),
+            history=_format_history_for_google(history),
+        )
+        return await chat.send_message(message)
+
+    try:
+        response = await _send(cached_content)
+    except Exception as e:
+        if not cached_content or not is_cache_rejection(e):
+            # Transient errors are left to the retry policy, with the cache kept
+            raise
+        # The cached content may have been deleted or expired early; retry with the plain prefix
+        logger.warning("Gemini cached content %s rejected, retrying uncached: %s", cached_content, e)
+        gemini_context_cache.invalidate(model_name, system_instruction.prefix)
+        cached_content = None
+        response = await _send(None)
+
+    _record_usage(usage, _usage_from_google(getattr(response, "usage_metadata", None)), cached_content)
+    return (response.text or "").strip()
+
+
+def _resolve_openai_style_credentials(provider_name: str) -> Tuple[str, str, str]:
     normalized_provider = normalize_provider(provider_name)
     if normalized_provider == "deepseek":
         api_key = deepseek_provider.get_current_api_key()
@@ -177,6 +494,51 @@ def _generate_openai_style_response(
     if not api_key:
         raise ValueError(f"API key is not configured for provider: {normalized_provider}")
 
+    return normalized_provider, api_key, base_url
+
+
+def _limiter_key(normalized_provider: str) -> LimiterKey:
+    """Concurrency limits (see concurrency_limiter) apply per provider endpoint."""
+    if normalized_provider == "deepseek":
+        return normalized_provider, deepseek_provider.get_current_base_url()
+    if normalized_provider == "openai-compatible":
+        return normalized_provider, openai_compatible_provider.get_current_base_url()
+    return normalized_provider, os.environ.get("GOOGLE_GEMINI_BASE_URL", "")
+
+
+def _build_openai_messages(message: str, history: List[Any], system_instruction: str) -> List[Dict[str, str]]:
+    # Stable system prefix first, then the history, volatile context last (see LayeredPrompt)
+    system_instruction, message = _split_prompt(system_instruction, message)
+    messages = [{"role": "system", "content": system_instruction}]
+    messages.extend(_format_history_for_openai(history))
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def _extract_completion_text(completion: Any) -> str:
+    choices = list(getattr(completion, "choices", []) or [])
+    if not choices:
+        return ""
+
+    first_choice = choices[0]
+    message_obj = getattr(first_choice, "message", None)
+    if not message_obj:
+        return ""
+
+    return _extract_openai_content(getattr(message_obj, "content", ""))
+
+
+def _generate_openai_style_response(
+    provider_name: str,
+    message: str,
+    history: List[Any],
+    system_instruction: str,
+    model_name: str,
+    temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
+) -> str:
+    normalized_provider, api_key, base_url = _resolve_openai_style_credentials(provider_name)
+
     logger.info(
         "LLM request transport=openai-compatible provider=%s model=%s model_type=%s base_url=%s",
         normalized_provider,
@@ -185,27 +547,175 @@ def _generate_openai_style_response(
         base_url,
     )
 
-    messages = [{"role": "system", "content": system_instruction}]
-    messages.extend(_format_history_for_openai(history))
-    messages.append({"role": "user", "content": message})
-
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    client = client_pool.get_openai_client(normalized_provider, api_key, base_url)
     completion = client.chat.completions.create(
         model=model_name,
-        messages=messages,
+        messages=_build_openai_messages(message, history, system_instruction),
         temperature=temperature,
         stream=False,
+        **_build_openai_sampling_kwargs(generation_config),
     )
-    choices = list(getattr(completion, "choices", []) or [])
+    return _extract_completion_text(completion)
+
+
+async def _generate_openai_style_response_async(
+    provider_name: str,
+    message: str,
+    history: List[Any],
+    system_instruction: str,
+    model_name: str,
+    temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, Any]] = None,
+) -> str:
+    normalized_provider, api_key, base_url = _resolve_openai_style_credentials(provider_name)
+
+    logger.info(
+        "LLM request transport=openai-compatible-async provider=%s model=%s model_type=%s base_url=%s",
+        normalized_provider,
+        model_name,
+        infer_model_type(model_name),
+        base_url,
+    )
+
+    client = client_pool.get_async_openai_client(normalized_provider, api_key, base_url)
+    completion = await client.chat.completions.create(
+        model=model_name,
+        messages=_build_openai_messages(message, history, system_instruction),
+        temperature=temperature,
+        stream=False,
+        **_build_openai_sampling_kwargs(generation_config),
+    )
+    _record_usage(usage, _usage_from_openai(getattr(completion, "usage", None)))
+    return _extract_completion_text(completion)
+
+
+async def _stream_google_response_async(
+    message: str,
+    history: List[Any],
+    system_instruction: str,
+    model_name: str,
+    temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    api_key = _resolve_google_api_key()
+
+    logger.info(
+        "LLM stream transport=google-genai-aio provider=%s model=%s model_type=%s",
+        "google",
+        model_name,
+        infer_model_type(model_name),
+    )
+
+    client = client_pool.get_async_google_client(api_key)
+    cached_content = await _resolve_gemini_cached_content(client, model_name, system_instruction)
+    prompt, message = _split_prompt(system_instruction, message)
+
+    async def _open_stream(cached: Optional[str]) -> Any:
+        chat = client.chats.create(
+            model=model_name,
+            config=_build_google_chat_config(prompt, temperature, generation_config, cached),
+            history=_format_history_for_google(history),
+        )
+        return await chat.send_message_stream(message)
+
+    try:
+        stream = await _open_stream(cached_content)
+    except Exception as e:
+        if not cached_content or not is_cache_rejection(e):
+            raise
+        logger.warning("Gemini cached content %s rejected, retrying uncached: %s", cached_content, e)
+        gemini_context_cache.invalidate(model_name, system_instruction.prefix)
+        cached_content = None
+        stream = await _open_stream(None)
+
+    async for chunk in stream:
+        if getattr(chunk, "usage_metadata", None) is not None:
+            _record_usage(usage, _usage_from_google(chunk.usage_metadata), cached_content)
+        text = getattr(chunk, "text", None) or ""
+        if text:
+            yield text
+
+
+def _extract_stream_delta(chunk: Any) -> str:
+    choices = list(getattr(chunk, "choices", []) or [])
     if not choices:
         return ""
-
-    first_choice = choices[0]
-    message_obj = getattr(first_choice, "message", None)
-    if not message_obj:
+    delta = getattr(choices[0], "delta", None)
+    if not delta:
         return ""
+    content = getattr(delta, "content", None)
+    return content if isinstance(content, str) else ""
 
-    return _extract_openai_content(getattr(message_obj, "content", ""))
+
+async def _stream_openai_style_response_async(
+    provider_name: str,
+    message: str,
+    history: List[Any],
+    system_instruction: str,
+    model_name: str,
+    temperature: float,
+    generation_config: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    normalized_provider, api_key, base_url = _resolve_openai_style_credentials(provider_name)
+
+    logger.info(
+        "LLM stream transport=openai-compatible-async provider=%s model=%s model_type=%s base_url=%s",
+        normalized_provider,
+        model_name,
+        infer_model_type(model_name),
+        base_url,
+    )
+
+    client = client_pool.get_async_openai_client(normalized_provider, api_key, base_url)
+    stream = await client.chat.completions.create(
+        model=model_name,
+        messages=_build_openai_messages(message, history, system_instruction),
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        **_build_openai_sampling_kwargs(generation_config),
+    )
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            _record_usage(usage, _usage_from_openai(chunk.usage))
+        text = _extract_stream_delta(chunk)
+        if text:
+            yield text
+
+
+def _request_key(
+    provider_name: str,
+    model_name: str,
+    system_instruction: str,
+    history: List[Any],
+    message: str,
+    temperature: float,
+    generation_config: Optional[Dict[str, Any]],
+) -> str:
+    """Content hash identifying a generation request (response cache and single-flight key)."""
+    return response_cache_key({
+        "provider": provider_name,
+        "model": model_name,
+        "system_instruction": str(system_instruction),
+        "history": _format_history_for_openai(history or []),
+        "message": message,
+        "temperature": float(temperature),
+        "generation_config": generation_config or {},
+    })
+
+
+def _response_cache_enabled(temperature: float, use_cache: Optional[bool]) -> bool:
+    """use_cache: True / False force the response cache on / off; None caches deterministic (temperature 0) requests."""
+    if use_cache is not None:
+        return use_cache
+    return float(temperature) == 0
+
+
+def _usage_without_cache_marker(usage: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in usage.items() if key != "response_cache"}
 
 
 def generate_response(
@@ -215,62 +725,326 @@ def generate_response(
     model_name: str = "",
     temperature: float = 0.7,
     provider_name: str = "google",
+    generation_config: Optional[Dict[str, Any]] = None,
 ) -> str:
     try:
         normalized_provider = normalize_provider(provider_name)
         target_model = (model_name or "").strip() or get_default_model(normalized_provider)
+        generation_config = clamp_generation_config(normalized_provider, target_model, generation_config)
 
         logger.info(
-            "LLM request start provider=%s model=%s model_type=%s temperature=%.2f history_count=%d",
+            "LLM request start provider=%s model=%s model_type=%s temperature=%.2f history_count=%d limits=%s",
             normalized_provider,
             target_model,
             infer_model_type(target_model),
             temperature,
             len(history or []),
+            generation_config or {},
+        )
+
+        deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+
+        def _attempt() -> str:
+            if normalized_provider not in {"google", "openai-compatible", "deepseek"}:
+                raise ValueError(f"Unsupported provider: {provider_name}")
+            with provider_limiter.limit(_limiter_key(normalized_provider), deadline):
+                if normalized_provider == "google":
+                    return _generate_google_response(
+                        message=message,
+                        history=history,
+                        system_instruction=system_instruction,
+                        model_name=target_model,
+                        temperature=temperature,
+                        generation_config=generation_config,
+                    )
+                return _generate_openai_style_response(
+                    provider_name=normalized_provider,
+                    message=message,
+                    history=history,
+                    system_instruction=system_instruction,
+                    model_name=target_model,
+                    temperature=temperature,
+                    generation_config=generation_config,
+                )
+
+        response_text = call_with_retry(_attempt, f"generate {normalized_provider}/{target_model}", deadline=deadline)
+        logger.info(
+            "LLM request success provider=%s model=%s model_type=%s output_chars=%d",
+            normalized_provider,
+            target_model,
+            infer_model_type(target_model),
+            len(response_text or ""),
+        )
+        return response_text
+    except Exception as error:
+        logger.exception(
+            "LLM request failed provider=%s model=%s model_type=%s error=%s",
+            normalize_provider(provider_name),
+            model_name,
+            infer_model_type(model_name),
+            error,
         )
+        return f"{ERROR_RESPONSE_PREFIX}{error}"
 
+
+async def generate_response_async(
+    message: str,
+    history: List[Any],
+    system_instruction: str,
+    model_name: str = "",
+    temperature: float = 0.7,
+    provider_name: str = "google",
+    generation_config: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, Any]] = None,
+    use_cache: Optional[bool] = None,
+    retry_budget_seconds: Optional[float] = GENERATION_DEADLINE_SECONDS,
+) -> str:
+    """
+    Non-blocking counterpart of generate_response for use inside async routes.
+    Transient provider failures are retried (see retry_policy) while retry_budget_seconds allows;
+    a running attempt is not cut off by it. Every
+    attempt holds a slot of the provider's adaptive concurrency limit (see concurrency_limiter).
+    usage: optional dict that receives prompt_tokens / completion_tokens / cached_tokens
+    (and response_cache: "hit" / "miss" when the response cache was consulted).
+    use_cache: see _response_cache_enabled.
+    Identical requests that are in flight at the same time share one provider call.
+    """
+    usage = usage if usage is not None else {}
+    try:
+        normalized_provider = normalize_provider(provider_name)
+        target_model = (model_name or "").strip() or get_default_model(normalized_provider)
+        generation_config = clamp_generation_config(normalized_provider, target_model, generation_config)
+
+        request_key = _request_key(
+            normalized_provider, target_model, system_instruction, history, message, temperature, generation_config,
+        )
+        cache_key = request_key if _response_cache_enabled(temperature, use_cache) else None
+        cached = await response_cache.get_async(cache_key) if cache_key else None
+        if cached is not None:
+            logger.info("LLM response cache hit provider=%s model=%s", normalized_provider, target_model)
+            usage.update(cached["usage"])
+            usage["response_cache"] = "hit"
+            return cached["text"]
+
+        logger.info(
+            "LLM request start provider=%s model=%s model_type=%s temperature=%.2f history_count=%d limits=%s async=true",
+            normalized_provider,
+            target_model,
+            infer_model_type(target_model),
+            temperature,
+            len(history or []),
+            generation_config or {},
+        )
+
+        deadline = deadline_after(retry_budget_seconds)
+
+        async def _attempt() -> Tuple[str, Dict[str, Any]]:
+            if normalized_provider not in {"google", "openai-compatible", "deepseek"}:
+                raise ValueError(f"Unsupported provider: {provider_name}")
+            call_usage: Dict[str, Any] = {}
+            async with provider_limiter.limit_async(_limiter_key(normalized_provider), deadline):
+                if normalized_provider == "google":
+                    text = await _generate_google_response_async(
+                        message=message,
+                        history=history,
+                        system_instruction=system_instruction,
+                        model_name=target_model,
+                        temperature=temperature,
+                        generation_config=generation_config,
+                        usage=call_usage,
+                    )
+                else:
+                    text = await _generate_openai_style_response_async(
+                        provider_name=normalized_provider,
+                        message=message,
+                        history=history,
+                        system_instruction=system_instruction,
+                        model_name=target_model,
+                        temperature=temperature,
+                        generation_config=generation_config,
+                        usage=call_usage,
+                    )
+            return text, call_usage
+
+        async def _call_provider() -> Tuple[str, Dict[str, Any]]:
+            return await call_with_retry_async(_attempt, f"generate {normalized_provider}/{target_model}", deadline=deadline)
+
+        response_text, call_usage = await generation_flight.do(request_key, _call_provider)
+        usage.update(call_usage)
+
+        logger.info(
+            "LLM request success provider=%s model=%s model_type=%s output_chars=%d",
+            normalized_provider,
+            target_model,
+            infer_model_type(target_model),
+            len(response_text or ""),
+        )
+        if cache_key:
+            if response_text:
+                await response_cache.put_async(cache_key, response_text, _usage_without_cache_marker(usage))
+            usage["response_cache"] = "miss"
+        return response_text
+    except Exception as error:
+        logger.exception(
+            "LLM request failed provider=%s model=%s model_type=%s error=%s",
+            normalize_provider(provider_name),
+            model_name,
+            infer_model_type(model_name),
+            error,
+        )
+        return f"{ERROR_RESPONSE_PREFIX}{error}"
+
+
+async def stream_response_events(
+    message: str,
+    history: List[Any],
+    system_instruction: str,
+    model_name: str = "",
+    temperature: float = 0.7,
+    provider_name: str = "google",
+    generation_config: Optional[Dict[str, Any]] = None,
+    use_cache: Optional[bool] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a generation as events:
+    {"type": "delta", "text"} per provider chunk, then a final
+    {"type": "done", "text", "metrics"} or {"type": "error", "message", "metrics"}.
+    metrics.ttft_ms is the time until the first non-empty delta arrived; metrics.usage holds the
+    provider's token usage (including prompt cache hits) when it was reported.
+    A response cache hit (see _response_cache_enabled) is replayed as a single delta. Transient
+    failures before the first delta are retried (see retry_policy). The stream holds a slot of the
+    provider's concurrency limit until it ends; its time to first delta is the latency sample.
+    """
+    normalized_provider = normalize_provider(provider_name)
+    target_model = (model_name or "").strip() or get_default_model(normalized_provider)
+    generation_config = clamp_generation_config(normalized_provider, target_model, generation_config)
+    started = time.perf_counter()
+    ttft_ms: Optional[float] = None
+    chunk_count = 0
+    collected: List[str] = []
+    usage: Dict[str, Any] = {}
+
+    def _metrics() -> Dict[str, Any]:
+        return {
+            "provider": normalized_provider,
+            "model": target_model,
+            "ttft_ms": ttft_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "chunks": chunk_count,
+            "output_chars": sum(len(part) for part in collected),
+            "generation_config": dict(generation_config or {}),
+            "usage": dict(usage) or None,
+        }
+
+    logger.info(
+        "LLM stream start provider=%s model=%s model_type=%s temperature=%.2f history_count=%d limits=%s",
+        normalized_provider,
+        target_model,
+        infer_model_type(target_model),
+        temperature,
+        len(history or []),
+        generation_config or {},
+    )
+
+    cache_key = None
+    if _response_cache_enabled(temperature, use_cache):
+        cache_key = _request_key(
+            normalized_provider, target_model, system_instruction, history, message, temperature, generation_config,
+        )
+    cached = await response_cache.get_async(cache_key) if cache_key else None
+    if cached is not None:
+        logger.info("LLM response cache hit provider=%s model=%s stream=true", normalized_provider, target_model)
+        usage.update(cached["usage"])
+        usage["response_cache"] = "hit"
+        ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+        chunk_count = 1
+        collected.append(cached["text"])
+        yield {"type": "delta", "text": cached["text"]}
+        yield {"type": "done", "text": cached["text"], "metrics": _metrics()}
+        return
+
+    def _open_deltas() -> AsyncIterator[str]:
         if normalized_provider == "google":
-            response_text = _generate_google_response(
+            return _stream_google_response_async(
                 message=message,
                 history=history,
                 system_instruction=system_instruction,
                 model_name=target_model,
                 temperature=temperature,
+                generation_config=generation_config,
+                usage=usage,
             )
-            logger.info(
-                "LLM request success provider=%s model=%s model_type=%s output_chars=%d",
-                normalized_provider,
-                target_model,
-                infer_model_type(target_model),
-                len(response_text or ""),
-            )
-            return response_text
-
         if normalized_provider in {"openai-compatible", "deepseek"}:
-            response_text = _generate_openai_style_response(
+            return _stream_openai_style_response_async(
                 provider_name=normalized_provider,
                 message=message,
                 history=history,
                 system_instruction=system_instruction,
                 model_name=target_model,
                 temperature=temperature,
+                generation_config=generation_config,
+                usage=usage,
             )
-            logger.info(
-                "LLM request success provider=%s model=%s model_type=%s output_chars=%d",
+        raise ValueError(f"Unsupported provider: {provider_name}")
+
+    deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with provider_limiter.limit_async(_limiter_key(normalized_provider), deadline) as permit:
+                async for text in _open_deltas():
+                    if ttft_ms is None:
+                        permit.observe_latency()
+                        ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                        logger.info(
+                            "LLM stream first token provider=%s model=%s ttft_ms=%.1f",
+                            normalized_provider,
+                            target_model,
+                            ttft_ms,
+                        )
+                    chunk_count += 1
+                    collected.append(text)
+                    yield {"type": "delta", "text": text}
+            break
+        except Exception as error:
+            # Only a stream that has not produced any text yet can be retried transparently
+            wait = next_retry_wait(DEFAULT_RETRY_POLICY, attempt, error, deadline) if not chunk_count else None
+            if wait is not None:
+                logger.warning(
+                    "LLM stream retry provider=%s model=%s attempt=%d wait_s=%.2f error=%s",
+                    normalized_provider,
+                    target_model,
+                    attempt,
+                    wait,
+                    error,
+                )
+                await asyncio.sleep(wait)
+                continue
+            logger.exception(
+                "LLM stream failed provider=%s model=%s model_type=%s error=%s",
                 normalized_provider,
                 target_model,
                 infer_model_type(target_model),
-                len(response_text or ""),
+                error,
             )
-            return response_text
+            yield {"type": "error", "message": f"{ERROR_RESPONSE_PREFIX}{error}", "metrics": _metrics()}
+            return
 
-        raise ValueError(f"Unsupported provider: {provider_name}")
-    except Exception as error:
-        logger.exception(
-            "LLM request failed provider=%s model=%s model_type=%s error=%s",
-            normalize_provider(provider_name),
-            model_name,
-            infer_model_type(model_name),
-            error,
-        )
-        return f"Error generation response: {error}"
+    text = "".join(collected).strip()
+    if cache_key:
+        if text:
+            await response_cache.put_async(cache_key, text, _usage_without_cache_marker(usage))
+        usage["response_cache"] = "miss"
+
+    metrics = _metrics()
+    logger.info(
+        "LLM stream success provider=%s model=%s ttft_ms=%s total_ms=%.1f chunks=%d output_chars=%d",
+        normalized_provider,
+        target_model,
+        metrics["ttft_ms"],
+        metrics["total_ms"],
+        metrics["chunks"],
+        metrics["output_chars"],
+    )
+    yield {"type": "done", "text": text, "metrics": metrics}
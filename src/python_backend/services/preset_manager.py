@@ -1,7 +1,17 @@
+import hashlib
+import itertools
 import json
 import os
-import glob
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.file_index import JsonFileIndex
+from services.file_watcher import DirectoryWatcher
+from services.prompt_assembler import assemble_system_prompt
+from services.token_estimator import estimate_tokens
+
+# 预设解析结果的缓存目录 (位于预设目录下，以 . 开头不会被当作预设)
+PARSE_CACHE_DIR = ".cache"
 
 class PresetManager:
     """
@@ -10,54 +20,147 @@ class PresetManager:
     """
     def __init__(self, presets_dir: str):
         self.presets_dir = presets_dir
+        # 已解析 (可能被前端修改过) 的预设；其余预设只在首次使用时解析
         self.presets: Dict[str, Any] = {}
         self.current_preset_name: Optional[str] = None
+        # 预设索引：只记录文件元数据 (mtime / size)，内容按需解析，解析结果缓存在 .cache 下
+        self._file_index = JsonFileIndex(presets_dir, lazy=True, cache_dir=os.path.join(presets_dir, PARSE_CACHE_DIR))
+        self._preset_paths: Dict[str, str] = {}
+        # 每个预设的修订号：文件重新解析或内存中修改时递增 (全局计数，不会复用)
+        self._revisions: Dict[str, int] = {}
+        self._revision_counter = itertools.count(1)
+        # preset_name -> ((revision, active_prompts_map 哈希), 派生结果)
+        self._derived: Dict[str, Tuple[Tuple[int, str], Dict[str, Any]]] = {}
+        self._reload_lock = threading.RLock()
+        self._loaded = False
+        self._watcher: Optional[DirectoryWatcher] = None
         self.reload_presets()
 
-    def reload_presets(self):
-        """扫描目录加载所有预设"""
-        self.presets = {}
-        if not os.path.exists(self.presets_dir):
-            os.makedirs(self.presets_dir, exist_ok=True)
-            return
-
-        json_files = glob.glob(os.path.join(self.presets_dir, "*.json"))
-        for file_path in json_files:
-            try:
-                # 文件名作为 key (去除 .json)
-                filename = os.path.basename(file_path)
-                preset_name = os.path.splitext(filename)[0]
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.presets[preset_name] = data
-            except Exception as e:
-                print(f"[PresetManager] Error loading {file_path}: {e}")
-        
-        print(f"[PresetManager] Loaded {len(self.presets)} presets: {list(self.presets.keys())}")
+    def reload_presets(self) -> bool:
+        """
+        扫描目录更新预设索引 (不读取文件内容)，返回预设集合是否发生变化
+        未修改的文件沿用已解析的数据 (包括内存中的修改)
+        """
+        with self._reload_lock:
+            if not os.path.exists(self.presets_dir):
+                os.makedirs(self.presets_dir, exist_ok=True)
+
+            changes = self._file_index.refresh()
+            if self._loaded and not any(changes.values()):
+                return False
+
+            stale = set(changes['changed']) | set(changes['removed'])
+            # 文件名作为 key (去除 .json)
+            self.presets = {
+                name: data for name, data in self.presets.items()
+                if self._preset_paths.get(name) not in stale
+            }
+            self._derived = {name: value for name, value in self._derived.items() if name in self.presets}
+            self._preset_paths = {
+                os.path.splitext(os.path.basename(file_path))[0]: file_path
+                for file_path in self._file_index.sorted_paths()
+            }
+            self._loaded = True
+            print(f"[PresetManager] Indexed {len(self._preset_paths)} presets: {list(self._preset_paths.keys())}")
+            return True
+
+    def get_preset(self, preset_name: str) -> Optional[Dict]:
+        """返回预设数据，首次访问时解析文件 (无法解析时返回 None)"""
+        with self._reload_lock:
+            if preset_name in self.presets:
+                return self.presets[preset_name]
+            file_path = self._preset_paths.get(preset_name)
+            if file_path is None:
+                return None
+
+            entry = self._file_index.load(file_path)
+            if entry.error or not isinstance(entry.data, dict):
+                print(f"[PresetManager] Error loading {file_path}: {entry.error or 'not a JSON object'}")
+                return None
+            self.presets[preset_name] = entry.data
+            self._revisions[preset_name] = next(self._revision_counter)
+            return entry.data
+
+    def get_preset_revision(self, preset_name: str = None) -> Optional[int]:
+        """预设当前的修订号 (未解析的预设返回 None)"""
+        return self._revisions.get(preset_name or self.current_preset_name)
+
+    def _derive(self, preset_data: Dict) -> Dict[str, Any]:
+        system_prompt = assemble_system_prompt(preset_data)
+        return {
+            "system_prompt": system_prompt,
+            "system_prompt_tokens": estimate_tokens(system_prompt),
+            "generation_config": self._build_generation_config(preset_data),
+        }
+
+    def _get_derived(self, preset_data: Dict = None) -> Dict[str, Any]:
+        """
+        System prompt / token 估算 / 生成参数
+        当前预设的结果按 (修订号, active_prompts_map 哈希) 缓存；传入其他数据时直接计算
+        """
+        with self._reload_lock:
+            active = self.get_active_preset()
+            if preset_data is None:
+                preset_data = active
+            if not preset_data:
+                return {"system_prompt": "", "system_prompt_tokens": 0, "generation_config": {}}
+            if preset_data is not active:
+                return self._derive(preset_data)
+
+            name = self.current_preset_name
+            prompts_map = json.dumps(preset_data.get('active_prompts_map') or {}, sort_keys=True, default=str)
+            key = (self._revisions.get(name, 0), hashlib.sha1(prompts_map.encode('utf-8')).hexdigest())
+            cached = self._derived.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+            derived = self._derive(preset_data)
+            self._derived[name] = (key, derived)
+            print(f"[PresetManager] Built system prompt for '{name}' (revision {key[0]}): "
+                  f"{len(derived['system_prompt'])} chars, ~{derived['system_prompt_tokens']} tokens")
+            return derived
+
+    def start_watching(self, poll_interval: float = 1.0) -> DirectoryWatcher:
+        """启动后台监听线程，目录变化时自动增量重载"""
+        if not self._watcher:
+            self._watcher = DirectoryWatcher(self.presets_dir, self.reload_presets, poll_interval=poll_interval)
+            self._watcher.start()
+        return self._watcher
+
+    def stop_watching(self):
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
 
     def get_preset_list(self) -> List[str]:
-        return list(self.presets.keys())
+        """预设名列表 (只用索引，不读取文件内容；已知无法解析的文件除外)"""
+        with self._reload_lock:
+            entries = self._file_index.entries
+            return [
+                name for name, file_path in self._preset_paths.items()
+                if not (entries[file_path].loaded and entries[file_path].error)
+            ]
 
     def set_active_preset(self, preset_name: str):
-        if preset_name in self.presets:
+        if self.get_preset(preset_name) is not None:
             self.current_preset_name = preset_name
             return True
         return False
 
     def get_active_preset(self) -> Optional[Dict]:
         if self.current_preset_name:
-            return self.presets.get(self.current_preset_name)
+            return self.get_preset(self.current_preset_name)
         return None
 
     def get_generation_config(self, preset_data: Dict = None) -> Dict:
         """提取适用于 Google Gemini 的生成参数"""
-        if not preset_data:
-            preset_data = self.get_active_preset()
-        
-        if not preset_data:
-            return {}
+        return dict(self._get_derived(preset_data)["generation_config"])
+
+    def get_system_prompt_tokens(self, preset_data: Dict = None) -> int:
+        """System prompt 的 token 估算值"""
+        return self._get_derived(preset_data)["system_prompt_tokens"]
 
+    def _build_generation_config(self, preset_data: Dict) -> Dict:
         # 映射 ST 参数到 Gemini 参数
         # ST keys: temperature, top_p, top_k, openai_max_tokens, stop
         config = {}
@@ -84,52 +187,9 @@ class PresetManager:
     def construct_system_prompt(self, preset_data: Dict = None) -> str:
         """
         从预设中提取并组合 System Instruction
-        根据 prompts 列表动态组装
+        根据 prompts 列表动态组装 (见 prompt_assembler)，当前预设的结果按修订号缓存
         """
-        if not preset_data:
-            preset_data = self.get_active_preset()
-        
-        if not preset_data:
-            return ""
-
-        prompts = preset_data.get('prompts', [])
-        # 如果没有 prompts 列表，回退到 old key? ST 预设通常都有 prompts
-        if not prompts and 'system_instruction' in preset_data:
-             return preset_data['system_instruction']
-
-        system_instructions = []
-
-        for p in prompts:
-            # 1. 检查启用状态
-            # 优先级：Function Arg Override > Prompt internal enabled > Default True
-            is_enabled = p.get('enabled', True)
-            
-            # Check for override
-            if preset_data.get('active_prompts_map') and p.get('identifier'):
-                # identifier 存在且在 map 中有定义，则使用 map 的值
-                if p['identifier'] in preset_data['active_prompts_map']:
-                    is_enabled = preset_data['active_prompts_map'][p['identifier']]
-
-            if is_enabled is False:
-                continue
-
-            # 2. 检查 Role (只处理 system)
-            role = p.get('role', 'system')
-            if role != 'system':
-                continue
-
-            # 3. 排除 Marker (占位符)
-            if p.get('marker', False):
-                continue
-
-            content = p.get('content', '').strip()
-            if content:
-                system_instructions.append(content)
-        
-        result = "\n\n".join(system_instructions)
-        print(f"[PresetManager] Constructed system prompt with {len(system_instructions)} segments. Total length: {len(result)}")
-        return result
-
+        return self._get_derived(preset_data)["system_prompt"]
 
     def get_active_preset_data(self) -> Dict:
         """获取当前激活预设的完整数据"""
@@ -140,8 +200,9 @@ class PresetManager:
         更新当前激活预设的数据 (内存中)
         允许前端修改参数并实时生效
         """
-        if not self.current_preset_name or self.current_preset_name not in self.presets:
+        if not self.current_preset_name or self.get_active_preset() is None:
             return False
+        self._revisions[self.current_preset_name] = next(self._revision_counter)
             
         # 深度合并或更新顶层 Key
         # 简单起见，更新顶层 key
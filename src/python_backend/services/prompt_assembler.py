@@ -5,12 +5,17 @@ def assemble_system_prompt(preset_data: dict) -> str:
     Iterates through the 'prompts' list, filtering for enabled system prompts,
     and concatenates their content.
     """
-    if not preset_data or "prompts" not in preset_data:
+    if not preset_data:
+        return ""
+
+    prompts = preset_data.get("prompts", [])
+    if not prompts:
         # Fallback to simple system_instruction if prompts array is missing
         return preset_data.get("system_instruction", "")
 
+    # Per-identifier switches sent by the frontend override the prompt's own "enabled"
+    active_prompts_map = preset_data.get("active_prompts_map") or {}
     assembled_content = []
-    prompts = preset_data.get("prompts", [])
 
     # Sort by injection_order? 
     # ST Logic: Order matters. Usually strictly following array order is safe if they are pre-sorted in JSON.
@@ -19,7 +24,11 @@ def assemble_system_prompt(preset_data: dict) -> str:
     for prompt in prompts:
         # Check if enabled (default to True if key missing, mimicking ST behavior for core prompts)
         # Note: '27bc73ce...' has "enabled": false. 'main' has no "enabled" key.
+        # Priority: active_prompts_map > prompt "enabled" > default True
         is_enabled = prompt.get("enabled", True)
+        identifier = prompt.get("identifier")
+        if identifier and identifier in active_prompts_map:
+            is_enabled = active_prompts_map[identifier]
         
         # Check role
         role = prompt.get("role", "system")
@@ -27,8 +36,8 @@ def assemble_system_prompt(preset_data: dict) -> str:
         # Check marker (Markers are placeholders, not content)
         is_marker = prompt.get("marker", False)
 
-        if is_enabled and role == "system" and not is_marker:
-            content = prompt.get("content", "").strip()
+        if is_enabled is not False and role == "system" and not is_marker:
+            content = (prompt.get("content") or "").strip()
             if content:
                 assembled_content.append(content)
     
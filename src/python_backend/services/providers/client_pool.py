@@ -0,0 +1,180 @@
+import asyncio
+import importlib.util
+import logging
+from threading import RLock
+from typing import Any, Callable, Dict, Tuple
+from weakref import WeakKeyDictionary
+
+import httpx
+import openai
+from google import genai
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger("uvicorn.error")
+
+# HTTP/2 is only available when the optional `h2` package is installed.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY_SECONDS = 120.0
+
+PoolKey = Tuple[str, str, str]
+
+_LOCK = RLock()
+_SYNC_CLIENTS: Dict[PoolKey, Any] = {}
+# Async transports are bound to the event loop that opened their connections,
+# so async clients are pooled per loop.
+_ASYNC_CLIENTS: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[PoolKey, Any]]" = WeakKeyDictionary()
+
+
+def _pool_key(provider_name: str, api_key: str, base_url: str = "") -> PoolKey:
+    return ((provider_name or "").strip().lower(), api_key or "", (base_url or "").rstrip("/"))
+
+
+def _httpx_client_args() -> Dict[str, Any]:
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    }
+
+
+def _get_or_create_sync(key: PoolKey, factory: Callable[[], Any]) -> Any:
+    with _LOCK:
+        client = _SYNC_CLIENTS.get(key)
+        if client is None:
+            client = factory()
+            _SYNC_CLIENTS[key] = client
+            logger.info("Provider client created provider=%s base_url=%s kind=sync", key[0], key[2])
+        return client
+
+
+def _get_or_create_async(key: PoolKey, factory: Callable[[], Any]) -> Any:
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        loop_clients = _ASYNC_CLIENTS.get(loop)
+        if loop_clients is None:
+            loop_clients = {}
+            _ASYNC_CLIENTS[loop] = loop_clients
+        client = loop_clients.get(key)
+        if client is None:
+            client = factory()
+            loop_clients[key] = client
+            logger.info("Provider client created provider=%s base_url=%s kind=async", key[0], key[2])
+        return client
+
+
+def get_openai_client(provider_name: str, api_key: str, base_url: str) -> OpenAI:
+    key = _pool_key(provider_name, api_key, base_url)
+    return _get_or_create_sync(key, lambda: OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        # Retries are handled by services.retry_policy
+        max_retries=0,
+        http_client=openai.DefaultHttpxClient(**_httpx_client_args()),
+    ))
+
+
+def get_async_openai_client(provider_name: str, api_key: str, base_url: str) -> AsyncOpenAI:
+    key = _pool_key(provider_name, api_key, base_url)
+    return _get_or_create_async(key, lambda: AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        # Retries are handled by services.retry_policy
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(**_httpx_client_args()),
+    ))
+
+
+def _build_google_client(api_key: str, base_url: str) -> genai.Client:
+    http_options: Dict[str, Any] = {
+        "client_args": {"http2": HTTP2_AVAILABLE},
+        "async_client_args": {"http2": HTTP2_AVAILABLE},
+    }
+    if base_url:
+        http_options["base_url"] = base_url
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def get_google_client(api_key: str, base_url: str = "") -> genai.Client:
+    key = _pool_key("google", api_key, base_url)
+    return _get_or_create_sync(key, lambda: _build_google_client(api_key, base_url))
+
+
+def get_async_google_client(api_key: str, base_url: str = "") -> Any:
+    """Return the `client.aio` handle of a genai client pooled for the running loop."""
+    key = _pool_key("google", api_key, base_url)
+    return _get_or_create_async(key, lambda: _build_google_client(api_key, base_url)).aio
+
+
+def _close_sync_client(client: Any) -> None:
+    try:
+        client.close()
+    except Exception as error:
+        logger.warning("Failed to close provider client: %s", error)
+
+
+async def _close_async_client(client: Any) -> None:
+    try:
+        if isinstance(client, genai.Client):
+            await client.aio.aclose()
+        else:
+            await client.close()
+    except Exception as error:
+        logger.warning("Failed to close async provider client: %s", error)
+
+
+def _schedule_async_close(loop: asyncio.AbstractEventLoop, client: Any) -> None:
+    if loop.is_closed() or not loop.is_running():
+        return
+    loop.call_soon_threadsafe(lambda: loop.create_task(_close_async_client(client)))
+
+
+def invalidate(provider_name: str) -> int:
+    """Drop every pooled client of a provider. Returns the number of clients removed."""
+    provider_key = (provider_name or "").strip().lower()
+    removed = 0
+    with _LOCK:
+        for key in [key for key in _SYNC_CLIENTS if key[0] == provider_key]:
+            _close_sync_client(_SYNC_CLIENTS.pop(key))
+            removed += 1
+        for loop, loop_clients in list(_ASYNC_CLIENTS.items()):
+            for key in [key for key in loop_clients if key[0] == provider_key]:
+                _schedule_async_close(loop, loop_clients.pop(key))
+                removed += 1
+
+    if removed:
+        logger.info("Provider clients invalidated provider=%s count=%d", provider_key, removed)
+    return removed
+
+
+async def aclose_all() -> None:
+    """Close every pooled client; async clients of the running loop are awaited."""
+    current_loop = asyncio.get_running_loop()
+    pending = []
+    with _LOCK:
+        for client in _SYNC_CLIENTS.values():
+            _close_sync_client(client)
+        _SYNC_CLIENTS.clear()
+        for loop, loop_clients in list(_ASYNC_CLIENTS.items()):
+            for client in loop_clients.values():
+                if loop is current_loop:
+                    pending.append(client)
+                else:
+                    _schedule_async_close(loop, client)
+            loop_clients.clear()
+
+    for client in pending:
+        await _close_async_client(client)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    with _LOCK:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "sync_clients": len(_SYNC_CLIENTS),
+            "async_clients": sum(len(loop_clients) for loop_clients in _ASYNC_CLIENTS.values()),
+        }
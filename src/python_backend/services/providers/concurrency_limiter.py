@@ -0,0 +1,291 @@
+"""
+Adaptive per-provider concurrency limits for generation calls.
+
+Every (provider, base_url) endpoint gets its own limit on concurrent upstream
+calls, adjusted AIMD-style from what the endpoint reports back:
+
+- additive increase: while calls are waiting for the limit and latency stays near
+  its baseline, each success raises the limit by 1/limit (about +1 per round trip);
+- multiplicative decrease: rate limiting, overload (429 / 503) and timeouts halve
+  the limit, and a latency well above the baseline lowers it by 10%. Decreases are
+  applied at most once per cooldown, so one burst of 429s counts as one signal.
+
+Calls above the limit wait in a FIFO queue. The queue is bounded in length and in
+waiting time (and by the caller's deadline); a call that cannot get a slot fails
+with ConcurrencyLimitExceeded instead of piling up on a saturated provider.
+The limiter is shared by worker threads (blocking calls) and event loops.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from services.retry_policy import is_overload
+
+DEFAULT_INITIAL_LIMIT = 8
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 32
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_MAX_WAIT_SECONDS = 60.0
+# Latency above this multiple of the baseline counts as congestion
+LATENCY_TOLERANCE = 2.0
+LATENCY_ALPHA = 0.3
+# The baseline follows faster latencies quickly and slower ones only slowly
+BASELINE_ALPHA_DOWN = 0.3
+BASELINE_ALPHA_UP = 0.02
+OVERLOAD_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+MIN_COOLDOWN_SECONDS = 1.0
+
+LimiterKey = Tuple[str, str]
+
+
+class ConcurrencyLimitExceeded(RuntimeError):
+    pass
+
+
+class _Waiter:
+    __slots__ = ('event', 'loop', 'future', 'granted')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future: Optional["asyncio.Future[None]"] = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+
+    def wake(self) -> bool:
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(self._resolve)
+        except RuntimeError:
+            # The waiting loop is closed; nobody is left to use the slot
+            return False
+        return True
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Permit:
+    """One slot of an endpoint's limit, held for the duration of one upstream call."""
+
+    __slots__ = ('_endpoint', 'acquired_at', 'latency', '_released')
+
+    def __init__(self, endpoint: "_EndpointLimit"):
+        self._endpoint = endpoint
+        self.acquired_at = time.monotonic()
+        self.latency: Optional[float] = None
+        self._released = False
+
+    def observe_latency(self):
+        """Take the latency sample now (streams: at the first delta) instead of at release."""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.acquired_at
+
+    def release(self, error: Optional[BaseException] = None):
+        if self._released:
+            return
+        self._released = True
+        latency = self.latency if self.latency is not None else time.monotonic() - self.acquired_at
+        self._endpoint.release(error, latency)
+
+
+class _EndpointLimit:
+    def __init__(self, limiter: "ProviderConcurrencyLimiter"):
+        self._limiter = limiter
+        self._lock = threading.Lock()
+        self.limit = float(limiter.initial_limit)
+        self.in_flight = 0
+        self._queue: Deque[_Waiter] = deque()
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self._cooldown_until = 0.0
+        self._stats = {"calls": 0, "queued": 0, "rejected": 0, "overloads": 0, "increases": 0, "decreases": 0}
+
+    def _enter_unlocked(self, new_waiter: Callable[[], _Waiter]) -> Optional[_Waiter]:
+        """Takes a free slot (returns None) or queues a waiter for one."""
+        self._stats["calls"] += 1
+        if not self._queue and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return None
+        if len(self._queue) >= self._limiter.max_queue:
+            self._stats["rejected"] += 1
+            raise ConcurrencyLimitExceeded(
+                f"Too many queued provider calls ({len(self._queue)} waiting, limit {int(self.limit)})"
+            )
+        waiter = new_waiter()
+        self._queue.append(waiter)
+        self._stats["queued"] += 1
+        return waiter
+
+    def _leave_queue_unlocked(self, waiter: _Waiter) -> bool:
+        """True when the waiter was granted a slot in the meantime; otherwise it leaves the queue."""
+        if waiter.granted:
+            return True
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            pass
+        return False
+
+    def _wait_timeout(self, deadline: Optional[float]) -> float:
+        timeout = self._limiter.max_wait_seconds
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        return max(0.0, timeout)
+
+    def _timed_out(self) -> ConcurrencyLimitExceeded:
+        with self._lock:
+            self._stats["rejected"] += 1
+            limit = int(self.limit)
+        return ConcurrencyLimitExceeded(f"No provider slot became free in time (limit {limit})")
+
+    def acquire(self, deadline: Optional[float]) -> Permit:
+        with self._lock:
+            waiter = self._enter_unlocked(_Waiter)
+        if waiter is not None:
+            waiter.event.wait(self._wait_timeout(deadline))
+            with self._lock:
+                granted = self._leave_queue_unlocked(waiter)
+            if not granted:
+                raise self._timed_out()
+        return Permit(self)
+
+    async def acquire_async(self, deadline: Optional[float]) -> Permit:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._enter_unlocked(lambda: _Waiter(loop))
+        if waiter is not None:
+            try:
+                await asyncio.wait({waiter.future}, timeout=self._wait_timeout(deadline))
+            except asyncio.CancelledError:
+                with self._lock:
+                    granted = self._leave_queue_unlocked(waiter)
+                if granted:
+                    # Hand the slot on without treating the cancellation as feedback
+                    self.release(None, None)
+                raise
+            with self._lock:
+                granted = self._leave_queue_unlocked(waiter)
+            if not granted:
+                raise self._timed_out()
+        return Permit(self)
+
+    def release(self, error: Optional[BaseException], latency: Optional[float]):
+        now = time.monotonic()
+        with self._lock:
+            if error is None and latency is not None:
+                self._on_success_unlocked(latency, now)
+            elif error is not None and is_overload(error):
+                self._stats["overloads"] += 1
+                self._decrease_unlocked(OVERLOAD_DECREASE, now)
+            self.in_flight -= 1
+            self._dispatch_unlocked()
+
+    def _on_success_unlocked(self, latency: float, now: float):
+        if self.latency is None:
+            self.latency = self.baseline = latency
+        else:
+            self.latency += LATENCY_ALPHA * (latency - self.latency)
+            alpha = BASELINE_ALPHA_DOWN if latency < self.baseline else BASELINE_ALPHA_UP
+            self.baseline += alpha * (latency - self.baseline)
+
+        if self.latency > LATENCY_TOLERANCE * self.baseline:
+            self._decrease_unlocked(LATENCY_DECREASE, now)
+        elif self._queue and self.limit < self._limiter.max_limit:
+            # Only grow while the limit is what holds calls back
+            self.limit = min(float(self._limiter.max_limit), self.limit + 1 / self.limit)
+            self._stats["increases"] += 1
+
+    def _decrease_unlocked(self, factor: float, now: float):
+        if now < self._cooldown_until:
+            return
+        self.limit = max(float(self._limiter.min_limit), self.limit * factor)
+        self._cooldown_until = now + max(MIN_COOLDOWN_SECONDS, self.latency or 0.0)
+        self._stats["decreases"] += 1
+
+    def _dispatch_unlocked(self):
+        while self._queue and self.in_flight < int(self.limit):
+            waiter = self._queue.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            if not waiter.wake():
+                waiter.granted = False
+                self.in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._queue),
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+                **self._stats,
+            }
+
+
+class ProviderConcurrencyLimiter:
+    """Adaptive concurrency limits keyed by (provider, base_url); see module docstring."""
+
+    def __init__(self, initial_limit: int = DEFAULT_INITIAL_LIMIT, min_limit: int = DEFAULT_MIN_LIMIT,
+                 max_limit: int = DEFAULT_MAX_LIMIT, max_queue: int = DEFAULT_MAX_QUEUE,
+                 max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.initial_limit = min(self.max_limit, max(self.min_limit, initial_limit))
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._endpoints: Dict[LimiterKey, _EndpointLimit] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, key: LimiterKey) -> _EndpointLimit:
+        key = ((key[0] or "").strip().lower(), (key[1] or "").rstrip("/"))
+        with self._lock:
+            endpoint = self._endpoints.get(key)
+            if endpoint is None:
+                endpoint = _EndpointLimit(self)
+                self._endpoints[key] = endpoint
+            return endpoint
+
+    @contextmanager
+    def limit(self, key: LimiterKey, deadline: Optional[float] = None) -> Iterator[Permit]:
+        """Holds a slot of the endpoint around a blocking call."""
+        permit = self._endpoint(key).acquire(deadline)
+        try:
+            yield permit
+        except BaseException as error:
+            permit.release(error)
+            raise
+        permit.release()
+
+    @asynccontextmanager
+    async def limit_async(self, key: LimiterKey, deadline: Optional[float] = None) -> AsyncIterator[Permit]:
+        """Holds a slot of the endpoint around an awaited call or a consumed stream."""
+        permit = await self._endpoint(key).acquire_async(deadline)
+        try:
+            yield permit
+        except BaseException as error:
+            permit.release(error)
+            raise
+        permit.release()
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            endpoints = list(self._endpoints.items())
+        return [
+            {"provider": provider, "base_url": base_url, **endpoint.get_stats()}
+            for (provider, base_url), endpoint in endpoints
+        ]
+
+
+provider_limiter = ProviderConcurrencyLimiter()
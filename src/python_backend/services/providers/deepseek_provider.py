@@ -2,7 +2,7 @@ from typing import Any, Dict, List, Tuple
 
 from openai import OpenAI
 
-from services.providers import provider_store
+from services.providers import client_pool, provider_store
 
 PROVIDER_NAME = "deepseek"
 DEFAULT_BASE_URL = "https://api.deepseek.com"
@@ -23,25 +23,32 @@ def _normalize_base_url(api_base_url: str) -> str:
     return normalized.rstrip("/")
 
 
-def get_current_api_key() -> str:
-    state = provider_store.get_provider_state(PROVIDER_NAME)
+def _api_key_from_state(state: Dict[str, Any]) -> str:
     return str(state.get("api_key") or "").strip()
 
 
-def get_current_base_url() -> str:
-    state = provider_store.get_provider_state(PROVIDER_NAME)
+def _base_url_from_state(state: Dict[str, Any]) -> str:
     saved_url = str(state.get("api_base_url") or "").strip()
     if saved_url:
         return _normalize_base_url(saved_url)
     return DEFAULT_BASE_URL
 
 
+def get_current_api_key() -> str:
+    return _api_key_from_state(provider_store.get_provider_state(PROVIDER_NAME))
+
+
+def get_current_base_url() -> str:
+    return _base_url_from_state(provider_store.get_provider_state(PROVIDER_NAME))
+
+
 def get_saved_models() -> List[str]:
     state = provider_store.get_provider_state(PROVIDER_NAME)
     return provider_store.normalize_models(state.get("models"))
 
 
 def save_config(api_key: str | None = None, api_base_url: str | None = None) -> Dict[str, Any]:
+    current_state = provider_store.get_provider_state(PROVIDER_NAME)
     updates: Dict[str, Any] = {}
     state_changed = False
 
@@ -50,14 +57,14 @@ def save_config(api_key: str | None = None, api_base_url: str | None = None) ->
         if not normalized_key:
             raise ValueError("api_key cannot be empty")
 
-        previous_key = get_current_api_key()
+        previous_key = _api_key_from_state(current_state)
         updates["api_key"] = normalized_key
         if normalized_key != previous_key:
             state_changed = True
 
     if api_base_url is not None:
         normalized_base_url = _normalize_base_url(api_base_url)
-        previous_base_url = get_current_base_url()
+        previous_base_url = _base_url_from_state(current_state)
         updates["api_base_url"] = normalized_base_url
         if normalized_base_url != previous_base_url:
             state_changed = True
@@ -72,6 +79,9 @@ def save_config(api_key: str | None = None, api_base_url: str | None = None) ->
     if updates:
         provider_store.update_provider_state(PROVIDER_NAME, updates)
 
+    if state_changed:
+        client_pool.invalidate(PROVIDER_NAME)
+
     return get_status()
 
 
@@ -85,15 +95,16 @@ def set_connection_state(connection_state: str) -> Dict[str, Any]:
     return get_status()
 
 
-def get_status() -> Dict[str, Any]:
-    state = provider_store.get_provider_state(PROVIDER_NAME)
-    api_key = get_current_api_key()
+def get_status(state: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    if state is None:
+        state = provider_store.get_provider_state(PROVIDER_NAME)
+    api_key = _api_key_from_state(state)
     configured = bool(api_key)
     connection_state = str(state.get("connection_state") or "disconnected")
     if not configured:
         connection_state = "disconnected"
 
-    models = get_saved_models()
+    models = provider_store.normalize_models(state.get("models"))
     selected_model = str(state.get("selected_model") or "").strip()
     if selected_model and selected_model not in models:
         selected_model = ""
@@ -102,7 +113,7 @@ def get_status() -> Dict[str, Any]:
         "provider": PROVIDER_NAME,
         "configured": configured,
         "masked": mask_api_key(api_key),
-        "api_base_url": get_current_base_url(),
+        "api_base_url": _base_url_from_state(state),
         "state": connection_state,
         "models": models,
         "model_count": len(models),
@@ -111,10 +122,11 @@ def get_status() -> Dict[str, Any]:
 
 
 def _get_client() -> OpenAI:
-    api_key = get_current_api_key()
+    state = provider_store.get_provider_state(PROVIDER_NAME)
+    api_key = _api_key_from_state(state)
     if not api_key:
         raise ValueError("API key is not configured.")
-    return OpenAI(api_key=api_key, base_url=get_current_base_url())
+    return client_pool.get_openai_client(PROVIDER_NAME, api_key, _base_url_from_state(state))
 
 
 def _extract_content(raw_content: Any) -> str:
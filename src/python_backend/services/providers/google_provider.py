@@ -1,8 +1,6 @@
 from typing import Any, Dict, Iterable, List, Tuple
 
-from google import genai
-
-from services.providers import provider_store
+from services.providers import client_pool, provider_store
 
 PROVIDER_NAME = "google"
 DEFAULT_TEST_MODEL = "gemini-2.5-flash-lite-latest"
@@ -17,10 +15,12 @@ def mask_api_key(api_key: str) -> str:
     return f"{api_key[:4]}...{api_key[-4:]}"
 
 
+def _api_key_from_state(state: Dict[str, Any]) -> str:
+    return str(state.get("api_key") or "").strip()
+
+
 def get_current_api_key() -> str:
-    state = provider_store.get_provider_state(PROVIDER_NAME)
-    saved_key = str(state.get("api_key") or "").strip()
-    return saved_key
+    return _api_key_from_state(provider_store.get_provider_state(PROVIDER_NAME))
 
 
 def get_saved_models() -> List[str]:
@@ -28,15 +28,16 @@ def get_saved_models() -> List[str]:
     return provider_store.normalize_models(state.get("models"))
 
 
-def get_status() -> Dict[str, Any]:
-    state = provider_store.get_provider_state(PROVIDER_NAME)
-    api_key = get_current_api_key()
+def get_status(state: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    if state is None:
+        state = provider_store.get_provider_state(PROVIDER_NAME)
+    api_key = _api_key_from_state(state)
     configured = bool(api_key)
     connection_state = str(state.get("connection_state") or "disconnected")
     if not configured:
         connection_state = "disconnected"
 
-    models = get_saved_models()
+    models = provider_store.normalize_models(state.get("models"))
     selected_model = str(state.get("selected_model") or "").strip()
     if selected_model and selected_model not in models:
         selected_model = ""
@@ -68,6 +69,8 @@ def save_api_key(api_key: str) -> Dict[str, Any]:
         })
 
     provider_store.update_provider_state(PROVIDER_NAME, updates)
+    if normalized != previous:
+        client_pool.invalidate(PROVIDER_NAME)
     return get_status()
 
 
@@ -139,7 +142,7 @@ def list_models() -> List[str]:
     if not api_key:
         raise ValueError("API key is not configured.")
 
-    client = genai.Client(api_key=api_key)
+    client = client_pool.get_google_client(api_key)
     models = client.models.list()
 
     seen = set()
@@ -186,7 +189,7 @@ def send_test_message(model: str = "", message: str = "") -> str:
     model_name = (model or "").strip() or DEFAULT_TEST_MODEL
     prompt = (message or "").strip() or DEFAULT_TEST_MESSAGE
 
-    client = genai.Client(api_key=api_key)
+    client = client_pool.get_google_client(api_key)
     chat = client.chats.create(model=model_name)
     response = chat.send_message(prompt)
     return (response.text or "").strip()
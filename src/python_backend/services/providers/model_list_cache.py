@@ -0,0 +1,71 @@
+"""
+TTL cache of provider model lists.
+
+Model lists change rarely, but the settings UI asks for them whenever a provider
+panel is opened. Lists are cached per provider and credentials (a hash of API key
+and base URL, so saving new credentials never serves the old list), and concurrent
+fetches for the same credentials share one upstream call, retried on transient
+failures (see retry_policy).
+"""
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from services.retry_policy import PROVIDER_CALL_DEADLINE_SECONDS, call_with_retry, deadline_after
+from services.single_flight import SingleFlight
+
+DEFAULT_TTL_SECONDS = 300
+
+
+def credentials_key(provider_module: Any) -> Tuple[str, str]:
+    """(provider name, credentials fingerprint) of the provider's current settings."""
+    api_key = provider_module.get_current_api_key()
+    get_base_url = getattr(provider_module, "get_current_base_url", None)
+    base_url = get_base_url() if get_base_url else ""
+    fingerprint = hashlib.sha256(f"{api_key}\0{base_url}".encode("utf-8")).hexdigest()[:16]
+    return provider_module.PROVIDER_NAME, fingerprint
+
+
+class ModelListCache:
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._stats = {"hits": 0, "fetches": 0}
+
+    def list_models(self, provider_module: Any, force_refresh: bool = False) -> Tuple[List[str], bool]:
+        """Returns (models, served_from_cache). Errors of the upstream call are raised unchanged."""
+        key = credentials_key(provider_module)
+        if not force_refresh:
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None and cached[0] > time.time():
+                    self._stats["hits"] += 1
+                    return list(cached[1]), True
+
+        def _fetch() -> List[str]:
+            models = call_with_retry(
+                provider_module.list_models,
+                f"list_models {key[0]}",
+                deadline=deadline_after(PROVIDER_CALL_DEADLINE_SECONDS),
+            )
+            with self._lock:
+                self._entries[key] = (time.time() + self.ttl_seconds, list(models))
+                self._stats["fetches"] += 1
+            return models
+
+        return list(self._flight.do(key, _fetch)), False
+
+    def invalidate(self, provider_name: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == provider_name]:
+                del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), **self._stats, "single_flight": self._flight.get_stats()}
+
+
+model_list_cache = ModelListCache()
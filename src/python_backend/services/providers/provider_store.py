@@ -1,15 +1,26 @@
+import copy
 import json
 import os
+import re
 import tempfile
+from contextlib import contextmanager
 from pathlib import Path
 from threading import RLock
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 STORE_PATH_ENV = "LOCALAPP_PROVIDER_STORE_PATH"
 DEFAULT_STORE_PATH = Path(__file__).resolve().parents[4] / "data" / "provider_settings.json"
 CONNECTION_STATES = {"connected", "disconnected", "error"}
 
 _LOCK = RLock()
+# Parsed snapshot of the store file, reused while the file's (mtime, size) is unchanged.
+_CACHE: Dict[str, Any] = {"path": None, "signature": None, "store": None}
+# Working copy of the store while a batch() is open; only touched with _LOCK held.
+_PENDING: Dict[str, Any] = {"store": None, "dirty": False}
+
+TEMP_FILE_SUFFIX = ".tmp"
+# Names produced by tempfile.NamedTemporaryFile() before temp files got a store-specific prefix.
+_LEGACY_TEMP_NAME = re.compile(r"^tmp[a-z0-9_]{8}$")
 
 
 def _normalize_provider_key(provider_name: str) -> str:
@@ -41,17 +52,49 @@ def _sanitize_store_payload(payload: Any) -> Dict[str, Any]:
     return {"providers": sanitized}
 
 
-def _read_store_unlocked() -> Dict[str, Any]:
+def _stat_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _remember_store_unlocked(path: Path, signature: Optional[Tuple[int, int]], store: Dict[str, Any]) -> None:
+    _CACHE["path"] = path
+    _CACHE["signature"] = signature
+    _CACHE["store"] = store
+
+
+def _load_store_unlocked() -> Dict[str, Any]:
+    """Return the cached store snapshot, re-reading the file only if it changed. Do not mutate."""
+    if _PENDING["store"] is not None:
+        return _PENDING["store"]
+
     path = _resolve_store_path()
-    if not path.exists():
-        return {"providers": {}}
+    signature = _stat_signature(path)
+    if _CACHE["store"] is not None and _CACHE["path"] == path and _CACHE["signature"] == signature:
+        return _CACHE["store"]
+
+    if signature is None:
+        store: Dict[str, Any] = {"providers": {}}
+    else:
+        try:
+            store = _sanitize_store_payload(json.loads(path.read_text(encoding="utf-8")))
+        except Exception:
+            store = {"providers": {}}
+
+    _remember_store_unlocked(path, signature, store)
+    return store
+
+
+def _read_store_unlocked() -> Dict[str, Any]:
+    """Return a private, mutable copy of the store."""
+    return copy.deepcopy(_load_store_unlocked())
 
-    try:
-        payload = json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        return {"providers": {}}
 
-    return _sanitize_store_payload(payload)
+def _temp_file_prefix(path: Path) -> str:
+    return f".{path.name}."
 
 
 def _write_store_unlocked(store: Dict[str, Any]) -> None:
@@ -63,12 +106,81 @@ def _write_store_unlocked(store: Dict[str, Any]) -> None:
         mode="w",
         encoding="utf-8",
         dir=str(path.parent),
+        prefix=_temp_file_prefix(path),
+        suffix=TEMP_FILE_SUFFIX,
         delete=False,
     ) as tmp_file:
-        tmp_file.write(content)
         temp_path = Path(tmp_file.name)
+        try:
+            tmp_file.write(content)
+        except Exception:
+            tmp_file.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    try:
+        temp_path.replace(path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+    _remember_store_unlocked(path, _stat_signature(path), copy.deepcopy(store))
+
+
+def _is_stale_temp_file(entry: Path, store_path: Path) -> bool:
+    if not entry.is_file() or entry == store_path:
+        return False
+    if entry.name.startswith(_temp_file_prefix(store_path)) and entry.name.endswith(TEMP_FILE_SUFFIX):
+        return True
+    if not _LEGACY_TEMP_NAME.match(entry.name):
+        return False
+    # Legacy names are generic, so only remove files that hold a provider store payload.
+    try:
+        payload = json.loads(entry.read_text(encoding="utf-8"))
+    except Exception:
+        return False
+    return isinstance(payload, dict) and isinstance(payload.get("providers"), dict)
 
-    temp_path.replace(path)
+
+def cleanup_stale_temp_files() -> int:
+    """Remove temp files left next to the store by interrupted writes. Returns the count removed."""
+    store_path = _resolve_store_path()
+    if not store_path.parent.is_dir():
+        return 0
+
+    removed = 0
+    with _LOCK:
+        for entry in store_path.parent.iterdir():
+            if not _is_stale_temp_file(entry, store_path):
+                continue
+            try:
+                entry.unlink()
+                removed += 1
+            except OSError as error:
+                print(f"[ProviderStore] Failed to remove stale temp file {entry}: {error}")
+    return removed
+
+
+@contextmanager
+def batch() -> Iterator[None]:
+    """
+    Group store updates into one transaction: one read, one serialize and one
+    atomic replace on success; nothing is written if the block raises.
+    Nested batches join the outermost one.
+    """
+    with _LOCK:
+        if _PENDING["store"] is not None:
+            yield
+            return
+
+        _PENDING["store"] = _read_store_unlocked()
+        _PENDING["dirty"] = False
+        try:
+            yield
+            if _PENDING["dirty"]:
+                _write_store_unlocked(_PENDING["store"])
+        finally:
+            _PENDING["store"] = None
+            _PENDING["dirty"] = False
 
 
 def get_provider_state(provider_name: str) -> Dict[str, Any]:
@@ -77,21 +189,28 @@ def get_provider_state(provider_name: str) -> Dict[str, Any]:
         return {}
 
     with _LOCK:
-        store = _read_store_unlocked()
-        providers = store.get("providers") or {}
+        providers = _load_store_unlocked().get("providers") or {}
         current = providers.get(key)
         if isinstance(current, dict):
-            return dict(current)
+            return copy.deepcopy(current)
         return {}
 
 
+def get_all_provider_states() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every provider's state, taken under a single lock acquisition."""
+    with _LOCK:
+        providers = _load_store_unlocked().get("providers") or {}
+        return copy.deepcopy(providers)
+
+
 def update_provider_state(provider_name: str, updates: Dict[str, Any]) -> Dict[str, Any]:
     key = _normalize_provider_key(provider_name)
     if not key:
         raise ValueError("provider_name is required")
 
     with _LOCK:
-        store = _read_store_unlocked()
+        in_batch = _PENDING["store"] is not None
+        store = _PENDING["store"] if in_batch else _read_store_unlocked()
         providers = store.setdefault("providers", {})
 
         current = providers.get(key)
@@ -103,11 +222,23 @@ def update_provider_state(provider_name: str, updates: Dict[str, Any]) -> Dict[s
             if value is None:
                 next_state.pop(field, None)
             else:
-                next_state[field] = value
+                next_state[field] = copy.deepcopy(value)
 
         providers[key] = next_state
-        _write_store_unlocked(store)
-        return dict(next_state)
+        if in_batch:
+            _PENDING["dirty"] = True
+        else:
+            _write_store_unlocked(store)
+        return copy.deepcopy(next_state)
+
+
+def update_provider_states(updates_by_provider: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Apply field updates to several providers with a single store write."""
+    with batch():
+        return {
+            provider_name: update_provider_state(provider_name, updates)
+            for provider_name, updates in updates_by_provider.items()
+        }
 
 
 def normalize_models(models: List[str] | None) -> List[str]:
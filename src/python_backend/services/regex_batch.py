@@ -0,0 +1,139 @@
+import asyncio
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import RLock
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.regex_engine import RegexEngine
+
+# Batches whose total size reaches this many characters are sent to the process pool;
+# smaller ones run on a worker thread (pickling + IPC would cost more than the regex work).
+POOL_THRESHOLD_CHARS = 512 * 1024
+# Chunks handed to one worker task are kept at least this large.
+MIN_CHUNK_CHARS = 64 * 1024
+# Aim for a few chunks per worker so one huge chapter does not leave the others idle.
+CHUNKS_PER_WORKER = 4
+# Per-text call budget of batch processing: manuscripts are large by design, so only the
+# engine's per-script budgets (scaled to the text length) bound the work.
+BATCH_CALL_TIME_BUDGET_MS = math.inf
+
+# Engine of the current pool worker process (set by _init_worker).
+_WORKER_ENGINE: Optional[RegexEngine] = None
+
+
+def _init_worker(scripts_dir: str) -> None:
+    global _WORKER_ENGINE
+    _WORKER_ENGINE = RegexEngine(scripts_dir)
+
+
+def _process_chunk(texts: List[str], options: Dict[str, Any],
+                   flags: Dict[str, str]) -> Tuple[List[Tuple[str, List[str]]], Dict[str, Any], Dict[str, str]]:
+    """
+    Runs in a pool worker: picks up script changes (incremental stat), adopts the main engine's
+    flags, then processes the chunk. Returns the per-text results plus the script stats and flags
+    of this chunk, so the main engine can merge them.
+    """
+    engine = _WORKER_ENGINE
+    engine.reload_scripts()
+    engine.set_flags(flags)
+    engine.drain_script_stats()
+    results = [engine.process_string_report(text, **options) for text in texts]
+    return results, engine.drain_script_stats(), engine.get_flags()
+
+
+def split_chunks(texts: List[str], target_chars: int) -> List[List[int]]:
+    """Group text indices into consecutive chunks of roughly target_chars characters."""
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for index, text in enumerate(texts):
+        current.append(index)
+        size += len(text)
+        if size >= target_chars:
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class RegexBatchProcessor:
+    """
+    Applies RegexEngine.process_string to many texts without blocking the event loop.
+    Large batches are split into chunks and processed on a (lazily started) process pool.
+    """
+
+    def __init__(self, engine: RegexEngine, max_workers: Optional[int] = None,
+                 pool_threshold_chars: int = POOL_THRESHOLD_CHARS):
+        self.engine = engine
+        self.max_workers = max_workers or max(1, min(os.cpu_count() or 1, 8))
+        self.pool_threshold_chars = pool_threshold_chars
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = RLock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: same behaviour on Windows / macOS / Linux and safe with the watcher threads.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.engine.scripts_dir,),
+                )
+            return self._pool
+
+    def _process_local(self, texts: List[str], options: Dict[str, Any]) -> List[Tuple[str, List[str]]]:
+        return [self.engine.process_string_report(text, **options) for text in texts]
+
+    async def process_batch(self, texts: List[str], placement: int, is_markdown: bool = False,
+                            is_prompt: bool = False, context: Dict = None,
+                            overrides: Dict[str, bool] = None,
+                            time_budget_ms: float = BATCH_CALL_TIME_BUDGET_MS) -> Tuple[List[Tuple[str, List[str]]], str]:
+        """
+        Returns (results in input order, mode) where mode is 'inline' or 'process_pool'.
+        Each result is (text, names of the scripts that were skipped for it).
+        """
+        options = {
+            "placement": placement,
+            "is_markdown": is_markdown,
+            "is_prompt": is_prompt,
+            "context": context,
+            "overrides": overrides,
+            "time_budget_ms": time_budget_ms,
+        }
+        loop = asyncio.get_running_loop()
+        total_chars = sum(len(text) for text in texts)
+        if total_chars < self.pool_threshold_chars or self.max_workers < 2:
+            return await loop.run_in_executor(None, self._process_local, texts, options), "inline"
+
+        target_chars = max(MIN_CHUNK_CHARS, total_chars // (self.max_workers * CHUNKS_PER_WORKER))
+        chunks = split_chunks(texts, target_chars)
+        try:
+            pool = self._get_pool()
+            flags = self.engine.get_flags()
+            futures = [
+                loop.run_in_executor(pool, _process_chunk, [texts[index] for index in chunk], options, flags)
+                for chunk in chunks
+            ]
+            chunk_results = await asyncio.gather(*futures)
+        except (BrokenProcessPool, OSError) as e:
+            print(f"[RegexBatch] Process pool unavailable, processing inline: {e}")
+            self.shutdown()
+            return await loop.run_in_executor(None, self._process_local, texts, options), "inline"
+
+        results: List[Tuple[str, List[str]]] = [("", [])] * len(texts)
+        for chunk, (processed, stats, worker_flags) in zip(chunks, chunk_results):
+            self.engine.merge_script_stats(stats, worker_flags)
+            for index, result in zip(chunk, processed):
+                results[index] = result
+        return results, "process_pool"
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,25 @@
+import hashlib
 import json
 import re
 import os
-from typing import List, Dict, Any, Optional, Union
-import glob
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+from services.file_index import JsonFileIndex
+from services.file_watcher import DirectoryWatcher
+from services.regex_merge import MergedLiteralPass, build_execution_plan, literal_alternatives, template_parts
+from services.regex_stream import STREAM_MAX_HOLDBACK, StreamingRegexProcessor
+
+try:
+    # 可选依赖：第三方 regex 模块支持 sub(..., timeout=)，可以真正中断灾难性回溯
+    import regex as _timeout_re
+except ImportError:  # pragma: no cover - depends on the environment
+    _timeout_re = None
+
+HARD_TIMEOUT_AVAILABLE = _timeout_re is not None
+_PATTERN_ERRORS = (re.error, _timeout_re.error) if _timeout_re else (re.error,)
 
 # Enum 模拟 SillyTavern 及其常量
 class RegexPlacement:
@@ -13,6 +30,273 @@ class RegexPlacement:
     WORLD_INFO = 5
     REASONING = 6         # Inner Thoughts
 
+# 聊天历史中各角色消息对应的 placement
+HISTORY_ROLE_PLACEMENTS = {
+    "user": RegexPlacement.USER_INPUT,
+    "model": RegexPlacement.AI_OUTPUT,
+    "assistant": RegexPlacement.AI_OUTPUT,
+}
+
+MACRO_PATTERN = re.compile(r"\{\{([^{}]+)\}\}")
+# 每个带宏脚本缓存的编译变体数量 (按 context 中相关宏的取值区分)
+MACRO_VARIANT_CACHE_SIZE = 32
+# 历史消息处理结果的缓存条数 (按 内容哈希 + 适用脚本集合 区分)
+HISTORY_MEMO_SIZE = 4096
+# 缓存的执行计划数量 (按适用脚本组合区分)
+EXECUTION_PLAN_CACHE_SIZE = 64
+# 单个脚本 / 单次 process_string 调用的执行预算 (毫秒)
+SCRIPT_TIME_BUDGET_MS = 250.0
+CALL_TIME_BUDGET_MS = 2000.0
+# 预算按输入长度放大：每 BUDGET_SCALE_CHARS 个字符一份 (线性脚本处理长文本本来就更慢)
+BUDGET_SCALE_CHARS = 64 * 1024
+# 无法中断执行时，脚本连续这么多次超出预算才会被标记跳过
+OVER_BUDGET_STRIKES = 3
+# 嵌套量词 (a+)+ / (.*a){20} / (\w+\s?)+ 等：常见的指数级回溯形态
+NESTED_QUANTIFIER_PATTERN = re.compile(r"\((?:[^()\\]|\\.)*?[+*}](?:[^()\\]|\\.)*\)(?:[+*]|\{\d+,?\d*\})")
+
+
+def compile_pattern(body: str, flags: int):
+    """编译 pattern；安装了 regex 模块时用它编译，以支持执行超时"""
+    if _timeout_re is not None:
+        return _timeout_re.compile(body, flags)
+    return re.compile(body, flags)
+
+
+def is_backtracking_risky(pattern_body: str) -> bool:
+    """静态检查：pattern 中是否存在嵌套量词"""
+    return bool(NESTED_QUANTIFIER_PATTERN.search(pattern_body))
+
+
+def parse_find_regex(find_regex: str) -> Tuple[str, int]:
+    """
+    解析 ST 的 findRegex: "/pattern/flags" 或纯 pattern 字符串
+    返回 (pattern_body, python_flags)
+    """
+    # JS Regex flags translate:
+    # g -> implicit in re.sub
+    # m -> re.MULTILINE
+    # s -> re.DOTALL
+    # i -> re.IGNORECASE
+    if find_regex.startswith('/') and find_regex.rfind('/') > 0:
+        last_slash = find_regex.rfind('/')
+        flags_str = find_regex[last_slash + 1:]
+        flags = 0
+        if 'i' in flags_str: flags |= re.IGNORECASE
+        if 'm' in flags_str: flags |= re.MULTILINE
+        if 's' in flags_str: flags |= re.DOTALL
+        return find_regex[1:last_slash], flags
+
+    # Default flags if not specified like JS
+    return find_regex, re.MULTILINE
+
+
+def split_js_find_regex(find_regex: str) -> Tuple[str, str]:
+    """"/pattern/flags" -> (pattern, JS flags)；纯 pattern 字符串使用 ST 默认的 "gm" """
+    if find_regex.startswith('/') and find_regex.rfind('/') > 0:
+        last_slash = find_regex.rfind('/')
+        return find_regex[1:last_slash], find_regex[last_slash + 1:]
+    return find_regex, 'gm'
+
+
+def translate_replacement(replace_string: str, group_count: int) -> str:
+    """
+    将 JS 风格的替换串 ($1, $&, $$, $<name>, {{match}}) 转为 Python re 模板
+    反斜杠在 JS 中没有特殊含义，因此需要转义
+    """
+    replace_string = (replace_string or '').replace('{{match}}', '$&')
+    out: List[str] = []
+    i = 0
+    length = len(replace_string)
+    while i < length:
+        ch = replace_string[i]
+        if ch == '\\':
+            out.append('\\\\')
+            i += 1
+            continue
+        if ch != '$' or i + 1 >= length:
+            out.append(ch)
+            i += 1
+            continue
+
+        nxt = replace_string[i + 1]
+        if nxt == '$':
+            out.append('$')
+            i += 2
+        elif nxt == '&':
+            out.append('\\g<0>')
+            i += 2
+        elif nxt == '<' and '>' in replace_string[i + 2:]:
+            end = replace_string.index('>', i + 2)
+            out.append(f"\\g<{replace_string[i + 2:end]}>")
+            i = end + 1
+        elif nxt.isdigit():
+            # JS: 两位组号优先 (若该组存在)，否则取一位；不存在的组保持字面量
+            two_digits = replace_string[i + 1:i + 3]
+            if len(two_digits) == 2 and two_digits.isdigit() and 0 < int(two_digits) <= group_count:
+                out.append(f"\\g<{int(two_digits)}>")
+                i += 3
+            elif 0 < int(nxt) <= group_count:
+                out.append(f"\\g<{int(nxt)}>")
+                i += 2
+            else:
+                out.append('$')
+                i += 1
+        else:
+            out.append('$')
+            i += 1
+    return ''.join(out)
+
+
+def _parse_depth(value: Any) -> Optional[int]:
+    """ST 的 minDepth / maxDepth：null、NaN 或小于 -1 的值表示不限制"""
+    try:
+        depth = int(value)
+    except (TypeError, ValueError):
+        return None
+    return depth if depth >= -1 else None
+
+
+def budget_scale(text: str) -> float:
+    """执行预算的放大倍数：至少 1，之后随输入长度线性增长"""
+    return max(1.0, len(text) / BUDGET_SCALE_CHARS)
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {
+        "calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+        "timeouts": 0, "over_budget": 0, "skipped": 0, "errors": 0, "last_error": None,
+    }
+
+
+def _script_key(compiled: "CompiledScript") -> str:
+    """统计与标记使用的脚本名 (无名脚本用 #ordinal)"""
+    return compiled.name or f"#{compiled.ordinal}"
+
+
+class CompiledScript:
+    """
+    脚本的预编译形式：在 reload_scripts 时构建一次
+    含宏 ({{char}} 等) 的 pattern 按 context 取值缓存编译结果 (LRU)
+    """
+    __slots__ = ('script', 'name', 'ordinal', 'placements', 'disabled', 'markdown_only', 'prompt_only',
+                 'pattern_body', 'flags', 'pattern', 'replace_string', 'replacement', 'macros', 'error',
+                 'min_depth', 'max_depth', 'risky', 'flagged', 'strikes', 'literals', 'literal_ignore_case', 'literal_parts', '_variants', '_variants_lock')
+
+    def __init__(self, script: Dict, ordinal: int = 0):
+        self.script = script
+        self.name = script.get('scriptName')
+        # ordinal = 加载顺序 (文件名排序后的位置)，索引与覆盖掩码都以它为稳定顺序
+        self.ordinal = ordinal
+        raw_placement = script.get('placement', [])
+        if not isinstance(raw_placement, list):
+            # 兼容可能的旧格式
+            raw_placement = [raw_placement]
+        self.placements = tuple(dict.fromkeys(p for p in raw_placement if isinstance(p, (int, str))))
+        self.disabled = bool(script.get('disabled', False))
+        self.markdown_only = bool(script.get('markdownOnly', False))
+        self.prompt_only = bool(script.get('promptOnly', False))
+        self.min_depth = _parse_depth(script.get('minDepth'))
+        self.max_depth = _parse_depth(script.get('maxDepth'))
+        self.replace_string = script.get('replaceString', '') or ''
+        self.pattern_body = ''
+        self.flags = 0
+        self.pattern: Optional[re.Pattern] = None
+        self.replacement = ''
+        self.macros: Tuple[str, ...] = ()
+        self.error: Optional[str] = None
+        self.risky = False
+        # 超出执行预算的脚本会被标记并在之后的调用中跳过 (文件变化重新编译后解除)
+        self.flagged: Optional[str] = None
+        # 连续超出预算 (事后发现) 的次数，见 OVER_BUDGET_STRIKES
+        self.strikes = 0
+        # 纯字面量 (或字面量分支) 脚本：可与相邻脚本合并为一次扫描，见 regex_merge
+        self.literals: Optional[Tuple[str, ...]] = None
+        self.literal_ignore_case = False
+        self.literal_parts: Optional[Tuple[Optional[str], ...]] = None
+        self._variants: "OrderedDict[Tuple, re.Pattern]" = OrderedDict()
+        self._variants_lock = threading.Lock()
+
+        find_regex = script.get('findRegex')
+        if not find_regex or not isinstance(find_regex, str):
+            self.error = 'empty findRegex'
+            return
+
+        self.pattern_body, self.flags = parse_find_regex(find_regex)
+        self.macros = tuple(dict.fromkeys(MACRO_PATTERN.findall(self.pattern_body)))
+        self.risky = is_backtracking_risky(self.pattern_body)
+        try:
+            self.pattern = compile_pattern(self.pattern_body, self.flags)
+            self.replacement = translate_replacement(self.replace_string, self.pattern.groups)
+        except _PATTERN_ERRORS as e:
+            self.pattern = None
+            self.error = str(e)
+            return
+
+        if not self.macros:
+            literal = literal_alternatives(self.pattern_body, self.flags)
+            parts = template_parts(self.replacement) if literal else None
+            if literal and parts is not None:
+                self.literals, self.literal_ignore_case = literal
+                self.literal_parts = parts
+
+    @property
+    def is_valid(self) -> bool:
+        return self.pattern is not None
+
+    def allows_depth(self, depth: int) -> bool:
+        if self.min_depth is not None and depth < self.min_depth:
+            return False
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        return True
+
+    def bundle_entry(self) -> Dict[str, Any]:
+        """渲染端使用的规范化形式：pattern / flags 分离，替换串统一为 JS 语法"""
+        find_regex = self.script.get('findRegex')
+        source, js_flags = split_js_find_regex(find_regex) if isinstance(find_regex, str) else ('', '')
+        return {
+            "scriptName": self.name,
+            "source": source,
+            "flags": js_flags,
+            "replacement": self.replace_string.replace('{{match}}', '$&'),
+            "placement": list(self.placements),
+            "disabled": self.disabled,
+            "markdownOnly": self.markdown_only,
+            "promptOnly": self.prompt_only,
+            "minDepth": self.min_depth,
+            "maxDepth": self.max_depth,
+            "macros": list(self.macros),
+            "error": self.error,
+        }
+
+    def resolve_pattern(self, context: Optional[Dict] = None) -> Optional[re.Pattern]:
+        """返回用于当前 context 的编译 pattern (宏替换后的变体走 LRU 缓存)"""
+        if not self.macros or not context:
+            return self.pattern
+
+        key = tuple((macro, str(context[macro])) for macro in self.macros if macro in context)
+        if not key:
+            return self.pattern
+
+        # 会被线程池中的调用方并发访问：LRU 的读取/插入/淘汰都在锁内，编译在锁外
+        with self._variants_lock:
+            variant = self._variants.get(key)
+            if variant is not None:
+                self._variants.move_to_end(key)
+                return variant
+
+        # 注意：如果名字里有正则特殊字符，需要 escape
+        body = self.pattern_body
+        for macro, value in key:
+            body = body.replace(f"{{{{{macro}}}}}", re.escape(value))
+        variant = compile_pattern(body, self.flags)
+        with self._variants_lock:
+            self._variants[key] = variant
+            if len(self._variants) > MACRO_VARIANT_CACHE_SIZE:
+                self._variants.popitem(last=False)
+        return variant
+
+
 class RegexEngine:
     """
     SillyTavern 正则引擎的 Python 移植版
@@ -21,80 +305,228 @@ class RegexEngine:
     def __init__(self, scripts_dir: str):
         self.scripts_dir = scripts_dir
         self.scripts: List[Dict] = []
+        self.compiled_scripts: List[CompiledScript] = []
+        # (placement, is_markdown, is_prompt) -> (所有候选脚本, 默认启用的脚本)
+        self._selection_index: Dict[Tuple[Any, bool, bool], Tuple[Tuple[CompiledScript, ...], Tuple[CompiledScript, ...]]] = {}
+        self._scripts_by_name: Dict[str, List[CompiledScript]] = {}
+        # 增量加载：文件索引 + 每个文件的已编译脚本；scriptName -> 可删除的单脚本文件
+        self._file_index = JsonFileIndex(scripts_dir)
+        self._file_scripts: Dict[str, Tuple[List[Any], List[CompiledScript]]] = {}
+        self._script_files: Dict[str, str] = {}
+        self._reload_lock = threading.RLock()
+        self._loaded = False
+        self._watcher: Optional[DirectoryWatcher] = None
+        # 每次脚本集合变化时递增
+        self.revision = 0
+        # 执行预算与每个脚本的耗时统计 (scriptName -> stats)
+        self.script_time_budget_ms = SCRIPT_TIME_BUDGET_MS
+        self.call_time_budget_ms = CALL_TIME_BUDGET_MS
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._stats_lock = threading.Lock()
+        # 相邻的字面量脚本合并为一次扫描 (结果与逐个执行完全一致)
+        self.merge_literal_scripts = True
+        self._plans: "OrderedDict[Tuple[int, ...], List[Any]]" = OrderedDict()
+        self._plans_lock = threading.Lock()
+        # 历史消息处理结果缓存
+        self._history_memo: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._history_memo_lock = threading.Lock()
+        self._history_memo_stats = {"hits": 0, "misses": 0}
+        self._has_depth_rules = False
+        # 渲染端 bundle: (revision, etag, 序列化后的 JSON)
+        self._bundle: Optional[Tuple[int, str, bytes]] = None
         self.reload_scripts()
 
-    def reload_scripts(self):
-        """加载目录下的所有 json 正则脚本"""
-        self.scripts = []
-        if not os.path.exists(self.scripts_dir):
-            os.makedirs(self.scripts_dir, exist_ok=True)
-            return
+    def reload_scripts(self) -> bool:
+        """
+        增量加载目录下的 json 正则脚本
+        只重新解析新增 / 修改过的文件，返回脚本集合是否发生变化
+        """
+        with self._reload_lock:
+            if not os.path.exists(self.scripts_dir):
+                os.makedirs(self.scripts_dir, exist_ok=True)
 
-        json_files = glob.glob(os.path.join(self.scripts_dir, "*.json"))
-        # 排序以保证加载顺序一致性 (文件名排序)
-        json_files.sort()
+            changes = self._file_index.refresh()
+            if self._loaded and not any(changes.values()):
+                return False
 
-        for file_path in json_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = json.load(f)
-                    
-                    # 兼容：有些文件是 list of scripts，有些可能是单个 (ST 导出通常是 list)
-                    if isinstance(content, list):
-                        self.scripts.extend(content)
-                    elif isinstance(content, dict):
-                        # 单个脚本对象，或者包含 scripts 字段的对象
-                        if 'scripts' in content and isinstance(content['scripts'], list):
-                             self.scripts.extend(content['scripts'])
-                        else:
-                             self.scripts.append(content)
-            except Exception as e:
-                print(f"[RegexEngine] Error loading {file_path}: {e}")
+            for file_path in changes['removed']:
+                self._file_scripts.pop(file_path, None)
+            for file_path in changes['added'] + changes['changed']:
+                self._file_scripts[file_path] = self._compile_file(file_path)
+
+            self._rebuild_scripts()
+            self._loaded = True
+            self.revision += 1
+            with self._history_memo_lock:
+                self._history_memo.clear()
+            print(f"[RegexEngine] Loaded {len(self.scripts)} regex scripts.")
+            return True
+
+    def _compile_file(self, file_path: str) -> Tuple[List[Any], List[CompiledScript]]:
+        """解析单个文件中的脚本并预编译 (pattern / 替换模板 / flags)"""
+        entry = self._file_index.entries[file_path]
+        if entry.error:
+            print(f"[RegexEngine] Error loading {file_path}: {entry.error}")
+            return [], []
+
+        content = entry.data
+        # 兼容：有些文件是 list of scripts，有些可能是单个 (ST 导出通常是 list)
+        if isinstance(content, list):
+            scripts = list(content)
+        elif isinstance(content, dict):
+            # 单个脚本对象，或者包含 scripts 字段的对象
+            if 'scripts' in content and isinstance(content['scripts'], list):
+                scripts = list(content['scripts'])
+            else:
+                scripts = [content]
+        else:
+            scripts = []
+
+        compiled_scripts = []
+        for script in scripts:
+            if not isinstance(script, dict):
+                continue
+            compiled = CompiledScript(script)
+            if compiled.error and script.get('findRegex'):
+                print(f"[RegexEngine] Script '{compiled.name}' has invalid regex: {compiled.error}")
+            compiled_scripts.append(compiled)
+        return scripts, compiled_scripts
+
+    def _rebuild_scripts(self):
+        """按文件名排序拼接各文件的脚本，保证加载顺序一致性"""
+        scripts: List[Dict] = []
+        compiled_scripts: List[CompiledScript] = []
+        script_files: Dict[str, str] = {}
+        for file_path in self._file_index.sorted_paths():
+            file_scripts, file_compiled = self._file_scripts.get(file_path, ([], []))
+            scripts.extend(file_scripts)
+            for compiled in file_compiled:
+                compiled.ordinal = len(compiled_scripts)
+                compiled_scripts.append(compiled)
+
+            # 只有单脚本文件可以按名字删除 (list 文件中删除单个脚本暂不支持)
+            content = self._file_index.entries[file_path].data
+            if isinstance(content, dict) and content.get('scriptName'):
+                script_files.setdefault(content['scriptName'], file_path)
+
+        self.scripts = scripts
+        self.compiled_scripts = compiled_scripts
+        self._script_files = script_files
+        with self._plans_lock:
+            self._plans.clear()
+        self._build_index()
 
-        print(f"[RegexEngine] Loaded {len(self.scripts)} regex scripts.")
+    def start_watching(self, poll_interval: float = 1.0) -> DirectoryWatcher:
+        """启动后台监听线程，目录变化时自动增量重载"""
+        if not self._watcher:
+            self._watcher = DirectoryWatcher(self.scripts_dir, self.reload_scripts, poll_interval=poll_interval)
+            self._watcher.start()
+        return self._watcher
+
+    def stop_watching(self):
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _build_index(self):
+        """
+        按 placement 与 markdownOnly / promptOnly 标志预先分桶
+        每个 (placement, is_markdown, is_prompt) 组合保存按加载顺序排列的候选脚本，
+        以及不考虑覆盖时默认启用的子集
+        """
+        by_placement: Dict[Any, List[CompiledScript]] = {}
+        by_name: Dict[str, List[CompiledScript]] = {}
+        for compiled in self.compiled_scripts:
+            for placement in compiled.placements:
+                by_placement.setdefault(placement, []).append(compiled)
+            if compiled.name:
+                by_name.setdefault(compiled.name, []).append(compiled)
+
+        index = {}
+        for placement, scripts in by_placement.items():
+            for is_markdown in (False, True):
+                for is_prompt in (False, True):
+                    candidates = tuple(
+                        compiled for compiled in scripts
+                        if (is_markdown or not compiled.markdown_only) and (is_prompt or not compiled.prompt_only)
+                    )
+                    enabled = tuple(compiled for compiled in candidates if not compiled.disabled)
+                    index[(placement, is_markdown, is_prompt)] = (candidates, enabled)
+
+        self._selection_index = index
+        self._scripts_by_name = by_name
+        self._has_depth_rules = any(
+            compiled.min_depth is not None or compiled.max_depth is not None for compiled in self.compiled_scripts
+        )
+
+    def get_bundle(self) -> Tuple[str, bytes]:
+        """
+        返回 (etag, JSON bytes)：所有脚本的规范化形式 + placement 索引
+        每个脚本版本只构建一次；etag 取内容哈希，进程重启后不变
+        """
+        with self._reload_lock:
+            revision = self.revision
+            bundle = self._bundle
+            if bundle is not None and bundle[0] == revision:
+                return bundle[1], bundle[2]
+
+            entries = [compiled.bundle_entry() for compiled in self.compiled_scripts]
+            by_placement: Dict[str, List[int]] = {}
+            for index, compiled in enumerate(self.compiled_scripts):
+                for placement in compiled.placements:
+                    by_placement.setdefault(str(placement), []).append(index)
+
+            scripts_json = json.dumps(entries, ensure_ascii=False, sort_keys=True)
+            version = hashlib.sha1(scripts_json.encode("utf-8")).hexdigest()[:16]
+            payload = json.dumps({
+                "version": version,
+                "scripts": entries,
+                "byPlacement": by_placement,
+            }, ensure_ascii=False).encode("utf-8")
+            etag = f'"{version}"'
+            self._bundle = (revision, etag, payload)
+            return etag, payload
 
     def _get_applicable_scripts(self, placement: int, is_markdown: bool = False, is_prompt: bool = False, overrides: Dict[str, bool] = None) -> List[Dict]:
         """筛选适用于当前上下文的脚本"""
-        applicable = []
-        for script in self.scripts:
-            # 1. Check Disabled
-            # Priority: Overrides > File Disabled > Default False (Enabled)
-            script_name = script.get('scriptName')
-            is_disabled = script.get('disabled', False)
-            
-            if overrides and script_name and script_name in overrides:
-                # If override exists, use the INVERSE (frontend sends 'isActive', so True means Enabled)
-                is_disabled = not overrides[script_name]
+        return [compiled.script for compiled in self._get_applicable_compiled(placement, is_markdown, is_prompt, overrides)]
 
-            if is_disabled:
-                continue
+    def _get_applicable_compiled(self, placement: int, is_markdown: bool = False, is_prompt: bool = False, overrides: Dict[str, bool] = None, depth: Optional[int] = None) -> List[CompiledScript]:
+        scripts = self._select_compiled(placement, is_markdown, is_prompt, overrides)
+        # depth: 消息距离最新一条的层数 (最新 = 0)，按 minDepth / maxDepth 过滤
+        if depth is not None and self._has_depth_rules:
+            return [compiled for compiled in scripts if compiled.allows_depth(depth)]
+        return scripts
 
-            # 2. Check Placement
-            # placement 字段通常是一个 list of ints，例如 [1, 2]
-            script_placement = script.get('placement', [])
-            if not isinstance(script_placement, list):
-                # 兼容可能的旧格式
-                script_placement = [script_placement]
-            
-            if placement not in script_placement:
-                continue
+    def _select_compiled(self, placement: int, is_markdown: bool = False, is_prompt: bool = False, overrides: Dict[str, bool] = None) -> List[CompiledScript]:
+        # 逻辑参考 engine.js:
+        # if (script.markdownOnly && !isMarkdown) return false;
+        # if (script.promptOnly && !isPrompt) return false;
+        try:
+            candidates, enabled = self._selection_index.get((placement, bool(is_markdown), bool(is_prompt)), ((), ()))
+        except TypeError:
+            return []
 
-            # 3. Check Flags (markdownOnly / promptOnly)
-            # 逻辑参考 engine.js:
-            # if (script.markdownOnly && !isMarkdown) return false;
-            # if (script.promptOnly && !isPrompt) return false;
-            
-            if script.get('markdownOnly', False) and not is_markdown:
-                continue
-            
-            if script.get('promptOnly', False) and not is_prompt:
-                continue
+        if not overrides or not candidates:
+            return list(enabled)
 
-            applicable.append(script)
-        
-        return applicable
+        # Priority: Overrides > File Disabled > Default False (Enabled)
+        # 覆盖只作为掩码：记录启用状态与默认值不同的脚本 (frontend sends 'isActive', so True means Enabled)
+        flipped = set()
+        for script_name, is_active in overrides.items():
+            for compiled in self._scripts_by_name.get(script_name, ()):
+                if bool(is_active) == compiled.disabled:
+                    flipped.add(compiled.ordinal)
+
+        if not flipped:
+            return list(enabled)
 
-    def process_string(self, text: str, placement: int, is_markdown: bool = False, is_prompt: bool = False, context: Dict = None, overrides: Dict[str, bool] = None) -> str:
+        return [
+            compiled for compiled in candidates
+            if compiled.disabled == (compiled.ordinal in flipped)
+        ]
+
+    def process_string(self, text: str, placement: int, is_markdown: bool = False, is_prompt: bool = False, context: Dict = None, overrides: Dict[str, bool] = None, time_budget_ms: float = None, depth: Optional[int] = None) -> str:
         """
         核心处理函数
         :param text: 待处理的字符串
@@ -103,86 +535,342 @@ class RegexEngine:
         :param is_prompt: 是否为 Prompt 构建阶段
         :param context: 上下文参数，用于宏替换 ({{char}}, {{user}})
         :param overrides: 前端传递的 switch map
+        :param time_budget_ms: 本次调用的总执行预算，默认 call_time_budget_ms (按输入长度放大)
+        :param depth: 聊天历史中的层数 (最新消息 = 0)，用于 minDepth / maxDepth 过滤；None 表示不过滤
         """
         if not text:
             return ""
 
-        scripts = self._get_applicable_scripts(placement, is_markdown, is_prompt, overrides)
+        return self.process_string_report(text, placement, is_markdown, is_prompt, context, overrides,
+                                          time_budget_ms, depth)[0]
+
+    def process_string_report(self, text: str, placement: int, is_markdown: bool = False, is_prompt: bool = False,
+                              context: Dict = None, overrides: Dict[str, bool] = None, time_budget_ms: float = None,
+                              depth: Optional[int] = None) -> Tuple[str, List[str]]:
+        """同 process_string，另外返回本次被跳过 (已标记 / 超时 / 出错 / 预算用尽) 的脚本名"""
+        if not text:
+            return "", []
+
+        scripts = self._get_applicable_compiled(placement, is_markdown, is_prompt, overrides, depth)
+        return self._apply_scripts(text, scripts, context, time_budget_ms)
+
+    def _apply_scripts(self, text: str, scripts: List[CompiledScript], context: Dict = None,
+                       time_budget_ms: float = None) -> Tuple[str, List[str]]:
+        """返回 (结果, 被跳过的脚本名)；脚本因标记、超时、出错或预算用尽未执行时列入后者"""
+        skipped: List[str] = []
         
-        # 简单的宏替换 (如果 regex 本身需要匹配具体名字)
-        # 注意：ST 的 regex 很多是直接对内容做处理，宏替换通常是在 regex 执行前还是执行中？
         # 查看 ST 源码 runRegexScript: 
         # 它会在执行前通过 substituteParamsDeep 替换 regex 字符串本身的宏，
         # 也就是 regex pattern 里的 {{char}} 会变成实际名字。
+        # 这里 pattern / 替换模板已在加载时预编译，宏变体由 CompiledScript 缓存
         
-        for script in scripts:
+        steps = self._execution_plan(scripts) if self.merge_literal_scripts else scripts
+        scale = budget_scale(text)
+        script_budget_ms = self.script_time_budget_ms * scale
+        call_budget_ms = self.call_time_budget_ms * scale if time_budget_ms is None else time_budget_ms
+        call_started = time.perf_counter()
+        for compiled in steps:
+            if isinstance(compiled, MergedLiteralPass):
+                text, merged_skipped = self._run_merged(
+                    compiled, text, call_budget_ms - (time.perf_counter() - call_started) * 1000, script_budget_ms,
+                )
+                skipped.extend(merged_skipped)
+                continue
+
+            if compiled.flagged:
+                self._record(compiled, skipped=True)
+                skipped.append(_script_key(compiled))
+                continue
+
+            remaining_ms = call_budget_ms - (time.perf_counter() - call_started) * 1000
+            if remaining_ms <= 0:
+                # 本次调用的总预算已用完：跳过剩余脚本
+                self._record(compiled, skipped=True)
+                skipped.append(_script_key(compiled))
+                continue
+
+            started = time.perf_counter()
+            timeout_ms = min(script_budget_ms, remaining_ms)
             try:
-                regex_pattern = script.get('findRegex')
-                replace_string = script.get('replaceString', '')
-                
-                if not regex_pattern:
+                pattern = compiled.resolve_pattern(context)
+                if pattern is None:
                     continue
 
-                # --- 1. 处理 Regex Pattern 中的宏 ---
-                if context:
-                    # 简单替换：将 pattern 中的 {{char}} 等替换为实际值
-                    # 注意：如果名字里有正则特殊字符，需要 escape
-                    for key, val in context.items():
-                        macro = f"{{{{{key}}}}}"
-                        if macro in regex_pattern:
-                            safe_val = re.escape(val)
-                            regex_pattern = regex_pattern.replace(macro, safe_val)
-
-                # --- 2. 编译 Regex ---
-                # ST default flags: usually 'g' (global) 'm' (multiline) 'i' (case insensitive depends)
-                # JS Regex flags translate: 
-                # g -> re.findall mechanism (but sub replaces all by default)
-                # m -> re.MULTILINE
-                # s -> re.DOTALL (if dotAll flag)
-                # i -> re.IGNORECASE
-                
-                flags = 0
-                regex_options = script.get('regexOptions', '') # ST JSON 可能包含 flags 字段? 
-                # ST Preset JSON example: "findRegex": "/^...</gm" 或者是纯字符串
-                # 如果是纯字符串，ST 默认 flags 是 'gm'
-                
-                # 在 ST 中 regex 经常存储为 "/pattern/flags" 格式字符串，或者分开
-                # 我们的示例 json 显示 "findRegex": "/<think>[\\s\\S]*?<\\/think>/g"
-                
-                pattern_str = regex_pattern
-                
-                # 解析 /pattern/flags 格式
-                if pattern_str.startswith('/') and pattern_str.rfind('/') > 0:
-                    last_slash = pattern_str.rfind('/')
-                    flags_str = pattern_str[last_slash+1:]
-                    pattern_body = pattern_str[1:last_slash]
-                    
-                    if 'i' in flags_str: flags |= re.IGNORECASE
-                    if 'm' in flags_str: flags |= re.MULTILINE
-                    if 's' in flags_str: flags |= re.DOTALL
-                    # g flag is implicit in re.sub
-                    
-                    pattern_str = pattern_body
+                if HARD_TIMEOUT_AVAILABLE:
+                    text = pattern.sub(compiled.replacement, text, timeout=timeout_ms / 1000)
                 else:
-                    # Default flags if not specified like JS
-                    flags = re.MULTILINE 
-
-                # --- 3. 执行替换 ---
-                # Python re.sub handles substitution
-                # ST replaceString supports $1, $2 etc. Python uses \1, \2
-                # Need to convert $ to \ for group content
-                py_replace_string = replace_string.replace('$', '\\')
-                
-                # 特殊处理：如果替换为空字符串，直接置空
-                # ST logic allows script to run plain replace
-                
-                text = re.sub(pattern_str, py_replace_string, text, flags=flags)
+                    text = pattern.sub(compiled.replacement, text)
 
+            except TimeoutError:
+                if timeout_ms < script_budget_ms:
+                    # 被剩余的调用预算截断，不说明脚本本身有问题：只跳过这一次
+                    self._record(compiled, skipped=True)
+                else:
+                    self._over_budget(compiled, (time.perf_counter() - started) * 1000, script_budget_ms, timed_out=True)
+                skipped.append(_script_key(compiled))
+                continue
             except Exception as e:
-                print(f"[RegexEngine] Script '{script.get('scriptName')}' failed: {e}")
+                print(f"[RegexEngine] Script '{compiled.name}' failed: {e}")
+                self._record(compiled, error=str(e))
+                skipped.append(_script_key(compiled))
                 continue
 
-        return text
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms > script_budget_ms:
+                # 没有 regex 模块时无法中断执行，只能事后记录；结果照常保留，连续多次才标记跳过
+                self._over_budget(compiled, elapsed_ms, script_budget_ms, timed_out=False)
+            else:
+                compiled.strikes = 0
+                self._record(compiled, elapsed_ms=elapsed_ms)
+
+        return text, skipped
+
+    def create_stream_processor(self, placement: int, is_markdown: bool = False, is_prompt: bool = False,
+                                context: Dict = None, overrides: Dict[str, bool] = None,
+                                max_holdback: int = STREAM_MAX_HOLDBACK) -> StreamingRegexProcessor:
+        """流式输出用：逐块 feed()，只输出不会再被任何适用脚本改变的文本，结束时 flush()"""
+        scripts = self._get_applicable_compiled(placement, is_markdown, is_prompt, overrides)
+        return StreamingRegexProcessor(scripts, context, max_holdback, scan=self._stream_scan)
+
+    def _stream_scan(self, compiled: CompiledScript, pattern: Any, text: str, pos: int,
+                     call_started: float) -> Optional[List[Any]]:
+        """
+        流式处理的一次扫描 (每块 feed / flush 为一次调用)，预算与 _apply_scripts 相同；
+        返回 None 时该脚本在本次流中不再执行
+        """
+        if compiled.flagged:
+            self._record(compiled, skipped=True)
+            return None
+
+        scale = budget_scale(text)
+        script_budget_ms = self.script_time_budget_ms * scale
+        remaining_ms = self.call_time_budget_ms * scale - (time.perf_counter() - call_started) * 1000
+        if remaining_ms <= 0:
+            self._record(compiled, skipped=True)
+            return None
+
+        started = time.perf_counter()
+        timeout_ms = min(script_budget_ms, remaining_ms)
+        try:
+            if HARD_TIMEOUT_AVAILABLE:
+                matches = list(pattern.finditer(text, pos, timeout=timeout_ms / 1000))
+            else:
+                matches = list(pattern.finditer(text, pos))
+        except TimeoutError:
+            if timeout_ms < script_budget_ms:
+                self._record(compiled, skipped=True)
+            else:
+                self._over_budget(compiled, (time.perf_counter() - started) * 1000, script_budget_ms, timed_out=True)
+            return None
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms > script_budget_ms:
+            self._over_budget(compiled, elapsed_ms, script_budget_ms, timed_out=False)
+            return None if compiled.flagged else matches
+        compiled.strikes = 0
+        self._record(compiled, elapsed_ms=elapsed_ms)
+        return matches
+
+    def _execution_plan(self, scripts: List[CompiledScript]) -> List[Any]:
+        """按适用脚本组合缓存执行计划：相邻的可合并字面量脚本替换为 MergedLiteralPass"""
+        if len(scripts) < 2:
+            return scripts
+        key = tuple(-1 - compiled.ordinal if compiled.flagged else compiled.ordinal for compiled in scripts)
+        with self._plans_lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        plan = build_execution_plan(scripts)
+        with self._plans_lock:
+            self._plans[key] = plan
+            if len(self._plans) > EXECUTION_PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return plan
+
+    def process_history(self, history: List[Any], context: Dict = None, overrides: Dict[str, bool] = None) -> List[Dict[str, Any]]:
+        """
+        构建 Prompt 时对聊天历史应用正则 (is_prompt=True)
+        user 消息按 USER_INPUT，model / assistant 消息按 AI_OUTPUT 处理；
+        第 i 条历史消息的 depth 为 len(history) - i (当前输入为 0)，按 minDepth / maxDepth 过滤。
+        结果按 (内容哈希, 适用脚本集合, 脚本版本, 上下文) 缓存，未变化的历史消息不会重复计算。
+        """
+        total = len(history)
+        context_key = tuple(sorted((str(key), str(value)) for key, value in (context or {}).items()))
+        processed = []
+        for index, message in enumerate(history):
+            if isinstance(message, dict):
+                role, parts = message.get("role"), message.get("parts") or []
+            else:
+                role, parts = getattr(message, "role", None), getattr(message, "parts", None) or []
+
+            placement = HISTORY_ROLE_PLACEMENTS.get(role)
+            if placement is None:
+                processed.append({"role": role, "parts": [dict(part) for part in parts]})
+                continue
+
+            scripts = self._get_applicable_compiled(placement, False, True, overrides, total - index)
+            new_parts = []
+            for part in parts:
+                text = part.get("text") if isinstance(part, dict) else None
+                if not text or not scripts:
+                    new_parts.append(dict(part))
+                    continue
+                new_parts.append({**part, "text": self._process_memoized(text, scripts, context, context_key)})
+            processed.append({"role": role, "parts": new_parts})
+        return processed
+
+    def _process_memoized(self, text: str, scripts: List[CompiledScript], context: Dict, context_key: Tuple) -> str:
+        digest = hashlib.sha1(text.encode("utf-8")).digest()
+        # 被标记跳过的脚本不参与执行，用 -1-ordinal 区分
+        script_key = tuple(-1 - compiled.ordinal if compiled.flagged else compiled.ordinal for compiled in scripts)
+        key = (digest, script_key, self.revision, context_key)
+        with self._history_memo_lock:
+            cached = self._history_memo.get(key)
+            if cached is not None:
+                self._history_memo.move_to_end(key)
+                self._history_memo_stats["hits"] += 1
+                return cached
+            self._history_memo_stats["misses"] += 1
+
+        result, skipped = self._apply_scripts(text, scripts, context)
+        if not skipped:
+            # 有脚本被跳过 (超时 / 预算用尽) 的结果不缓存，下次重新计算
+            with self._history_memo_lock:
+                self._history_memo[key] = result
+                if len(self._history_memo) > HISTORY_MEMO_SIZE:
+                    self._history_memo.popitem(last=False)
+        return result
+
+    def _run_merged(self, merged: MergedLiteralPass, text: str, remaining_ms: float,
+                    script_budget_ms: float) -> Tuple[str, List[str]]:
+        """返回 (结果, 被跳过的脚本名)，同 _apply_scripts"""
+        if remaining_ms <= 0:
+            for compiled in merged.scripts:
+                self._record(compiled, skipped=True)
+            return text, [_script_key(compiled) for compiled in merged.scripts]
+
+        started = time.perf_counter()
+        text = merged.apply(text)
+        share_ms = (time.perf_counter() - started) * 1000 / len(merged.scripts)
+        for compiled in merged.scripts:
+            if share_ms > script_budget_ms:
+                self._over_budget(compiled, share_ms, script_budget_ms, timed_out=False)
+            else:
+                compiled.strikes = 0
+                self._record(compiled, elapsed_ms=share_ms)
+        return text, []
+
+    def _stats_for(self, compiled: CompiledScript) -> Dict[str, Any]:
+        key = _script_key(compiled)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = _empty_stats()
+            self._stats[key] = stats
+        return stats
+
+    def _record(self, compiled: CompiledScript, elapsed_ms: float = 0.0, skipped: bool = False, error: str = None):
+        with self._stats_lock:
+            stats = self._stats_for(compiled)
+            if skipped:
+                stats["skipped"] += 1
+                return
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if error:
+                stats["errors"] += 1
+                stats["last_error"] = error
+
+    def _over_budget(self, compiled: CompiledScript, elapsed_ms: float, budget_ms: float, timed_out: bool):
+        """
+        超出执行预算：被 regex 模块中断 (timed_out) 时立即标记跳过；
+        事后发现的超出要连续 OVER_BUDGET_STRIKES 次才标记，单次慢调用 (如超长输入) 不影响之后的调用
+        """
+        if not timed_out:
+            compiled.strikes += 1
+        flag = timed_out or compiled.strikes >= OVER_BUDGET_STRIKES
+        if flag:
+            compiled.flagged = "timeout" if timed_out else "over_budget"
+        with self._stats_lock:
+            stats = self._stats_for(compiled)
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["timeouts" if timed_out else "over_budget"] += 1
+        if flag:
+            print(f"[RegexEngine] Script '{compiled.name}' exceeded its time budget "
+                  f"({elapsed_ms:.0f}ms > {budget_ms:.0f}ms), skipping it from now on.")
+
+    def get_script_stats(self) -> Dict[str, Any]:
+        """每个脚本的耗时统计 + 当前被标记跳过的脚本"""
+        with self._stats_lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        scripts = []
+        for compiled in self.compiled_scripts:
+            key = _script_key(compiled)
+            entry = stats.get(key) or _empty_stats()
+            scripts.append({
+                "scriptName": compiled.name,
+                "risky": compiled.risky,
+                "flagged": compiled.flagged,
+                **entry,
+                "avg_ms": entry["total_ms"] / entry["calls"] if entry["calls"] else 0.0,
+            })
+        return {
+            "hard_timeout": HARD_TIMEOUT_AVAILABLE,
+            "script_budget_ms": self.script_time_budget_ms,
+            "call_budget_ms": self.call_time_budget_ms,
+            "budget_scale_chars": BUDGET_SCALE_CHARS,
+            "over_budget_strikes": OVER_BUDGET_STRIKES,
+            "history_memo": {**self._history_memo_stats, "size": len(self._history_memo)},
+            "scripts": scripts,
+        }
+
+    def get_flags(self) -> Dict[str, str]:
+        """当前被标记跳过的脚本：脚本名 -> 原因"""
+        return {_script_key(compiled): compiled.flagged for compiled in self.compiled_scripts if compiled.flagged}
+
+    def set_flags(self, flags: Dict[str, str]):
+        """按脚本名设置跳过标记 (批处理的 worker 进程以主进程的标记为准)"""
+        for compiled in self.compiled_scripts:
+            compiled.flagged = flags.get(_script_key(compiled))
+
+    def drain_script_stats(self) -> Dict[str, Dict[str, Any]]:
+        """取出并清空原始统计 (worker 进程用它把增量交回主进程)"""
+        with self._stats_lock:
+            stats, self._stats = self._stats, {}
+        return stats
+
+    def merge_script_stats(self, stats: Dict[str, Dict[str, Any]], flags: Dict[str, str] = None):
+        """合并 worker 进程的统计增量与新增的跳过标记"""
+        with self._stats_lock:
+            for key, values in stats.items():
+                target = self._stats.get(key)
+                if target is None:
+                    target = self._stats[key] = _empty_stats()
+                for name, value in values.items():
+                    if name == "max_ms":
+                        target[name] = max(target[name], value)
+                    elif name == "last_error":
+                        target[name] = value or target[name]
+                    else:
+                        target[name] += value
+        for compiled in self.compiled_scripts:
+            reason = (flags or {}).get(_script_key(compiled))
+            if reason and not compiled.flagged:
+                compiled.flagged = reason
+
+    def reset_script_stats(self, unflag: bool = True):
+        """清空统计；unflag=True 时同时解除所有脚本的跳过标记"""
+        with self._stats_lock:
+            self._stats.clear()
+        with self._history_memo_lock:
+            self._history_memo_stats = {"hits": 0, "misses": 0}
+        if unflag:
+            for compiled in self.compiled_scripts:
+                compiled.flagged = None
+                compiled.strikes = 0
 
     def import_script(self, content: Union[Dict, List[Dict]], filename: str = None) -> bool:
         """
@@ -221,28 +909,10 @@ class RegexEngine:
         Delete a script by scriptName (find file and delete)
         """
         try:
-            target_file = None
-            # Need to scan again because self.scripts doesn't store path directly in memory currently
-            json_files = glob.glob(os.path.join(self.scripts_dir, "*.json"))
-            
-            for file_path in json_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = json.load(f)
-                        if isinstance(content, dict):
-                            if content.get('scriptName') == script_name:
-                                target_file = file_path
-                                break
-                        elif isinstance(content, list):
-                             # Check inside list
-                             for s in content:
-                                 if s.get('scriptName') == script_name:
-                                     # Warning: Deleting from a list file is complex. 
-                                     # For now, if found in a list file, we might not want to delete the whole file.
-                                     # Simplifying assumption: One script per file for managed scripts.
-                                     pass
-                except:
-                    continue
+            # O(1) lookup in the name -> file index; refresh once in case the directory changed
+            target_file = self._script_files.get(script_name)
+            if not target_file and self.reload_scripts():
+                target_file = self._script_files.get(script_name)
             
             if target_file:
                 os.remove(target_file)
@@ -0,0 +1,249 @@
+"""
+Single-pass execution of consecutive literal regex scripts.
+
+Scripts whose pattern is a plain literal or an alternation of literals (`/apple/gi`,
+`/foo|bar/g`) are merged into one prefix-tree alternation of all their literals
+when applying them in one pass is provably identical to applying them one by one:
+
+- no literal of one script can overlap (or contain) a literal of another script,
+  so the matches of different scripts never compete for the same characters;
+- every replacement of an earlier script is non-empty and shares no character with
+  the literals of later scripts, so sequential application can never create a new
+  match for a later script (neither inside the replacement nor across its edges).
+
+Case-insensitive literals are only accepted when every cased character is ASCII;
+the checks compare case-folded text, which only makes them more conservative.
+"""
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Literal alternations are expanded; patterns that expand to more alternatives are not merged.
+MAX_LITERAL_ALTERNATIVES = 256
+MAX_LITERAL_LENGTH = 200
+
+_LITERAL = sre_constants.LITERAL
+_IN = sre_constants.IN
+_BRANCH = sre_constants.BRANCH
+
+
+def _expand(items) -> Optional[List[str]]:
+    """Expand a parsed sub-pattern made only of literals, literal sets and branches."""
+    alternatives = ['']
+    for op, av in items:
+        if op is _LITERAL:
+            options = [chr(av)]
+        elif op is _IN:
+            if not all(member_op is _LITERAL for member_op, _ in av):
+                return None
+            options = [chr(code) for _, code in av]
+        elif op is _BRANCH:
+            options = []
+            for branch in av[1]:
+                expanded = _expand(branch)
+                if expanded is None:
+                    return None
+                options.extend(expanded)
+        else:
+            return None
+
+        alternatives = [prefix + option for prefix in alternatives for option in options]
+        if len(alternatives) > MAX_LITERAL_ALTERNATIVES:
+            return None
+    return alternatives
+
+
+def literal_alternatives(pattern_body: str, flags: int) -> Optional[Tuple[Tuple[str, ...], bool]]:
+    """
+    Return (literals in alternation order, ignore_case) when the pattern only matches
+    a fixed set of non-empty strings, otherwise None.
+    """
+    try:
+        parsed = sre_parse.parse(pattern_body, flags)
+    except Exception:
+        return None
+
+    state = getattr(parsed, 'state', None) or getattr(parsed, 'pattern', None)
+    if state is None or getattr(state, 'groups', 1) != 1:
+        return None
+    ignore_case = bool(state.flags & re.IGNORECASE)
+
+    literals = _expand(list(parsed))
+    if not literals or any(not literal for literal in literals):
+        return None
+    if ignore_case and not all(ch.isascii() or ch.lower() == ch.upper() for literal in literals for ch in literal):
+        return None
+    return tuple(dict.fromkeys(literals)), ignore_case
+
+
+def template_parts(template: str) -> Optional[Tuple[Optional[str], ...]]:
+    """
+    Split a translated replacement template into literal text and whole-match references (None).
+    Only templates produced for group-less patterns (escaped backslashes, \\g<0>) are accepted.
+    """
+    parts: List[Optional[str]] = []
+    buffer: List[str] = []
+    i = 0
+    while i < len(template):
+        ch = template[i]
+        if ch != '\\':
+            buffer.append(ch)
+            i += 1
+        elif template.startswith('\\\\', i):
+            buffer.append('\\')
+            i += 2
+        elif template.startswith('\\g<0>', i):
+            if buffer:
+                parts.append(''.join(buffer))
+                buffer = []
+            parts.append(None)
+            i += 5
+        else:
+            return None
+    if buffer:
+        parts.append(''.join(buffer))
+    return tuple(parts)
+
+
+# Characters that re's case-insensitive matching treats as ASCII letters (simple case folding).
+_ASCII_FOLD_FIXES = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+
+def fold(text: str) -> str:
+    """Case-fold the way re.IGNORECASE compares the literals accepted above."""
+    return text.translate(_ASCII_FOLD_FIXES).lower()
+
+
+def _overlaps(first: str, second: str) -> bool:
+    if first in second or second in first:
+        return True
+    shortest = min(len(first), len(second))
+    return any(first.endswith(second[:k]) or second.endswith(first[:k]) for k in range(1, shortest))
+
+
+def _trie_regex(literals: Sequence[str]) -> str:
+    """
+    Prefix-tree regex of literals none of which is a prefix of another, e.g.
+    ['apple', 'apricot'] -> 'ap(?:ple|ricot)'. re only tests the few branches that
+    share the current character instead of every literal at every position.
+    """
+    trie: Dict[str, Any] = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+
+    def _emit(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + _emit(child) for ch, child in sorted(node.items())]
+        if len(branches) <= 1:
+            return ''.join(branches)
+        return '(?:' + '|'.join(branches) + ')'
+
+    return _emit(trie)
+
+
+class MergedLiteralPass:
+    """
+    One re.sub pass standing in for several consecutive literal scripts.
+    At most one literal can match at any position, so the matched text alone
+    identifies the script whose replacement applies.
+    """
+    __slots__ = ('scripts', 'pattern', '_exact', '_folded')
+
+    def __init__(self, scripts: Sequence[Any]):
+        self.scripts = tuple(scripts)
+        self._exact: Dict[str, Tuple[Optional[str], ...]] = {}
+        self._folded: Dict[str, Tuple[Optional[str], ...]] = {}
+        for compiled in self.scripts:
+            for literal in compiled.literals:
+                if compiled.literal_ignore_case:
+                    self._folded[fold(literal)] = compiled.literal_parts
+                else:
+                    self._exact[literal] = compiled.literal_parts
+
+        branches = []
+        if self._exact:
+            branches.append(_trie_regex(list(self._exact)))
+        if self._folded:
+            branches.append('(?i:' + _trie_regex(list(self._folded)) + ')')
+        self.pattern = re.compile('|'.join(branches))
+
+    def _replace(self, match: re.Match) -> str:
+        matched = match.group()
+        parts = self._exact.get(matched)
+        if parts is None:
+            parts = self._folded[fold(matched)]
+        if len(parts) == 1 and parts[0] is not None:
+            return parts[0]
+        return ''.join(matched if part is None else part for part in parts)
+
+    def apply(self, text: str) -> str:
+        return self.pattern.sub(self._replace, text)
+
+
+class _MergeGroup:
+    def __init__(self):
+        self.scripts: List[Any] = []
+        self.literals: List[str] = []
+        self.output_chars: set = set()
+
+    def accepts(self, compiled: Any) -> bool:
+        if not self.scripts:
+            return True
+        folded = [fold(literal) for literal in compiled.literals]
+        if any(ch in self.output_chars for literal in folded for ch in literal):
+            return False
+        return not any(_overlaps(mine, theirs) for mine in folded for theirs in self.literals)
+
+    def add(self, compiled: Any):
+        self.scripts.append(compiled)
+        self.literals.extend(fold(literal) for literal in compiled.literals)
+        for part in compiled.literal_parts:
+            # A whole-match reference can emit any of the script's literals.
+            chars = ''.join(compiled.literals) if part is None else part
+            self.output_chars.update(fold(chars))
+
+
+def is_mergeable(compiled: Any) -> bool:
+    if compiled.literals is None or compiled.flagged or not compiled.literal_parts:
+        return False
+    if any(len(literal) > MAX_LITERAL_LENGTH for literal in compiled.literals):
+        return False
+    # The pass relies on at most one literal matching at a position; within one script
+    # that only holds when no alternative is a prefix of another (`app|apple`).
+    folded = sorted(fold(literal) for literal in compiled.literals)
+    return not any(later.startswith(earlier) for earlier, later in zip(folded, folded[1:]))
+
+
+def build_execution_plan(scripts: Sequence[Any]) -> List[Any]:
+    """
+    Replace runs of mergeable consecutive scripts with MergedLiteralPass steps.
+    Other scripts are kept as they are, in their original order.
+    """
+    plan: List[Any] = []
+    group = _MergeGroup()
+
+    def _flush():
+        if len(group.scripts) > 1:
+            plan.append(MergedLiteralPass(group.scripts))
+        else:
+            plan.extend(group.scripts)
+
+    for compiled in scripts:
+        if not is_mergeable(compiled):
+            _flush()
+            group = _MergeGroup()
+            plan.append(compiled)
+            continue
+        if not group.accepts(compiled):
+            _flush()
+            group = _MergeGroup()
+        group.add(compiled)
+    _flush()
+    return plan
@@ -0,0 +1,411 @@
+"""
+Incremental regex application over streamed text (LLM output arriving in chunks).
+
+Every applicable script is a pipeline stage with its own pending input. On each chunk a
+stage commits the longest prefix of its pending input whose substitutions can no longer
+change, and passes the replaced text on to the next stage; the rest is held back.
+How much must be held back depends on the pattern:
+
+- bounded:   the longest possible match (plus lookahead) is bounded, e.g. `/apple/gi`,
+             `/\\d{1,3}%/`; only that many trailing characters are held back.
+- line:      unbounded but unable to match a newline, e.g. `/^# (.+)$/gm`; text is held
+             back from the last newline.
+- delimited: a literal prefix and suffix around lazy content, e.g.
+             `/<think>[\\s\\S]*?<\\/think>/g`; text is held back from an unclosed prefix.
+- whole:     anything else (greedy unbounded repeats, `\\A`, `$` without the m flag):
+             the stage holds its input until flush.
+
+A stage never holds more than max_holdback characters. When it has to cut anyway the
+output may differ from processing the finished string and the processor is marked inexact.
+
+Scans run through the scan callback given by the engine, which applies the same time
+budgets as non-streamed processing. A stage whose scan is cut off (or whose script gets
+flagged) is bypassed for the rest of the stream: its input passes through unchanged.
+"""
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+STREAM_MAX_HOLDBACK = 32 * 1024
+# Committed input kept as left context for ^, \b and lookbehinds.
+CONTEXT_CHARS = 256
+# Bounded patterns wider than this are handled like unbounded ones.
+MAX_BOUNDED_WIDTH = 4096
+
+_PARSE_FLAGS = re.IGNORECASE | re.MULTILINE | re.DOTALL | re.VERBOSE | re.ASCII | re.UNICODE
+_UNBOUNDED = sre_constants.MAXREPEAT
+_WHOLE_TEXT_ANCHORS = {sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END_STRING}
+
+# scan(compiled, pattern, text, pos, call_started) -> matches, or None to bypass the stage
+StreamScan = Callable[[Any, re.Pattern, str, int, float], Optional[List[re.Match]]]
+
+
+class _StageBypassed(Exception):
+    pass
+
+
+class StreamRule:
+    __slots__ = ('kind', 'margin', 'prefix', 'prefix_len', 'suffix', 'suffix_len')
+
+    def __init__(self, kind: str, margin: int = 0, prefix: Optional[re.Pattern] = None, prefix_len: int = 0,
+                 suffix: Optional[re.Pattern] = None, suffix_len: int = 0):
+        self.kind = kind
+        self.margin = margin
+        self.prefix = prefix
+        self.prefix_len = prefix_len
+        self.suffix = suffix
+        self.suffix_len = suffix_len
+
+
+def _walk(items, visit):
+    for op, av in items:
+        visit(op, av)
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            _walk(av[2], visit)
+        elif op is sre_constants.SUBPATTERN:
+            _walk(av[-1], visit)
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                _walk(branch, visit)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _walk(av[1], visit)
+        elif op is sre_constants.GROUPREF_EXISTS:
+            _walk(av[1], visit)
+            if av[2]:
+                _walk(av[2], visit)
+
+
+_NEWLINE = ord('\n')
+_CATEGORIES_WITH_NEWLINE = {
+    sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_NOT_DIGIT, sre_constants.CATEGORY_NOT_WORD,
+    sre_constants.CATEGORY_LINEBREAK, sre_constants.CATEGORY_UNI_SPACE, sre_constants.CATEGORY_UNI_NOT_DIGIT,
+    sre_constants.CATEGORY_UNI_NOT_WORD, sre_constants.CATEGORY_UNI_LINEBREAK,
+}
+
+
+def _set_contains_newline(members) -> bool:
+    negate = False
+    found = False
+    for op, av in members:
+        if op is sre_constants.NEGATE:
+            negate = True
+        elif op is sre_constants.LITERAL:
+            found = found or av == _NEWLINE
+        elif op is sre_constants.RANGE:
+            found = found or av[0] <= _NEWLINE <= av[1]
+        elif op is sre_constants.CATEGORY:
+            found = found or av in _CATEGORIES_WITH_NEWLINE
+        else:
+            return True
+    return found != negate
+
+
+def _literal_run(items) -> str:
+    return ''.join(chr(av) for op, av in items if op is sre_constants.LITERAL)
+
+
+def analyze_stream_rule(pattern: re.Pattern) -> StreamRule:
+    """Classify a compiled pattern for streaming (see module docstring)."""
+    flags = pattern.flags & _PARSE_FLAGS
+    try:
+        parsed = sre_parse.parse(pattern.pattern, flags)
+    except Exception:
+        return StreamRule('whole')
+    state = parsed.state if hasattr(parsed, 'state') else parsed.pattern
+    multiline = bool(state.flags & re.MULTILINE)
+
+    dotall = bool(state.flags & re.DOTALL)
+    facts = {'whole': False, 'lookahead': 0, 'greedy_unbounded': False, 'greedy_bounded': 0, 'newline': False}
+
+    def _visit(op, av):
+        if op is sre_constants.AT:
+            if av in _WHOLE_TEXT_ANCHORS or (not multiline and av in (sre_constants.AT_BEGINNING, sre_constants.AT_END)):
+                facts['whole'] = True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            width = sre_parse.SubPattern(state, av[1]).getwidth()[1]
+            if width >= MAX_BOUNDED_WIDTH or (av[0] < 0 and width > CONTEXT_CHARS):
+                facts['whole'] = True
+            elif av[0] > 0:
+                facts['lookahead'] += width
+        elif op is sre_constants.MAX_REPEAT:
+            if av[1] is _UNBOUNDED:
+                facts['greedy_unbounded'] = True
+            else:
+                facts['greedy_bounded'] += sre_parse.SubPattern(state, av[2]).getwidth()[1] * av[1]
+        elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            facts['whole'] = True
+
+        if op is sre_constants.LITERAL:
+            facts['newline'] = facts['newline'] or av == _NEWLINE
+        elif op is sre_constants.NOT_LITERAL:
+            facts['newline'] = facts['newline'] or av != _NEWLINE
+        elif op is sre_constants.ANY:
+            facts['newline'] = facts['newline'] or dotall
+        elif op is sre_constants.IN:
+            facts['newline'] = facts['newline'] or _set_contains_newline(av)
+
+    _walk(list(parsed), _visit)
+    if facts['whole']:
+        return StreamRule('whole')
+
+    # +1: `$`, `\b` and failed scans may look at the character after a match.
+    max_width = parsed.getwidth()[1]
+    if max_width < MAX_BOUNDED_WIDTH:
+        return StreamRule('bounded', margin=max_width + facts['lookahead'] + 1)
+    if not facts['newline']:
+        return StreamRule('line')
+
+    items = list(parsed)
+    prefix = _literal_run(items[:next((i for i, (op, _) in enumerate(items) if op is not sre_constants.LITERAL), len(items))])
+    tail = list(reversed(items))
+    suffix = _literal_run(reversed(tail[:next((i for i, (op, _) in enumerate(tail) if op is not sre_constants.LITERAL), len(tail))]))
+    if not prefix or not suffix or facts['greedy_unbounded'] or facts['greedy_bounded'] >= MAX_BOUNDED_WIDTH:
+        return StreamRule('whole')
+
+    literal_flags = state.flags & re.IGNORECASE
+    return StreamRule(
+        'delimited',
+        margin=facts['greedy_bounded'] + facts['lookahead'] + 1,
+        prefix=re.compile(re.escape(prefix), literal_flags),
+        prefix_len=len(prefix),
+        suffix=re.compile(re.escape(suffix), literal_flags),
+        suffix_len=len(suffix),
+    )
+
+
+class _Stage:
+    """One script of the pipeline: pending input, committed left context, holdback rule."""
+
+    def __init__(self, compiled: Any, pattern: re.Pattern, max_holdback: int):
+        self.compiled = compiled
+        self.pattern = pattern
+        self.find: Callable[[str, int], List[re.Match]] = lambda full, base: list(pattern.finditer(full, base))
+        self.bypassed = False
+        self.rule = analyze_stream_rule(pattern)
+        self.max_holdback = max_holdback
+        self.context = ''
+        self.pending = ''
+        # delimited: offset (in pending) of an unclosed prefix and how far the suffix was searched
+        self._open_at: Optional[int] = None
+        self._suffix_scanned = 0
+        self.forced_cuts = 0
+
+    def _matches(self) -> Tuple[str, int, List[re.Match]]:
+        full = self.context + self.pending
+        base = len(self.context)
+        return full, base, self.find(full, base)
+
+    def _safe_cut(self, base: int, matches: List[re.Match]) -> int:
+        rule = self.rule
+        length = len(self.pending)
+        if rule.kind == 'whole':
+            return 0
+
+        if rule.kind == 'line':
+            # Matches never contain a newline and scans stop at one.
+            return max(0, self.pending.rfind('\n'))
+
+        if rule.kind == 'bounded':
+            cut = max(0, length - rule.margin)
+            for m in matches:
+                start, end = m.start() - base, m.end() - base
+                if start < cut < end:
+                    return start
+            return cut
+
+        # delimited
+        cut = max(0, length - rule.prefix_len + 1)
+        gap_start = 0
+        for m in matches:
+            start, end = m.start() - base, m.end() - base
+            opened = rule.prefix.search(self.pending, gap_start, start + rule.prefix_len - 1)
+            if opened and opened.start() < start:
+                return min(cut, opened.start())
+            if end + rule.margin > length:
+                return min(cut, start)
+            gap_start = end
+        opened = rule.prefix.search(self.pending, gap_start)
+        if opened:
+            self._open_at = opened.start()
+            self._suffix_scanned = opened.end()
+            return min(cut, opened.start())
+        # Positions inside a finished match are never scanned: the cut may move to its end.
+        return max(cut, gap_start)
+
+    def feed(self, text: str) -> str:
+        if not text:
+            return ''
+        self.pending += text
+
+        rule = self.rule
+        if rule.kind == 'delimited' and self._open_at is not None:
+            # A block is still open: only look at the new text for its suffix (O(chunk)).
+            scan_from = max(self._suffix_scanned - rule.suffix_len + 1, self._open_at)
+            if not rule.suffix.search(self.pending, scan_from):
+                self._suffix_scanned = len(self.pending)
+                return self._enforce_holdback()
+            self._open_at = None
+
+        if rule.kind == 'whole' or (rule.kind == 'line' and '\n' not in text):
+            return self._enforce_holdback()
+
+        full, base, matches = self._matches()
+        cut = self._safe_cut(base, matches)
+        if len(self.pending) - cut > self.max_holdback:
+            return self._commit(full, base, matches, self._forced_cut(base, matches))
+        return self._commit(full, base, matches, cut)
+
+    def _enforce_holdback(self) -> str:
+        if len(self.pending) <= self.max_holdback:
+            return ''
+        full, base, matches = self._matches()
+        return self._commit(full, base, matches, self._forced_cut(base, matches))
+
+    def _forced_cut(self, base: int, matches: List[re.Match]) -> int:
+        self.forced_cuts += 1
+        self._open_at = None
+        cut = len(self.pending) - self.max_holdback // 2
+        for m in matches:
+            start, end = m.start() - base, m.end() - base
+            if start < cut < end:
+                return end
+        return cut
+
+    def flush(self) -> str:
+        full, base, matches = self._matches()
+        self._open_at = None
+        return self._commit(full, base, matches, len(self.pending))
+
+    def bypass(self) -> str:
+        """Stops applying the script; returns the pending input unchanged."""
+        self.bypassed = True
+        self._open_at = None
+        text, self.pending = self.pending, ''
+        return text
+
+    def _commit(self, full: str, base: int, matches: List[re.Match], cut: int) -> str:
+        if cut <= 0:
+            return ''
+        limit = base + cut
+        out: List[str] = []
+        last = base
+        for m in matches:
+            if m.start() >= limit or m.end() > limit:
+                break
+            out.append(full[last:m.start()])
+            out.append(m.expand(self.compiled.replacement))
+            last = m.end()
+        out.append(full[last:limit])
+
+        committed = self.pending[:cut]
+        self.pending = self.pending[cut:]
+        self.context = (self.context + committed)[-CONTEXT_CHARS:]
+        if self._open_at is not None:
+            self._open_at -= cut
+            self._suffix_scanned -= cut
+        return ''.join(out)
+
+
+class StreamingRegexProcessor:
+    """
+    feed() returns the part of the processed output that can no longer change;
+    flush() returns the rest once the stream is finished.
+    """
+
+    def __init__(self, scripts: List[Any], context: Optional[Dict] = None, max_holdback: int = STREAM_MAX_HOLDBACK,
+                 scan: Optional[StreamScan] = None):
+        self.stages: List[_Stage] = []
+        self._scan = scan
+        self._call_started = time.perf_counter()
+        for compiled in scripts:
+            if compiled.flagged:
+                continue
+            pattern = compiled.resolve_pattern(context)
+            if pattern is not None:
+                stage = _Stage(compiled, pattern, max_holdback)
+                if scan is not None:
+                    stage.find = self._budgeted_find(stage)
+                self.stages.append(stage)
+
+    def _budgeted_find(self, stage: _Stage) -> Callable[[str, int], List[re.Match]]:
+        def find(full: str, base: int) -> List[re.Match]:
+            matches = self._scan(stage.compiled, stage.pattern, full, base, self._call_started)
+            if matches is None:
+                raise _StageBypassed()
+            return matches
+        return find
+
+    @property
+    def exact(self) -> bool:
+        """False once a stage had to cut inside its holdback limit."""
+        return not any(stage.forced_cuts for stage in self.stages)
+
+    @property
+    def skipped(self) -> List[str]:
+        """Scripts bypassed because they ran out of time budget."""
+        return [stage.compiled.name or f"#{stage.compiled.ordinal}" for stage in self.stages if stage.bypassed]
+
+    @property
+    def held_chars(self) -> int:
+        return sum(len(stage.pending) for stage in self.stages)
+
+    @property
+    def stream_rules(self) -> Dict[str, str]:
+        return {stage.compiled.name or f"#{stage.compiled.ordinal}": stage.rule.kind for stage in self.stages}
+
+    def feed(self, chunk: str) -> str:
+        self._call_started = time.perf_counter()
+        for stage in self.stages:
+            if stage.bypassed:
+                continue
+            try:
+                chunk = stage.feed(chunk)
+            except _StageBypassed:
+                chunk = stage.bypass()
+            if not chunk:
+                return ''
+        return chunk
+
+    def flush(self) -> str:
+        self._call_started = time.perf_counter()
+        text = ''
+        for stage in self.stages:
+            if stage.bypassed:
+                continue
+            committed = ''
+            try:
+                committed = stage.feed(text)
+                text = committed + stage.flush()
+            except _StageBypassed:
+                text = committed + stage.bypass()
+        return text
+
+
+async def apply_to_events(events: AsyncIterator[Dict[str, Any]],
+                          processor: StreamingRegexProcessor) -> AsyncIterator[Dict[str, Any]]:
+    """Run generation events (delta / done / error) through a streaming processor."""
+    emitted: List[str] = []
+    async for event in events:
+        event_type = event.get("type")
+        if event_type == "delta":
+            text = processor.feed(event.get("text", ""))
+            if text:
+                emitted.append(text)
+                yield {**event, "text": text}
+            continue
+
+        if event_type in ("done", "error"):
+            tail = processor.flush()
+            if tail:
+                emitted.append(tail)
+                yield {"type": "delta", "text": tail}
+            if event_type == "done":
+                event = {**event, "text": "".join(emitted), "regex": {"exact": processor.exact, "skipped": processor.skipped}}
+        yield event
@@ -0,0 +1,171 @@
+"""
+Content-addressed cache of generated responses.
+
+A response is stored under a hash of everything that determines it (provider,
+model, system instruction, formatted history, message and sampling parameters),
+so an identical request is answered without calling the provider. Entries live in
+an in-memory LRU and, when a cache directory is set, in one JSON file per key on
+disk; both tiers expire entries after the TTL. The cache only makes sense for
+deterministic generations, so llm_service uses it for temperature 0 or when a
+request opts in explicitly. Async callers use get_async / put_async, which answer
+memory hits inline and do the disk I/O on a worker thread, off the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_MEMORY_ENTRIES = 256
+
+
+def response_cache_key(payload: Any) -> str:
+    """sha256 of the canonical JSON form of the request fields."""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    cache_dir: directory of the disk tier (None keeps the cache in memory only); it can be
+    assigned after construction, e.g. by app_context once the data directory is known.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        # key -> (expires_at, entry)
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "expired": 0}
+
+    def _path(self, key: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json") if self.cache_dir else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached {"text", "usage"} for key, or None."""
+        now = time.time()
+        entry = self._get_memory(key, now)
+        if entry is not None:
+            return entry
+        return self._get_disk(key, now)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """get for async callers: the disk tier is read on a worker thread."""
+        now = time.time()
+        entry = self._get_memory(key, now)
+        if entry is not None:
+            return entry
+        if not self.cache_dir:
+            return self._miss()
+        return await asyncio.get_running_loop().run_in_executor(None, self._get_disk, key, now)
+
+    def put(self, key: str, text: str, usage: Optional[Dict[str, Any]] = None):
+        self._save(key, *self._store(key, text, usage))
+
+    async def put_async(self, key: str, text: str, usage: Optional[Dict[str, Any]] = None):
+        """put for async callers: the entry file is written on a worker thread."""
+        expires_at, entry = self._store(key, text, usage)
+        if self.cache_dir:
+            await asyncio.get_running_loop().run_in_executor(None, self._save, key, expires_at, entry)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.cache_dir and os.path.isdir(self.cache_dir):
+                for root, _dirs, files in os.walk(self.cache_dir):
+                    for name in files:
+                        if name.endswith(".json"):
+                            os.remove(os.path.join(root, name))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"memory_entries": len(self._memory), "ttl_seconds": self.ttl_seconds, **self._stats}
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is None:
+                return None
+            if cached[0] > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return cached[1]
+            del self._memory[key]
+            self._stats["expired"] += 1
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        loaded = self._load(key, now)
+        if loaded is None:
+            return self._miss()
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._remember_unlocked(key, *loaded)
+        return loaded[1]
+
+    def _miss(self) -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _store(self, key: str, text: str, usage: Optional[Dict[str, Any]]) -> Tuple[float, Dict[str, Any]]:
+        entry = {"text": text, "usage": dict(usage or {})}
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember_unlocked(key, expires_at, entry)
+            self._stats["stores"] += 1
+        return expires_at, entry
+
+    def _remember_unlocked(self, key: str, expires_at: float, entry: Dict[str, Any]):
+        self._memory[key] = (expires_at, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # Disk tier: no lock is held around file I/O (entry files are replaced atomically)
+    def _load(self, key: str, now: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = self._path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            expires_at = float(data["expires_at"])
+            entry = {"text": str(data["text"]), "usage": dict(data.get("usage") or {})}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[ResponseCache] Ignoring unreadable cache entry {path}: {e}")
+            return None
+        if expires_at <= now:
+            with self._lock:
+                self._stats["expired"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return expires_at, entry
+
+    def _save(self, key: str, expires_at: float, entry: Dict[str, Any]):
+        path = self._path(key)
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False,
+                                             prefix=f".{key[:8]}.", suffix=".tmp") as tmp_file:
+                json.dump({"expires_at": expires_at, **entry}, tmp_file, ensure_ascii=False)
+            os.replace(tmp_file.name, path)
+        except OSError as e:
+            print(f"[ResponseCache] Could not persist cache entry: {e}")
+
+
+response_cache = ResponseCache()
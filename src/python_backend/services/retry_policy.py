@@ -0,0 +1,159 @@
+"""
+Shared retry policy for provider calls.
+
+Only failures known to be transient are retried: rate limiting (429), request
+timeouts (408), server errors (500, 502, 503, 504) and connection / timeout errors
+of the HTTP transport. Waits grow exponentially with full jitter; a Retry-After
+header (seconds or HTTP date, or retry-after-ms) from the provider is honoured.
+Every call runs against a deadline: no retry wait is made, and so no further
+attempt is started, that would end past the caller's time budget. An attempt that
+is already running is never cut off by the deadline (long generations legitimately
+take minutes); attempts are bounded by the client timeouts.
+
+The SDK clients are created with their own retries disabled (see client_pool), so
+this is the only retry layer.
+"""
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+from google.genai import errors as genai_errors
+
+logger = logging.getLogger("uvicorn.error")
+
+T = TypeVar("T")
+
+TRANSIENT_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+OVERLOAD_STATUS_CODES = frozenset({429, 503})
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY_SECONDS = 0.5
+DEFAULT_MAX_DELAY_SECONDS = 8.0
+# Retry-After values above this are not waited for
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+# Default retry budgets of the callers (seconds)
+GENERATION_DEADLINE_SECONDS = 180.0
+PROVIDER_CALL_DEADLINE_SECONDS = 30.0
+
+
+class RetryPolicy:
+    __slots__ = ('max_attempts', 'base_delay', 'max_delay')
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay: float = DEFAULT_MAX_DELAY_SECONDS):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Wait before retry number `attempt` (1-based): full jitter over the exponential bound."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    if isinstance(error, genai_errors.APIError):
+        return error.code if isinstance(error.code, int) else None
+    return None
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        # openai.APITimeoutError is an APIConnectionError
+        return True
+    return _status_code(error) in TRANSIENT_STATUS_CODES
+
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Rate limiting, overload or transport timeouts: signs that the provider is at capacity.
+    asyncio.TimeoutError is not among them: it comes from a caller's own deadline.
+    """
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException)):
+        return True
+    return _status_code(error) in OVERLOAD_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Wait requested by the provider through Retry-After / retry-after-ms, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Absolute monotonic deadline for a budget in seconds (None: no deadline)."""
+    return time.monotonic() + seconds if seconds is not None else None
+
+
+def next_retry_wait(policy: RetryPolicy, attempt: int, error: BaseException, deadline: Optional[float]) -> Optional[float]:
+    """Seconds to wait before the next attempt, or None when the error has to be raised."""
+    if attempt >= policy.max_attempts or not is_transient(error):
+        return None
+    wait = policy.backoff(attempt)
+    requested = retry_after_seconds(error)
+    if requested is not None:
+        if requested > MAX_RETRY_AFTER_SECONDS:
+            return None
+        wait = max(wait, requested)
+    if deadline is not None and time.monotonic() + wait >= deadline:
+        return None
+    return wait
+
+
+def _log_retry(description: str, attempt: int, wait: float, error: BaseException):
+    logger.warning("Provider call retry op=%s attempt=%d wait_s=%.2f error=%s", description, attempt, wait, error)
+
+
+def call_with_retry(fn: Callable[[], T], description: str = "provider call",
+                    policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+                    deadline: Optional[float] = None) -> T:
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn()
+        except Exception as error:
+            wait = next_retry_wait(policy, attempt, error, deadline)
+            if wait is None:
+                raise
+            _log_retry(description, attempt, wait, error)
+            time.sleep(wait)
+
+
+async def call_with_retry_async(fn: Callable[[], Awaitable[T]], description: str = "provider call",
+                                policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+                                deadline: Optional[float] = None) -> T:
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return await fn()
+        except Exception as error:
+            wait = next_retry_wait(policy, attempt, error, deadline)
+            if wait is None:
+                raise
+            _log_retry(description, attempt, wait, error)
+            await asyncio.sleep(wait)
@@ -0,0 +1,182 @@
+"""
+Server-side chat sessions.
+
+A session keeps the conversation history, the writing state and the chat config
+of one client conversation, so each turn only has to carry the new message and
+what changed in the state. The most recently used sessions stay in memory. Evicted
+sessions are spilled to disk when a spill directory is configured and transparently
+reloaded on their next use; flush() spills the live ones too (on shutdown), so
+sessions survive a restart.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from services.llm_service import SessionHistory
+
+DEFAULT_MAX_SESSIONS = 64
+_SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def merge_delta(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Recursive merge of a state / config delta: nested dicts are merged, other values replace."""
+    merged = dict(base)
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_delta(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _plain_message(message: Any) -> Dict[str, Any]:
+    if isinstance(message, dict):
+        role, parts = message.get("role"), message.get("parts") or []
+    else:
+        role, parts = getattr(message, "role", None), getattr(message, "parts", None) or []
+    return {"role": str(role or ""), "parts": [dict(part) for part in parts]}
+
+
+class ChatSession:
+    __slots__ = ('session_id', 'history', 'state', 'config', 'updated_at', '_state_model', '_state_model_type')
+
+    def __init__(self, session_id: str, history: Optional[List[Any]] = None,
+                 state: Optional[Dict[str, Any]] = None, config: Optional[Dict[str, Any]] = None):
+        self.session_id = session_id
+        self.history = SessionHistory(_plain_message(message) for message in history or [])
+        self.state: Dict[str, Any] = dict(state or {})
+        self.config: Dict[str, Any] = dict(config or {})
+        self.updated_at = time.time()
+        self._state_model = None
+        self._state_model_type = None
+
+    def apply_delta(self, state: Optional[Dict[str, Any]] = None, config: Optional[Dict[str, Any]] = None):
+        if state:
+            self.state = merge_delta(self.state, state)
+            self._state_model = None
+        if config:
+            self.config = merge_delta(self.config, config)
+        self.updated_at = time.time()
+
+    def state_as(self, model_type: Any) -> Any:
+        """The state validated as model_type; revalidated only after the state changed."""
+        if self._state_model is None or self._state_model_type is not model_type:
+            self._state_model = model_type(**self.state)
+            self._state_model_type = model_type
+        return self._state_model
+
+    def append_turn(self, user_text: str, model_text: str):
+        self.history.append({"role": "user", "parts": [{"text": user_text}]})
+        self.history.append({"role": "model", "parts": [{"text": model_text}]})
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "history": list(self.history),
+            "state": self.state,
+            "config": self.config,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ChatSession':
+        session = cls(data["session_id"], data.get("history"), data.get("state"), data.get("config"))
+        session.updated_at = float(data.get("updated_at") or time.time())
+        return session
+
+
+class SessionStore:
+    """LRU of chat sessions with optional disk spill of evicted sessions."""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, spill_dir: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.spill_dir = spill_dir
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def create(self, state: Optional[Dict[str, Any]] = None, config: Optional[Dict[str, Any]] = None,
+               history: Optional[List[Any]] = None) -> ChatSession:
+        session = ChatSession(uuid.uuid4().hex, history, state, config)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._evict_unlocked()
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        if not _SESSION_ID_PATTERN.match(session_id or ""):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+
+            session = self._load_spilled_unlocked(session_id)
+            if session is not None:
+                self._sessions[session_id] = session
+                self._evict_unlocked()
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        if not _SESSION_ID_PATTERN.match(session_id or ""):
+            return False
+        with self._lock:
+            removed = self._sessions.pop(session_id, None) is not None
+            spill_path = self._spill_path(session_id)
+            if spill_path and os.path.exists(spill_path):
+                os.remove(spill_path)
+                removed = True
+            return removed
+
+    def flush(self) -> int:
+        """Writes every in-memory session to the spill directory (they stay in memory). Returns the count."""
+        if not self.spill_dir:
+            return 0
+        with self._lock:
+            for session in self._sessions.values():
+                self._spill_unlocked(session)
+            return len(self._sessions)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _spill_path(self, session_id: str) -> Optional[str]:
+        return os.path.join(self.spill_dir, f"{session_id}.json") if self.spill_dir else None
+
+    def _evict_unlocked(self):
+        while len(self._sessions) > self.max_sessions:
+            _, session = self._sessions.popitem(last=False)
+            self._spill_unlocked(session)
+
+    def _spill_unlocked(self, session: ChatSession):
+        spill_path = self._spill_path(session.session_id)
+        if not spill_path:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.spill_dir, delete=False,
+                                             prefix=f".{session.session_id}.", suffix=".tmp") as tmp_file:
+                json.dump(session.to_dict(), tmp_file, ensure_ascii=False)
+            os.replace(tmp_file.name, spill_path)
+        except OSError as e:
+            print(f"[SessionStore] Could not spill session {session.session_id}: {e}")
+
+    def _load_spilled_unlocked(self, session_id: str) -> Optional[ChatSession]:
+        spill_path = self._spill_path(session_id)
+        if not spill_path or not os.path.exists(spill_path):
+            return None
+        try:
+            with open(spill_path, "r", encoding="utf-8") as f:
+                session = ChatSession.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[SessionStore] Could not load spilled session {session_id}: {e}")
+            return None
+        os.remove(spill_path)
+        return session
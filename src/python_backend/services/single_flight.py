@@ -0,0 +1,109 @@
+"""
+Single-flight coalescing of identical concurrent operations.
+
+While an operation for a key is running, further callers with the same key do not
+start their own: they wait for the running one and receive its result, or its
+exception. Nothing is kept once the operation finished, so this only collapses
+duplicates that overlap in time (a double-fired request, several windows loading
+the same model list); caching results is left to the callers.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """For blocking calls made from worker threads (sync FastAPI routes)."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["calls"] += 1
+            else:
+                self._stats["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._calls), **self._stats}
+
+
+class AsyncSingleFlight:
+    """For coroutines; calls are only shared within one event loop."""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], "asyncio.Future[Any]"] = {}
+        self._stats = {"calls": 0, "shared": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        while True:
+            future = self._calls.get(flight_key)
+            if future is None:
+                break
+            self._stats["shared"] += 1
+            try:
+                # shield: a cancelled waiter must not cancel the shared call
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leading caller was cancelled; run the operation ourselves
+                self._stats["shared"] -= 1
+
+        future = loop.create_future()
+        self._calls[flight_key] = future
+        self._stats["calls"] += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(flight_key, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), **self._stats}
@@ -0,0 +1,55 @@
+"""
+Provider-independent token estimates for budgeting prompts.
+
+No tokenizer is bundled: CJK characters are counted as one token each (close to
+what Gemini / GPT-4o tokenizers produce for Chinese prose) and everything else as
+one token per CHARS_PER_TOKEN characters. Estimates are meant for budgets and
+previews, not for billing.
+"""
+import math
+import re
+from typing import Any, Iterable
+
+CHARS_PER_TOKEN = 4
+# Per-message overhead (role markers / separators) added by chat formats.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Kana, CJK ideographs (incl. extension A / compatibility), Hangul and full-width forms
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(parts: Iterable[Any]) -> int:
+    """Estimate one chat message given its parts ({"text": ...} dicts or objects with .text)."""
+    total = MESSAGE_OVERHEAD_TOKENS
+    for part in parts:
+        text = part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+        total += estimate_tokens(text or "")
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    Longest prefix (keep="head") or suffix (keep="tail") of text whose estimate fits max_tokens.
+    The estimate is monotonic in the slice length, so the cut is found by bisection.
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        piece = text[:middle] if keep == "head" else text[len(text) - middle:]
+        if estimate_tokens(piece) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] if keep == "head" else text[len(text) - low:]
@@ -11,6 +11,33 @@ export interface RegexScript {
     promptOnly?: boolean;
 }
 
+// Normalised script from GET /api/regex/bundle (flags split out, JS replacement syntax)
+export interface RegexBundleScript {
+    scriptName: string;
+    source: string;
+    flags: string;
+    replacement: string;
+    placement: number[];
+    disabled: boolean;
+    markdownOnly: boolean;
+    promptOnly: boolean;
+    minDepth: number | null;
+    maxDepth: number | null;
+    macros: string[];
+    error: string | null;
+}
+
+export interface RegexBundle {
+    version: string;
+    scripts: RegexBundleScript[];
+    byPlacement: Record<string, number[]>;
+}
+
+interface CompiledDisplayScript {
+    script: RegexBundleScript;
+    regex: RegExp;
+}
+
 // Regex Placement Enums (Matching Backend)
 export enum RegexPlacement {
     MD_DISPLAY = 0,
@@ -22,7 +49,9 @@ export enum RegexPlacement {
 }
 
 export class RegexDisplayService {
-    private scripts: RegexScript[] = [];
+    private bundle: RegexBundle | null = null;
+    private compiled: CompiledDisplayScript[] = [];
+    private etag: string | null = null;
     private appConfig: AppConfig;
     private hasLoaded: boolean = false;
 
@@ -31,29 +60,35 @@ export class RegexDisplayService {
     }
 
     /**
-     * Fetch scripts from Backend API
+     * Fetch the script bundle from Backend API.
+     * Revalidates with the last ETag; scripts are only downloaded and recompiled when they changed.
      */
     async loadScripts() {
         try {
             const { port, token } = this.appConfig;
             const baseUrl = `http://127.0.0.1:${port}`;
-            // Placement 0-6 allow all, but we specifically care about display-relevant ones.
-            // Filter is handled in processText mostly, or we can ask backend for all.
-            // Let's ask for all to cache them.
-            const url = `${baseUrl}/api/settings/regex/scripts`;
-
-            const response = await fetch(url, {
-                method: 'GET',
-                headers: {
-                    'Authorization': token || ''
-                }
-            });
+            const url = `${baseUrl}/api/regex/bundle`;
+
+            const headers: Record<string, string> = {
+                'Authorization': token || ''
+            };
+            if (this.etag && this.hasLoaded) {
+                headers['If-None-Match'] = this.etag;
+            }
+
+            const response = await fetch(url, { method: 'GET', headers });
+
+            if (response.status === 304) {
+                return;
+            }
 
             if (response.ok) {
-                const data = await response.json();
-                this.scripts = data.scripts || [];
+                const bundle: RegexBundle = await response.json();
+                this.bundle = bundle;
+                this.compiled = this.compileBundle(bundle);
+                this.etag = response.headers.get('ETag');
                 this.hasLoaded = true;
-                console.log(`[RegexDisplayService] Loaded ${this.scripts.length} scripts.`);
+                console.log(`[RegexDisplayService] Loaded ${bundle.scripts.length} scripts (version ${bundle.version}).`);
             } else {
                 console.error('[RegexDisplayService] Failed to load scripts:', response.statusText);
             }
@@ -62,6 +97,28 @@ export class RegexDisplayService {
         }
     }
 
+    /**
+     * Compile every display-relevant script once per bundle version.
+     * Display processing mimics ST `getRegexedString(..., isMarkdown=true)`:
+     * promptOnly scripts never apply to what the user sees.
+     */
+    private compileBundle(bundle: RegexBundle): CompiledDisplayScript[] {
+        const compiled: CompiledDisplayScript[] = [];
+        for (const script of bundle.scripts) {
+            if (script.promptOnly || !script.source) continue;
+            try {
+                compiled.push({ script, regex: new RegExp(script.source, script.flags) });
+            } catch (err) {
+                console.warn(`[Regex] Script ${script.scriptName} failed to compile:`, err);
+            }
+        }
+        return compiled;
+    }
+
+    get version(): string | null {
+        return this.bundle?.version ?? null;
+    }
+
     /**
      * Apply display regexes to the text
      * @param text Original text
@@ -73,11 +130,11 @@ export class RegexDisplayService {
 
         let processed = text;
 
-        for (const script of this.scripts) {
+        for (const { script, regex } of this.compiled) {
             // Priority: overrides > script.disabled > default enabled
             // overrides map contains: scriptName -> isEnabled (true = enabled)
             const scriptName = script.scriptName;
-            let isDisabled = script.disabled ?? false;
+            let isDisabled = script.disabled;
 
             if (overrides && scriptName && scriptName in overrides) {
                 // Frontend sends isEnabled, so invert to get isDisabled
@@ -86,67 +143,10 @@ export class RegexDisplayService {
 
             if (isDisabled) continue;
 
-            // Check placement: We are doing "Display" processing.
-            // In JS frontend, we usually care if:
-            // 1. It is a dedicated Display script (markdownOnly = true usually implies display)
-            // 2. Or placement includes MD_DISPLAY (0) ?? ST code uses 'isMarkdown' flag passed to getRegexedString.
-            // If we are strictly doing "Markdown/Display" processing here for the UI:
-            // We should apply if script.markdownOnly is true OR if it's meant for output processing that serves display?
-            // Actually ST logic: if (script.markdownOnly && !isMarkdown) return false;
-            // So if isMarkdown is true (which it is here), we apply unless input-only?
-            // Let's stick to: Apply if (markdownOnly) OR (placement includes AI_OUTPUT for received msg?) via logic?
-
-            // Simpler approach for now:
-            // Since backend already processed Prompt regexes (USER_INPUT), we don't apply those here to "User Message" display 
-            // unless we want to show the 'cleaned' version? Usually user wants to see what they typed.
-            // So for User Messages in UI -> Apply nothing or only 'MD_DISPLAY'?
-
-            // Let's assume this function is called for AI Messages specifically? 
-            // Or we pass a context/role?
-
-            // For now, let's blindly apply scripts that have `markdownOnly: true` 
-            // OR correspond to AI_OUTPUT if we assume text is AI output?
-            // To be safe and mimic ST "Display" mode:
-            // We apply logic similar to `getRegexedString(..., isMarkdown=true)`
-
-            // If `promptOnly` is true, we SKIP (since this is display).
-            if (script.promptOnly) continue;
-
-            // If `markdownOnly` is true, we APPLY. (Display specific)
-            // If neither, it's general... check placement?
-
-            // For simplicity in this `localapp`, let's just apply `markdownOnly` scripts 
-            // and maybe `AI_OUTPUT` ones if we consider this render pipeline part of output?
-            // Let's stick to logic: If (markdownOnly) -> Apply. 
-            // If (AI_OUTPUT) -> Apply? (Previously ST backend applies AI_OUTPUT regex to the text stored in history? No)
-            // ST applies AI_OUTPUT usually to the received chunk?
-
-            // Let's start conservative: Apply all scripts where `markdownOnly == true`.
-            // And also scripts where placement includes AI_OUTPUT if this is AI text?
-            // But we don't know text source here purely.
-            // Let's simply apply everything that is NOT `promptOnly` and NOT `disabled`.
-            // (This might be too aggressive, but ST `isMarkdown=true` is aggressive).
-
-            // 3. Compile Regex
             try {
-                let patternStr = script.findRegex;
-                let flags = 'gm'; // Default ST flags
-
-                // Parse /pattern/flags
-                if (patternStr.startsWith('/') && patternStr.lastIndexOf('/') > 0) {
-                    const lastSlash = patternStr.lastIndexOf('/');
-                    flags = patternStr.substring(lastSlash + 1);
-                    patternStr = patternStr.substring(1, lastSlash);
-                }
-
-                const regex = new RegExp(patternStr, flags);
-
-                // 4. Replace
-                // ST `replaceString` uses $1 $2 which JS replace supports naturally.
-                // But if replaceString is not a function, we pass it directly.
-
-                processed = processed.replace(regex, script.replaceString || '');
-
+                // Global regexes keep lastIndex state between calls
+                regex.lastIndex = 0;
+                processed = processed.replace(regex, script.replacement);
             } catch (err) {
                 console.warn(`[Regex] Script ${script.scriptName} failed:`, err);
             }
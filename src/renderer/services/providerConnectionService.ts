@@ -28,6 +28,7 @@ export interface ProviderModelsResponse {
   ok: boolean;
   models: string[];
   count?: number;
+  cached?: boolean;
 }
 
 export interface ProviderConfigSnapshot {
@@ -194,10 +195,13 @@ export const getGoogleProviderModels = async (
 
 export const getProviderModels = async (
   appConfig: AppConfig | null,
-  providerId: ProviderId
+  providerId: ProviderId,
+  options: { refresh?: boolean } = {}
 ): Promise<ProviderModelsResponse> => {
   const baseUrl = getBackendBaseUrl(appConfig);
-  const response = await fetch(`${baseUrl}/api/providers/${providerId}/models`, {
+  // The backend caches model lists for a few minutes; refresh bypasses that cache
+  const query = options.refresh ? '?refresh=true' : '';
+  const response = await fetch(`${baseUrl}/api/providers/${providerId}/models${query}`, {
     method: 'GET',
     headers: getHeaders(appConfig)
   });
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+from openai import OpenAI
+
+from provider_stub import ProviderStubServer
+from services.providers import client_pool, openai_compatible_provider
+
+REQUESTS = 30
+# Simulated per-connection setup cost (TCP + TLS handshake to a remote provider).
+HANDSHAKE_DELAY = 0.02
+
+
+def _time_requests(call) -> float:
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        call()
+    return time.perf_counter() - started
+
+
+@pytest.mark.benchmark
+def test_pooled_clients_skip_per_request_connection_setup():
+    with ProviderStubServer(handshake_delay=HANDSHAKE_DELAY) as stub:
+        def _fresh_client_call():
+            client = OpenAI(api_key='bench-key', base_url=stub.base_url)
+            try:
+                list(client.models.list())
+            finally:
+                client.close()
+
+        fresh_seconds = _time_requests(_fresh_client_call)
+        fresh_connections = stub.connections
+
+        openai_compatible_provider.save_config(api_key='bench-key', api_base_url=stub.base_url)
+        stub.connections = 0
+        pooled_seconds = _time_requests(openai_compatible_provider.list_models)
+        pooled_connections = stub.connections
+        client_pool.invalidate('openai-compatible')
+
+    print(
+        f"\n[client-pool] {REQUESTS} requests: fresh={fresh_seconds * 1000:.1f}ms "
+        f"({fresh_connections} connections) pooled={pooled_seconds * 1000:.1f}ms "
+        f"({pooled_connections} connections)"
+    )
+
+    assert fresh_connections == REQUESTS
+    assert pooled_connections == 1
+    assert pooled_seconds < fresh_seconds - (REQUESTS - 2) * HANDSHAKE_DELAY * 0.8
@@ -0,0 +1,120 @@
+import json
+import re
+import time
+
+import pytest
+
+from services.regex_engine import RegexEngine, RegexPlacement
+
+SCRIPT_COUNTS = [10, 100, 1000]
+ROUNDS = 3
+# Roughly one long chapter of mixed CJK / ASCII prose.
+CHAPTER_TEXT = ('他推开门，看见 apple 与 banana 散落在桌上。<think>reasoning</think>\n' * 400)
+
+
+def _build_scripts(count):
+    scripts = []
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            find_regex = f'/word{index}/gi'
+        elif kind == 1:
+            find_regex = f'/<tag{index}>[\\s\\S]*?<\\/tag{index}>/g'
+        elif kind == 2:
+            find_regex = f'/(item{index})\\s+(\\d+)/g'
+        else:
+            find_regex = f'^prefix{index}.*$'
+        scripts.append({
+            'scriptName': f'script-{index}',
+            'findRegex': find_regex,
+            'replaceString': f'R{index}',
+            'placement': [RegexPlacement.AI_OUTPUT],
+        })
+    return scripts
+
+
+def _legacy_process_string(scripts, text):
+    """The pre-compilation algorithm: parse and re.sub every script on every call."""
+    for script in scripts:
+        pattern_str = script['findRegex']
+        flags = 0
+        if pattern_str.startswith('/') and pattern_str.rfind('/') > 0:
+            last_slash = pattern_str.rfind('/')
+            flags_str = pattern_str[last_slash + 1:]
+            if 'i' in flags_str: flags |= re.IGNORECASE
+            if 'm' in flags_str: flags |= re.MULTILINE
+            if 's' in flags_str: flags |= re.DOTALL
+            pattern_str = pattern_str[1:last_slash]
+        else:
+            flags = re.MULTILINE
+        text = re.sub(pattern_str, script['replaceString'].replace('$', '\\'), text, flags=flags)
+    return text
+
+
+def _best_of(call):
+    best = float('inf')
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('script_count', SCRIPT_COUNTS)
+def test_process_string_with_precompiled_scripts(tmp_path, script_count):
+    scripts = _build_scripts(script_count)
+    (tmp_path / 'bench.json').write_text(json.dumps(scripts), encoding='utf-8')
+    engine = RegexEngine(str(tmp_path))
+
+    expected = _legacy_process_string(scripts, CHAPTER_TEXT)
+    assert engine.process_string(CHAPTER_TEXT, RegexPlacement.AI_OUTPUT) == expected
+
+    re.purge()
+    legacy_seconds = _best_of(lambda: _legacy_process_string(scripts, CHAPTER_TEXT))
+    compiled_seconds = _best_of(lambda: engine.process_string(CHAPTER_TEXT, RegexPlacement.AI_OUTPUT))
+
+    print(
+        f"\n[regex-engine] scripts={script_count} chars={len(CHAPTER_TEXT)} "
+        f"legacy={legacy_seconds * 1000:.1f}ms compiled={compiled_seconds * 1000:.1f}ms"
+    )
+    if script_count >= 1000:
+        # Beyond re's internal cache the legacy path recompiles every pattern on each call.
+        assert compiled_seconds < legacy_seconds
+
+
+def _build_literal_scripts(count):
+    # Display-style collection: many plain word replacements.
+    return [
+        {
+            'scriptName': f'literal-{index}',
+            'findRegex': f'/w{index:04d}x/g' if index % 2 else f'/W{index:04d}X/gi',
+            'replaceString': '【' + '甲乙丙丁戊己庚'[index % 7] + '】',
+            'placement': [RegexPlacement.AI_OUTPUT],
+        }
+        for index in range(count)
+    ]
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('script_count', SCRIPT_COUNTS)
+def test_process_string_with_merged_literal_scripts(tmp_path, script_count):
+    scripts = _build_literal_scripts(script_count)
+    (tmp_path / 'bench.json').write_text(json.dumps(scripts), encoding='utf-8')
+    engine = RegexEngine(str(tmp_path))
+    text = ' '.join(f'w{index % script_count:04d}x 他推开门' for index in range(2000))
+
+    engine.merge_literal_scripts = False
+    expected = engine.process_string(text, RegexPlacement.AI_OUTPUT)
+    sequential_seconds = _best_of(lambda: engine.process_string(text, RegexPlacement.AI_OUTPUT))
+
+    engine.merge_literal_scripts = True
+    assert engine.process_string(text, RegexPlacement.AI_OUTPUT) == expected
+    merged_seconds = _best_of(lambda: engine.process_string(text, RegexPlacement.AI_OUTPUT))
+
+    print(
+        f"\n[regex-engine] literal scripts={script_count} chars={len(text)} "
+        f"sequential={sequential_seconds * 1000:.1f}ms merged={merged_seconds * 1000:.1f}ms"
+    )
+    if script_count >= 100:
+        assert merged_seconds < sequential_seconds
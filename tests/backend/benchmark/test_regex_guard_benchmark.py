@@ -0,0 +1,61 @@
+import json
+import time
+
+import pytest
+
+from services.regex_engine import HARD_TIMEOUT_AVAILABLE, OVER_BUDGET_STRIKES, RegexEngine, RegexPlacement, budget_scale
+
+# Known catastrophic-backtracking shapes seen in imported SillyTavern collections.
+# (name, findRegex, builder, size without the `regex` module, size with it)
+# Without the `regex` module a running match cannot be interrupted (and is only
+# flagged after OVER_BUDGET_STRIKES slow runs), so the sizes are kept small enough
+# for a few slow runs; with it the inputs are truly pathological.
+PATHOLOGICAL_CORPUS = [
+    ('nested-plus', '/(a+)+$/g', lambda n: 'a' * n + 'b', 22, 40),
+    ('word-run', '/(\\w+\\s?)+$/g', lambda n: 'w' * n + '!', 21, 40),
+    ('overlapping-alternation', '/(x+x+)+y/g', lambda n: 'x' * n, 22, 40),
+    ('ambiguous-alternation', '/(a|aa)+$/g', lambda n: 'a' * n + 'b', 30, 40),
+    ('unterminated-lazy-block', '/<think>[\\s\\S]*?<\\/think>/g', lambda n: '<think>' * n, 3000, 40000),
+]
+# Shapes the `regex` module matches without catastrophic backtracking
+REGEX_MODULE_LINEAR = {'nested-plus', 'word-run', 'overlapping-alternation'}
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('name, find_regex, builder, soft_size, hard_size', PATHOLOGICAL_CORPUS)
+def test_pathological_script_is_bounded_and_skipped(tmp_path, name, find_regex, builder, soft_size, hard_size):
+    if HARD_TIMEOUT_AVAILABLE and name in REGEX_MODULE_LINEAR:
+        pytest.skip('not pathological for the regex module')
+    scripts = [
+        {'scriptName': name, 'findRegex': find_regex, 'replaceString': '', 'placement': [RegexPlacement.AI_OUTPUT]},
+        {'scriptName': 'after', 'findRegex': '/$/g', 'replaceString': '.', 'placement': [RegexPlacement.AI_OUTPUT]},
+    ]
+    (tmp_path / 'corpus.json').write_text(json.dumps(scripts), encoding='utf-8')
+    engine = RegexEngine(str(tmp_path))
+    engine.script_time_budget_ms = 100
+    text = builder(hard_size if HARD_TIMEOUT_AVAILABLE else soft_size)
+
+    started = time.perf_counter()
+    engine.process_string(text, RegexPlacement.AI_OUTPUT)
+    first_ms = (time.perf_counter() - started) * 1000
+    if not HARD_TIMEOUT_AVAILABLE:
+        for _ in range(OVER_BUDGET_STRIKES - 1):
+            engine.process_string(text, RegexPlacement.AI_OUTPUT)
+
+    started = time.perf_counter()
+    second = engine.process_string(text, RegexPlacement.AI_OUTPUT)
+    second_ms = (time.perf_counter() - started) * 1000
+
+    stats = {entry['scriptName']: entry for entry in engine.get_script_stats()['scripts']}
+    print(
+        f"\n[regex-guard] {name} chars={len(text)} hard_timeout={HARD_TIMEOUT_AVAILABLE} "
+        f"first={first_ms:.0f}ms second={second_ms:.1f}ms flagged={stats[name]['flagged']}"
+    )
+    assert stats[name]['flagged'] is not None
+    assert stats['after']['flagged'] is None
+    # The offending script is skipped; the scripts after it still run.
+    assert second == text + '.'
+    budget_ms = engine.script_time_budget_ms * budget_scale(text)
+    assert second_ms < budget_ms
+    if HARD_TIMEOUT_AVAILABLE:
+        assert first_ms < budget_ms * 3
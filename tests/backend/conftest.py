@@ -1,4 +1,6 @@
+import os
 import sys
+import tempfile
 from pathlib import Path
 
 import pytest
@@ -8,7 +10,11 @@ BACKEND_DIR = Path(__file__).resolve().parents[2] / 'src' / 'python_backend'
 if str(BACKEND_DIR) not in sys.path:
     sys.path.insert(0, str(BACKEND_DIR))
 
+# Keep presets / regex scripts created by tests out of the real data directory.
+os.environ.setdefault('LOCALAPP_DATA_DIR', tempfile.mkdtemp(prefix='localapp-test-data-'))
+
 from main import app  # noqa: E402
+from provider_stub import ProviderStubServer  # noqa: E402
 
 
 @pytest.fixture(autouse=True)
@@ -23,3 +29,9 @@ def isolated_provider_store(monkeypatch, tmp_path):
 def client():
     with TestClient(app) as test_client:
         yield test_client
+
+
+@pytest.fixture
+def provider_stub():
+    with ProviderStubServer() as stub:
+        yield stub
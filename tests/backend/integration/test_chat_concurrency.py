@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import httpx
+
+from main import app
+from services import llm_service
+
+GENERATION_SECONDS = 0.3
+CONCURRENT_REQUESTS = 8
+
+
+def _short_payload(message: str) -> dict:
+    return {
+        'history': [],
+        'message': message,
+        'state': {
+            'novel_path': '/tmp/novel',
+            'current_node': {'id': 'root', 'type': 'ROOT', 'title': 'Novel'},
+            'novel_outline': 'outline',
+        },
+        'config': {'provider': 'google', 'model': 'gemini-test'},
+    }
+
+
+async def _slow_generation(**kwargs):
+    await asyncio.sleep(GENERATION_SECONDS)
+    return f"reply:{kwargs['message']}"
+
+
+async def _fire_concurrent_chats():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+        requests = []
+        for index in range(CONCURRENT_REQUESTS):
+            if index % 3 == 0:
+                requests.append(client.post('/api/chat/short', json=_short_payload(f'm{index}')))
+            elif index % 3 == 1:
+                requests.append(client.post('/api/chat/long', json={
+                    'history': [],
+                    'message': f'm{index}',
+                    'state': {},
+                    'config': {'provider': 'google'},
+                }))
+            else:
+                requests.append(client.post('/api/chat', json={
+                    'history': [],
+                    'message': f'm{index}',
+                    'config': {'provider': 'google'},
+                }))
+
+        async def _health_while_busy():
+            await asyncio.sleep(GENERATION_SECONDS / 3)
+            started = time.perf_counter()
+            response = await client.get('/api/health')
+            return response, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*requests, _health_while_busy())
+        elapsed = time.perf_counter() - started
+        return results[:-1], results[-1], elapsed
+
+
+def test_concurrent_chat_requests_do_not_serialize(monkeypatch):
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _slow_generation)
+
+    responses, (health_response, health_latency), elapsed = asyncio.run(_fire_concurrent_chats())
+
+    assert [response.status_code for response in responses] == [200] * CONCURRENT_REQUESTS
+    assert [response.json()['text'] for response in responses] == [
+        f'reply:m{index}' for index in range(CONCURRENT_REQUESTS)
+    ]
+    # Sequential execution would take CONCURRENT_REQUESTS * GENERATION_SECONDS.
+    assert elapsed < GENERATION_SECONDS * 2
+    assert health_response.status_code == 200
+    assert health_latency < GENERATION_SECONDS
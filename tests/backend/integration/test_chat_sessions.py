@@ -0,0 +1,93 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from services import llm_service
+
+STATE = {
+    'novel_path': '/tmp/novel',
+    'current_node': {'id': 'c1', 'type': 'CHAPTER', 'title': 'Chapter 1', 'content': 'existing text'},
+    'novel_outline': 'outline',
+}
+
+
+def _create_session(client, **payload):
+    response = client.post('/api/chat/sessions', json={'state': STATE, 'config': {'provider': 'google'}, **payload})
+    assert response.status_code == 200
+    return response.json()['session_id']
+
+
+def test_session_chat_sends_only_new_message(client: TestClient, monkeypatch):
+    calls = []
+
+    async def _capturing_generation(**kwargs):
+        # The session history keeps growing after the call; record what was sent
+        calls.append({**kwargs, 'history': list(kwargs['history'])})
+        return f'reply {len(calls)}'
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _capturing_generation)
+    session_id = _create_session(client)
+
+    first = client.post(f'/api/chat/sessions/{session_id}/short', json={'message': 'first'})
+    second = client.post(f'/api/chat/sessions/{session_id}/short', json={
+        'message': 'second',
+        'state': {'current_node': {'content': 'edited text'}},
+    })
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json()['text'] == 'reply 1'
+    assert second.json()['session']['messages'] == 4
+    assert [message['parts'][0]['text'] for message in calls[1]['history']] == ['first', 'reply 1']
+    assert 'edited text' in calls[1]['system_instruction']
+    assert 'context_budget' in second.json()['meta']
+
+    session = client.get(f'/api/chat/sessions/{session_id}').json()
+    assert session['state']['current_node'] == {**STATE['current_node'], 'content': 'edited text'}
+
+
+def test_session_stream_records_turn_on_done(client: TestClient, monkeypatch):
+    async def _fake_stream(**kwargs):
+        for piece in ['第一', '章']:
+            yield piece
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _fake_stream)
+    session_id = _create_session(client, history=[{'role': 'user', 'parts': [{'text': 'earlier'}]},
+                                                  {'role': 'model', 'parts': [{'text': 'ok'}]}])
+
+    response = client.post(f'/api/chat/sessions/{session_id}/short/stream', json={'message': 'write'})
+
+    events = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    assert events[-1]['type'] == 'done'
+    assert events[-1]['session']['messages'] == 4
+    assert 'context_budget' in events[-1]['meta']
+    history = client.get(f'/api/chat/sessions/{session_id}').json()['history']
+    assert history[-2:] == [{'role': 'user', 'parts': [{'text': 'write'}]},
+                            {'role': 'model', 'parts': [{'text': '第一章'}]}]
+
+
+def test_failed_generation_is_not_recorded(client: TestClient):
+    session_id = _create_session(client, config={'provider': 'openai', 'model': 'gpt-test', 'base_url': 'http://127.0.0.1:9'})
+
+    response = client.post(f'/api/chat/sessions/{session_id}/short', json={'message': 'hi'})
+
+    assert response.status_code == 200
+    assert response.json()['text'].startswith(llm_service.ERROR_RESPONSE_PREFIX)
+    assert response.json()['session']['messages'] == 0
+
+
+def test_invalid_state_delta_is_rejected(client: TestClient):
+    session_id = _create_session(client)
+
+    response = client.patch(f'/api/chat/sessions/{session_id}', json={'state': {'current_node': {'type': 'NOPE'}}})
+
+    assert response.status_code == 422
+    assert client.get(f'/api/chat/sessions/{session_id}').json()['state'] == STATE
+
+
+def test_session_lifecycle(client: TestClient):
+    assert client.post('/api/chat/sessions', json={'state': {}}).status_code == 422
+    session_id = _create_session(client)
+
+    assert client.delete(f'/api/chat/sessions/{session_id}').status_code == 200
+    assert client.get(f'/api/chat/sessions/{session_id}').status_code == 404
+    assert client.post(f'/api/chat/sessions/{session_id}/short', json={'message': 'hi'}).status_code == 404
@@ -0,0 +1,179 @@
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+from app_context import regex_engine
+from services import llm_service
+
+
+async def _fake_google_stream(**kwargs):
+    for piece in ['第一', '章', '正文']:
+        yield piece
+
+
+def _read_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def test_short_stream_endpoint_emits_ndjson(client: TestClient, monkeypatch):
+    captured = {}
+
+    async def _capturing_stream(**kwargs):
+        captured.update(kwargs)
+        async for piece in _fake_google_stream():
+            yield piece
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _capturing_stream)
+
+    response = client.post('/api/chat/short/stream', json={
+        'history': [],
+        'message': 'write',
+        'state': {
+            'novel_path': '/tmp/novel',
+            'current_node': {'id': 'c1', 'type': 'CHAPTER', 'title': 'Chapter 1', 'content': 'existing text'},
+            'novel_outline': 'outline',
+            'active_task': {'type': 'CONTENT', 'node_id': 'c1', 'field': 'content'},
+        },
+        'config': {'provider': 'google', 'model': 'gemini-test'},
+    })
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    events = _read_ndjson(response)
+    assert [event['type'] for event in events] == ['delta', 'delta', 'delta', 'done']
+    assert events[-1]['text'] == '第一章正文'
+    assert events[-1]['metrics']['ttft_ms'] is not None
+    assert 'existing text' in captured['system_instruction']
+
+
+def test_long_and_legacy_stream_endpoints(client: TestClient, monkeypatch):
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _fake_google_stream)
+
+    long_response = client.post('/api/chat/long/stream', json={
+        'history': [], 'message': 'hi', 'state': {}, 'config': {'provider': 'google'},
+    })
+    legacy_response = client.post('/api/chat/stream', json={
+        'history': [], 'message': 'hi', 'context': 'ctx', 'config': {'provider': 'google'},
+    })
+
+    for response in (long_response, legacy_response):
+        assert response.status_code == 200
+        assert _read_ndjson(response)[-1]['text'] == '第一章正文'
+
+
+def test_stream_endpoint_reports_missing_key_as_error_event(client: TestClient):
+    response = client.post('/api/chat/stream', json={
+        'history': [], 'message': 'hi', 'config': {'provider': 'deepseek'},
+    })
+
+    assert response.status_code == 200
+    events = _read_ndjson(response)
+    assert events == [{
+        'type': 'error',
+        'message': 'Error generation response: API key is not configured for provider: deepseek',
+        'metrics': events[0]['metrics'],
+    }]
+
+
+def test_stream_applies_output_regex_when_requested(client: TestClient, monkeypatch):
+
+    async def _thinking_stream(**kwargs):
+        for piece in ['<think>plan', ' more</think>第一', '章 apple', '正文']:
+            yield piece
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _thinking_stream)
+    script_path = f'{regex_engine.scripts_dir}/stream_test.json'
+    with open(script_path, 'w', encoding='utf-8') as f:
+        json.dump([
+            {'scriptName': 'think', 'findRegex': '/<think>[\\s\\S]*?<\\/think>/g', 'replaceString': '', 'placement': [2]},
+            {'scriptName': 'fruit', 'findRegex': '/apple/g', 'replaceString': '苹果', 'placement': [2]},
+        ], f)
+    regex_engine.reload_scripts()
+    try:
+        response = client.post('/api/chat/stream', json={
+            'history': [], 'message': 'hi', 'config': {'provider': 'google', 'regex': {'placement': 2}},
+        })
+    finally:
+        os.remove(script_path)
+        regex_engine.reload_scripts()
+
+    events = _read_ndjson(response)
+    deltas = ''.join(event['text'] for event in events if event['type'] == 'delta')
+    assert 'plan' not in deltas
+    assert deltas == '第一章 苹果正文'
+    assert events[-1]['type'] == 'done'
+    assert events[-1]['text'] == '第一章 苹果正文'
+    assert events[-1]['regex'] == {'exact': True, 'skipped': []}
+
+
+def test_stream_applies_prompt_regex_to_history_and_message(client: TestClient, monkeypatch):
+    captured = {}
+
+    async def _capturing_stream(**kwargs):
+        captured.update(kwargs)
+        async for piece in _fake_google_stream():
+            yield piece
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _capturing_stream)
+    script_path = f'{regex_engine.scripts_dir}/prompt_test.json'
+    with open(script_path, 'w', encoding='utf-8') as f:
+        json.dump([
+            {'scriptName': 'trim', 'findRegex': '/<note>.*?<\\/note>/g', 'replaceString': '',
+             'placement': [1, 2], 'promptOnly': True, 'minDepth': 1},
+        ], f)
+    regex_engine.reload_scripts()
+    try:
+        response = client.post('/api/chat/long/stream', json={
+            'history': [
+                {'role': 'user', 'parts': [{'text': 'go<note>a</note>'}]},
+                {'role': 'model', 'parts': [{'text': 'done<note>b</note>'}]},
+            ],
+            'message': 'next<note>c</note>',
+            'state': {},
+            'config': {'provider': 'google', 'regex': {}},
+        })
+    finally:
+        os.remove(script_path)
+        regex_engine.reload_scripts()
+
+    assert response.status_code == 200
+    assert [message['parts'][0]['text'] for message in captured['history']] == ['go', 'done']
+    # minDepth 1: the new message (depth 0) is left untouched.
+    assert captured['message'] == 'next<note>c</note>'
+
+
+def test_short_stream_reports_context_budget(client: TestClient, monkeypatch):
+    captured = {}
+
+    async def _capturing_stream(**kwargs):
+        captured.update(kwargs)
+        async for piece in _fake_google_stream():
+            yield piece
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _capturing_stream)
+    history = []
+    for index in range(30):
+        history.append({'role': 'user', 'parts': [{'text': f'turn {index} ' + '问' * 100}]})
+        history.append({'role': 'model', 'parts': [{'text': '答' * 100}]})
+
+    response = client.post('/api/chat/short/stream', json={
+        'history': history,
+        'message': 'continue',
+        'state': {
+            'novel_path': '/tmp/novel',
+            'current_node': {'id': 'c1', 'type': 'CHAPTER', 'title': 'Chapter 1',
+                             'summary': 'summary', 'content': '旧' * 5000 + 'LAST LINE'},
+            'novel_outline': 'outline',
+            'active_task': {'type': 'CONTENT', 'node_id': 'c1', 'field': 'content'},
+        },
+        'config': {'provider': 'google', 'context_budget_tokens': 3000},
+    })
+
+    budget = _read_ndjson(response)[-1]['meta']['context_budget']
+    assert budget['budget_tokens'] == 3000
+    assert budget['used_tokens'] <= 3000
+    assert budget['sections']['content']['truncated'] is True
+    assert budget['sections']['history']['dropped_messages'] > 0
+    assert 'LAST LINE' in captured['system_instruction']
+    assert len(captured['history']) == budget['sections']['history']['kept_messages']
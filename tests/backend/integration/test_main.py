@@ -1,5 +1,8 @@
 from fastapi.testclient import TestClient
 
+from services import llm_service
+from services.providers import provider_store
+
 
 def test_health_is_public(client: TestClient):
     response = client.get('/api/health')
@@ -35,3 +38,107 @@ def test_update_api_key_validates_state(client: TestClient):
     )
     assert response.status_code == 400
     assert response.json()['detail'] == 'Invalid state.'
+
+
+def test_api_key_status_parses_store_at_most_once(client: TestClient, monkeypatch):
+    client.post('/api/config/api-key', json={'provider': 'deepseek', 'api_key': 'deepseek-key-1'})
+
+    calls = {'count': 0}
+    original_sanitize = provider_store._sanitize_store_payload
+
+    def _counting_sanitize(payload):
+        calls['count'] += 1
+        return original_sanitize(payload)
+
+    monkeypatch.setattr(provider_store, '_sanitize_store_payload', _counting_sanitize)
+    # Force the next read to go to disk.
+    provider_store._CACHE['signature'] = None
+
+    response = client.get('/api/config/api-key')
+
+    assert response.status_code == 200
+    assert response.json()['providers']['deepseek']['configured'] is True
+    assert calls['count'] == 1
+
+
+def test_update_api_key_persists_all_fields_in_one_write(client: TestClient, monkeypatch):
+    writes = {'count': 0}
+    original_write = provider_store._write_store_unlocked
+
+    def _counting_write(store):
+        writes['count'] += 1
+        return original_write(store)
+
+    monkeypatch.setattr(provider_store, '_write_store_unlocked', _counting_write)
+
+    response = client.post('/api/config/api-key', json={
+        'provider': 'deepseek',
+        'api_key': 'deepseek-key-1',
+        'api_base_url': 'https://proxy.example.com',
+        'models': ['deepseek-chat', 'deepseek-reasoner'],
+        'selected_model': 'deepseek-reasoner',
+        'state': 'connected',
+    })
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload['state'] == 'connected'
+    assert payload['selected_model'] == 'deepseek-reasoner'
+    assert writes['count'] == 1
+
+
+def test_short_chat_forwards_task_capped_generation_limits(client: TestClient, monkeypatch):
+    captured = {}
+
+    async def _capturing_generation(**kwargs):
+        captured.update(kwargs)
+        return 'polished'
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _capturing_generation)
+
+    response = client.post('/api/chat/short', json={
+        'history': [],
+        'message': 'polish',
+        'state': {
+            'novel_path': '/tmp/novel',
+            'current_node': {'id': 'c1', 'type': 'CHAPTER', 'title': 'Chapter 1'},
+            'novel_outline': 'outline',
+            'active_task': {'type': 'POLISH_SELECTION', 'node_id': 'c1', 'field': 'content', 'context_data': 'text'},
+        },
+        'config': {'provider': 'google', 'stop': ['<END>']},
+    })
+
+    assert response.status_code == 200
+    expected = {'max_output_tokens': 2048, 'stop_sequences': ['<END>']}
+    payload = response.json()
+    assert payload['text'] == 'polished'
+    assert payload['meta']['generation_config'] == expected
+    assert captured['generation_config'] == expected
+
+
+def test_long_chat_compacts_history_when_enabled(client: TestClient, monkeypatch):
+    calls = []
+
+    async def _fake_generation(**kwargs):
+        calls.append(kwargs)
+        return 'summary' if len(calls) == 1 else 'reply'
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _fake_generation)
+    history = [
+        {'role': 'user' if index % 2 == 0 else 'model', 'parts': [{'text': f'compaction turn {index} ' + 'x' * 200}]}
+        for index in range(12)
+    ]
+
+    response = client.post('/api/chat/long', json={
+        'history': history,
+        'message': 'next',
+        'state': {},
+        'config': {'provider': 'google', 'history_compaction': {'threshold_tokens': 100, 'keep_recent': 4, 'step': 4}},
+    })
+
+    assert response.status_code == 200
+    assert response.json()['meta']['history_compaction']['summarized_messages'] == 8
+    assert len(calls) == 2
+    sent_history = calls[1]['history']
+    assert 'summary' in sent_history[0]['parts'][0]['text']
+    assert [message.model_dump() for message in sent_history[2:]] == history[8:]
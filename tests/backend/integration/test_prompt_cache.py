@@ -0,0 +1,141 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from services import retry_policy
+from services.gemini_cache import gemini_context_cache
+from services.providers import client_pool, deepseek_provider, google_provider
+from services.response_cache import response_cache
+
+
+def _short_payload(config):
+    return {
+        'history': [{'role': 'user', 'parts': [{'text': 'earlier'}]}, {'role': 'model', 'parts': [{'text': 'ok'}]}],
+        'message': 'continue',
+        'state': {
+            'novel_path': '/tmp/novel',
+            'current_node': {'id': 'c1', 'type': 'CHAPTER', 'title': 'Chapter 1', 'content': 'CHAPTER TEXT'},
+            'novel_outline': 'STORY OUTLINE',
+        },
+        'config': config,
+    }
+
+
+def test_short_chat_sends_stable_prefix_and_reports_cache_hits(client: TestClient, provider_stub):
+    deepseek_provider.save_config(api_key='stub-key-1234', api_base_url=provider_stub.base_url)
+    provider_stub.usage = {'prompt_tokens': 120, 'completion_tokens': 2, 'total_tokens': 122, 'prompt_cache_hit_tokens': 96}
+
+    response = client.post('/api/chat/short', json=_short_payload({'provider': 'deepseek', 'model': 'deepseek-chat'}))
+
+    messages = provider_stub.requests[0]['json']['messages']
+    assert messages[0]['role'] == 'system'
+    assert 'STORY OUTLINE' in messages[0]['content']
+    assert 'CHAPTER TEXT' not in messages[0]['content']
+    assert messages[1:3] == [{'role': 'user', 'content': 'earlier'}, {'role': 'assistant', 'content': 'ok'}]
+    assert 'CHAPTER TEXT' in messages[-1]['content'] and messages[-1]['content'].endswith('continue')
+    assert response.json()['meta']['usage'] == {'prompt_tokens': 120, 'completion_tokens': 2, 'cached_tokens': 96}
+    client_pool.invalidate('deepseek')
+
+
+def test_stream_done_event_reports_usage(client: TestClient, provider_stub):
+    deepseek_provider.save_config(api_key='stub-key-1234', api_base_url=provider_stub.base_url)
+    provider_stub.usage = {'prompt_tokens': 120, 'completion_tokens': 2, 'total_tokens': 122, 'prompt_cache_hit_tokens': 64}
+
+    response = client.post('/api/chat/short/stream', json=_short_payload({'provider': 'deepseek', 'model': 'deepseek-chat'}))
+
+    done = [json.loads(line) for line in response.text.splitlines() if line.strip()][-1]
+    assert done['type'] == 'done'
+    assert done['metrics']['usage']['cached_tokens'] == 64
+    assert provider_stub.requests[0]['json']['stream_options'] == {'include_usage': True}
+    client_pool.invalidate('deepseek')
+
+
+def test_gemini_prefix_is_cached_and_reused(client: TestClient, provider_stub, monkeypatch):
+    monkeypatch.setenv('GOOGLE_GEMINI_BASE_URL', provider_stub.gemini_base_url)
+    google_provider.save_api_key('stub-google-key-1234')
+    gemini_context_cache.clear()
+    config = {'provider': 'google', 'model': 'gemini-stub', 'gemini_context_cache': {'min_tokens': 0}}
+
+    first = client.post('/api/chat/short', json=_short_payload(config))
+    second = client.post('/api/chat/short', json=_short_payload(config))
+
+    paths = [request['path'].split('?')[0] for request in provider_stub.requests]
+    assert paths == ['/v1beta/cachedContents'] + ['/v1beta/models/gemini-stub:generateContent'] * 2
+    created = provider_stub.requests[0]['json']
+    assert 'STORY OUTLINE' in json.dumps(created['systemInstruction'], ensure_ascii=False)
+    generate = provider_stub.requests[2]['json']
+    assert generate['cachedContent'] == 'cachedContents/stub-1'
+    assert 'systemInstruction' not in generate
+    assert 'CHAPTER TEXT' in generate['contents'][-1]['parts'][0]['text']
+    for response in (first, second):
+        assert response.json()['text'] == 'stub reply'
+        assert response.json()['meta']['usage']['cached_tokens'] == provider_stub.gemini_cached_tokens
+    gemini_context_cache.clear()
+    client_pool.invalidate('google')
+
+
+def test_rejected_gemini_cache_falls_back_to_the_plain_prefix(client: TestClient, provider_stub, monkeypatch):
+    monkeypatch.setenv('GOOGLE_GEMINI_BASE_URL', provider_stub.gemini_base_url)
+    google_provider.save_api_key('stub-google-key-2468')
+    gemini_context_cache.clear()
+    config = {'provider': 'google', 'model': 'gemini-stub', 'gemini_context_cache': {'min_tokens': 0}}
+    provider_stub.faults = [None, (404, {}, {'error': {'code': 404, 'message': 'CachedContent not found', 'status': 'NOT_FOUND'}})]
+
+    response = client.post('/api/chat/short', json=_short_payload(config))
+
+    assert response.json()['text'] == 'stub reply'
+    generates = [request['json'] for request in provider_stub.requests if request['path'].startswith('/v1beta/models/')]
+    assert [generate.get('cachedContent') for generate in generates] == ['cachedContents/stub-1', None]
+    assert 'STORY OUTLINE' in json.dumps(generates[1]['systemInstruction'], ensure_ascii=False)
+    assert gemini_context_cache.get_stats()['entries'] == 0
+    gemini_context_cache.clear()
+    client_pool.invalidate('google')
+
+
+def test_rate_limited_gemini_request_keeps_its_cache_and_is_retried(client: TestClient, provider_stub, monkeypatch):
+    monkeypatch.setenv('GOOGLE_GEMINI_BASE_URL', provider_stub.gemini_base_url)
+    monkeypatch.setattr(retry_policy.DEFAULT_RETRY_POLICY, 'base_delay', 0.001)
+    google_provider.save_api_key('stub-google-key-1357')
+    gemini_context_cache.clear()
+    config = {'provider': 'google', 'model': 'gemini-stub', 'gemini_context_cache': {'min_tokens': 0}}
+    provider_stub.faults = [None, (429, {'Retry-After': '0'}, {'error': {'code': 429, 'message': 'quota', 'status': 'RESOURCE_EXHAUSTED'}})]
+
+    response = client.post('/api/chat/short', json=_short_payload(config))
+
+    assert response.json()['text'] == 'stub reply'
+    generates = [request['json'] for request in provider_stub.requests if request['path'].startswith('/v1beta/models/')]
+    assert [generate.get('cachedContent') for generate in generates] == ['cachedContents/stub-1'] * 2
+    assert gemini_context_cache.get_stats()['entries'] == 1
+    gemini_context_cache.clear()
+    client_pool.invalidate('google')
+
+
+def test_small_gemini_prefix_is_sent_uncached(client: TestClient, provider_stub, monkeypatch):
+    monkeypatch.setenv('GOOGLE_GEMINI_BASE_URL', provider_stub.gemini_base_url)
+    google_provider.save_api_key('stub-google-key-5678')
+    config = {'provider': 'google', 'model': 'gemini-stub', 'gemini_context_cache': True}
+
+    response = client.post('/api/chat/short', json=_short_payload(config))
+
+    assert [request['path'] for request in provider_stub.requests] == ['/v1beta/models/gemini-stub:generateContent']
+    assert 'STORY OUTLINE' in json.dumps(provider_stub.requests[0]['json']['systemInstruction'], ensure_ascii=False)
+    assert response.json()['meta']['usage']['cached_tokens'] == 0
+    client_pool.invalidate('google')
+
+
+def test_zero_temperature_requests_hit_response_cache(client: TestClient, provider_stub):
+    response_cache.clear()
+    deepseek_provider.save_config(api_key='stub-key-1234', api_base_url=provider_stub.base_url)
+    config = {'provider': 'deepseek', 'model': 'deepseek-chat', 'temperature': 0}
+
+    first = client.post('/api/chat/short', json=_short_payload(config))
+    second = client.post('/api/chat/short', json=_short_payload(config))
+    bypassed = client.post('/api/chat/short', json=_short_payload({**config, 'response_cache': False}))
+
+    assert len(provider_stub.requests) == 2
+    assert first.json()['meta']['usage']['response_cache'] == 'miss'
+    assert second.json()['meta']['usage']['response_cache'] == 'hit'
+    assert second.json()['text'] == first.json()['text'] == bypassed.json()['text']
+    assert client.get('/api/cache/stats').json()['responses']['memory_hits'] >= 1
+    response_cache.clear()
+    client_pool.invalidate('deepseek')
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import retry_policy
+from services.providers import client_pool, deepseek_provider, openai_compatible_provider
+from services.providers.concurrency_limiter import provider_limiter
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(retry_policy.DEFAULT_RETRY_POLICY, 'base_delay', 0.001)
+    monkeypatch.setattr(retry_policy.DEFAULT_RETRY_POLICY, 'max_delay', 0.001)
+
+
+def _chat_payload():
+    return {
+        'history': [],
+        'message': 'continue',
+        'state': {
+            'novel_path': '/tmp/novel',
+            'current_node': {'id': 'c1', 'type': 'CHAPTER', 'title': 'Chapter 1', 'content': 'CHAPTER TEXT'},
+            'novel_outline': 'STORY OUTLINE',
+        },
+        'config': {'provider': 'deepseek', 'model': 'deepseek-chat'},
+    }
+
+
+def _completion_calls(stub):
+    return [request for request in stub.requests if request['path'].endswith('/chat/completions')]
+
+
+def test_generation_is_retried_after_transient_faults(client: TestClient, provider_stub):
+    deepseek_provider.save_config(api_key='stub-key-retry', api_base_url=provider_stub.base_url)
+    provider_stub.faults = [(429, {'Retry-After': '0'}, None), (503, {}, None)]
+
+    response = client.post('/api/chat/short', json=_chat_payload())
+
+    assert response.status_code == 200
+    assert response.json()['text'] == 'stub reply'
+    assert len(_completion_calls(provider_stub)) == 3
+    client_pool.invalidate('deepseek')
+
+
+def test_permanent_errors_are_not_retried(client: TestClient, provider_stub):
+    deepseek_provider.save_config(api_key='stub-key-retry', api_base_url=provider_stub.base_url)
+    provider_stub.faults = [(400, {}, None)]
+
+    response = client.post('/api/chat/short', json=_chat_payload())
+
+    assert 'stub reply' not in response.text
+    assert len(_completion_calls(provider_stub)) == 1
+    client_pool.invalidate('deepseek')
+
+
+def test_stream_is_retried_before_the_first_delta(client: TestClient, provider_stub):
+    deepseek_provider.save_config(api_key='stub-key-retry', api_base_url=provider_stub.base_url)
+    provider_stub.faults = [(502, {}, None)]
+
+    response = client.post('/api/chat/short/stream', json=_chat_payload())
+
+    events = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    assert [event['type'] for event in events] == ['delta', 'delta', 'done']
+    assert events[-1]['text'] == 'stub reply'
+    assert len(_completion_calls(provider_stub)) == 2
+    client_pool.invalidate('deepseek')
+
+
+def test_model_listing_is_retried(client: TestClient, provider_stub):
+    openai_compatible_provider.save_config(api_key='stub-key-models', api_base_url=provider_stub.base_url)
+    provider_stub.faults = [(503, {}, None)]
+
+    response = client.get('/api/providers/openai-compatible/models?refresh=true')
+
+    assert response.status_code == 200
+    assert response.json()['models'] == ['stub-model', 'stub-model-large']
+    assert len([request for request in provider_stub.requests if request['path'].endswith('/models')]) == 2
+    client_pool.invalidate('openai-compatible')
+
+
+def test_rate_limited_endpoint_lowers_its_concurrency_limit(client: TestClient, provider_stub):
+    provider_limiter.clear()
+    deepseek_provider.save_config(api_key='stub-key-retry', api_base_url=provider_stub.base_url)
+    provider_stub.faults = [(429, {'Retry-After': '0'}, None)]
+
+    client.post('/api/chat/short', json=_chat_payload())
+    response = client.get('/api/providers/concurrency')
+
+    [endpoint] = [item for item in response.json()['endpoints'] if item['base_url'] == provider_stub.base_url]
+    assert endpoint['provider'] == 'deepseek'
+    assert endpoint['overloads'] == 1 and endpoint['limit'] < 8
+    assert (endpoint['in_flight'], endpoint['queue_depth']) == (0, 0)
+    provider_limiter.clear()
+    client_pool.invalidate('deepseek')
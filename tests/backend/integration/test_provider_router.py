@@ -1,6 +1,6 @@
 from fastapi.testclient import TestClient
 
-from services.providers import google_provider
+from services.providers import client_pool, google_provider, openai_compatible_provider
 
 
 def test_provider_test_requires_configured_key(client: TestClient):
@@ -52,3 +52,17 @@ def test_provider_status_endpoint_contract(client: TestClient):
     payload = response.json()
     for key in ['provider', 'ok', 'state', 'message', 'configured', 'masked']:
         assert key in payload
+
+
+def test_model_list_is_cached_until_refresh(client: TestClient, provider_stub):
+    openai_compatible_provider.save_config(api_key='stub-key-cache', api_base_url=provider_stub.base_url)
+
+    first = client.get('/api/providers/openai-compatible/models')
+    second = client.get('/api/providers/openai-compatible/models')
+    refreshed = client.get('/api/providers/openai-compatible/models?refresh=true')
+
+    model_calls = [request for request in provider_stub.requests if request['path'].endswith('/models')]
+    assert len(model_calls) == 2
+    assert (first.json()['cached'], second.json()['cached'], refreshed.json()['cached']) == (False, True, False)
+    assert second.json()['models'] == ['stub-model', 'stub-model-large']
+    client_pool.invalidate('openai-compatible')
@@ -0,0 +1,148 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app_context import regex_batch_processor, regex_engine
+from services.regex_engine import RegexPlacement
+
+
+@pytest.fixture
+def regex_scripts():
+    path = os.path.join(regex_engine.scripts_dir, 'batch.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([
+            {'scriptName': 'shout', 'findRegex': '/hello/g', 'replaceString': 'HELLO',
+             'placement': [RegexPlacement.AI_OUTPUT]},
+            {'scriptName': 'name', 'findRegex': '/{{char}}/g', 'replaceString': '<$&>',
+             'placement': [RegexPlacement.AI_OUTPUT]},
+        ], f)
+    regex_engine.reload_scripts()
+    yield
+    os.remove(path)
+    regex_engine.reload_scripts()
+
+
+def test_process_batch_returns_results_in_order(client: TestClient, regex_scripts):
+    response = client.post('/api/regex/process-batch', json={
+        'texts': ['hello Alice', '', 'nothing', 'Alice says hello'],
+        'context': {'char': 'Alice'},
+    })
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload['mode'] == 'inline'
+    assert payload['results'] == ['HELLO <Alice>', '', 'nothing', '<Alice> says HELLO']
+
+
+def test_process_batch_respects_overrides_and_placement(client: TestClient, regex_scripts):
+    response = client.post('/api/regex/process-batch', json={
+        'texts': ['hello'],
+        'overrides': {'shout': False},
+    })
+    assert response.json()['results'] == ['hello']
+
+    response = client.post('/api/regex/process-batch', json={
+        'texts': ['hello'],
+        'placement': RegexPlacement.USER_INPUT,
+    })
+    assert response.json()['results'] == ['hello']
+
+
+def test_process_batch_uses_process_pool_for_large_inputs(client: TestClient, regex_scripts, monkeypatch):
+    monkeypatch.setattr(regex_batch_processor, 'pool_threshold_chars', 1)
+    monkeypatch.setattr(regex_batch_processor, 'max_workers', 2)
+    texts = [f'chapter {index}: hello Alice ' * 200 for index in range(12)]
+
+    try:
+        response = client.post('/api/regex/process-batch', json={'texts': texts, 'context': {'char': 'Alice'}})
+    finally:
+        regex_batch_processor.shutdown()
+
+    payload = response.json()
+    assert payload['mode'] == 'process_pool'
+    assert payload['results'] == [text.replace('hello', 'HELLO').replace('Alice', '<Alice>') for text in texts]
+    assert payload['complete'] == [True] * len(texts)
+
+
+def test_process_pool_shares_flags_and_stats_with_the_main_engine(client: TestClient, regex_scripts, monkeypatch):
+    monkeypatch.setattr(regex_batch_processor, 'pool_threshold_chars', 1)
+    monkeypatch.setattr(regex_batch_processor, 'max_workers', 2)
+    texts = [f'chapter {index}: hello Alice ' * 200 for index in range(12)]
+    regex_engine.reset_script_stats()
+    regex_engine.set_flags({'shout': 'timeout'})
+
+    try:
+        response = client.post('/api/regex/process-batch', json={'texts': texts, 'context': {'char': 'Alice'}})
+    finally:
+        regex_batch_processor.shutdown()
+        regex_engine.set_flags({})
+
+    payload = response.json()
+    assert payload['results'] == [text.replace('Alice', '<Alice>') for text in texts]
+    assert payload['skipped'] == [['shout']] * len(texts)
+    stats = {entry['scriptName']: entry for entry in regex_engine.get_script_stats()['scripts']}
+    assert stats['name']['calls'] == len(texts)
+    assert stats['shout']['skipped'] == len(texts)
+
+
+def test_process_batch_is_not_cut_off_by_the_interactive_call_budget(client: TestClient, regex_scripts, monkeypatch):
+    monkeypatch.setattr(regex_engine, 'call_time_budget_ms', 0)
+    response = client.post('/api/regex/process-batch', json={'texts': ['hello Alice'], 'context': {'char': 'Alice'}})
+
+    payload = response.json()
+    assert payload['results'] == ['HELLO <Alice>']
+    assert (payload['complete'], payload['skipped']) == ([True], [[]])
+    # Interactive calls still use it.
+    assert regex_engine.process_string_report('hello', RegexPlacement.AI_OUTPUT) == ('hello', ['shout', 'name'])
+
+
+def test_settings_prefix_serves_scripts_for_renderer(client: TestClient, regex_scripts):
+    response = client.get('/api/settings/regex/scripts')
+    assert response.status_code == 200
+    assert [script['scriptName'] for script in response.json()['scripts']] == ['shout', 'name']
+
+
+def test_stats_endpoint_reports_script_timings(client: TestClient, regex_scripts):
+    client.post('/api/regex/stats/reset')
+    client.post('/api/regex/process-batch', json={'texts': ['hello', 'hello'], 'context': {'char': 'Alice'}})
+
+    payload = client.get('/api/regex/stats').json()
+    assert payload['call_budget_ms'] > 0
+    stats = {entry['scriptName']: entry for entry in payload['scripts']}
+    assert stats['shout']['calls'] == 2
+    assert stats['shout']['flagged'] is None
+
+
+def test_bundle_is_normalised_and_revalidated_with_etag(client: TestClient, regex_scripts):
+    response = client.get('/api/regex/bundle')
+    assert response.status_code == 200
+    etag = response.headers['etag']
+    bundle = response.json()
+    assert etag == f'"{bundle["version"]}"'
+    scripts = {script['scriptName']: script for script in bundle['scripts']}
+    assert scripts['name']['source'] == '{{char}}'
+    assert scripts['name']['flags'] == 'g'
+    assert scripts['name']['replacement'] == '<$&>'
+    assert scripts['name']['macros'] == ['char']
+    assert bundle['byPlacement'][str(RegexPlacement.AI_OUTPUT)] == [
+        index for index, script in enumerate(bundle['scripts']) if RegexPlacement.AI_OUTPUT in script['placement']
+    ]
+
+    cached = client.get('/api/regex/bundle', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.content == b''
+
+    path = os.path.join(regex_engine.scripts_dir, 'batch_extra.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'scriptName': 'extra', 'findRegex': 'x', 'replaceString': '{{match}}!'}, f)
+    try:
+        changed = client.get('/api/regex/bundle', headers={'If-None-Match': etag})
+    finally:
+        os.remove(path)
+        regex_engine.reload_scripts()
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+    extra = next(script for script in changed.json()['scripts'] if script['scriptName'] == 'extra')
+    assert (extra['flags'], extra['replacement']) == ('gm', '$&!')
@@ -0,0 +1,235 @@
+"""Local OpenAI-compatible stub server used by tests and benchmarks."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server: '_StubHTTPServer'
+
+    def setup(self):
+        super().setup()
+        stub = self.server.stub
+        with stub.lock:
+            stub.connections += 1
+        # Stands in for TCP + TLS setup of a real provider endpoint.
+        if stub.handshake_delay:
+            time.sleep(stub.handshake_delay)
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        return
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str):
+        stub = self.server.stub
+        payload = self._read_json() if method == 'POST' else {}
+        with stub.lock:
+            stub.requests.append({'method': method, 'path': self.path, 'json': payload})
+            fault = stub.faults.pop(0) if stub.faults else None
+
+        if stub.response_delay:
+            time.sleep(stub.response_delay)
+
+        if fault:
+            status, headers, body = fault
+            self._send_json(status, body or {'error': {'message': f'stub fault {status}'}}, headers)
+            return
+
+        if method == 'GET' and self.path.endswith('/models'):
+            self._send_json(200, {
+                'object': 'list',
+                'data': [{'id': model, 'object': 'model', 'created': 0, 'owned_by': 'stub'} for model in stub.models],
+            })
+            return
+
+        if method == 'POST' and self.path.startswith('/v1beta/'):
+            self._handle_gemini(payload)
+            return
+
+        if method == 'POST' and self.path.endswith('/chat/completions'):
+            if payload.get('stream'):
+                self._send_stream(payload)
+            else:
+                self._send_json(200, self._completion_payload(payload))
+            return
+
+        self._send_json(404, {'error': {'message': f'unknown route {method} {self.path}'}})
+
+    def _completion_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        stub = self.server.stub
+        return {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'created': 0,
+            'model': payload.get('model', 'stub-model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': stub.reply_text},
+                'finish_reason': 'stop',
+            }],
+            'usage': dict(stub.usage),
+        }
+
+    def _send_stream(self, payload: Dict[str, Any]):
+        stub = self.server.stub
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def _write(data: str):
+            raw = data.encode('utf-8')
+            self.wfile.write(f'{len(raw):X}\r\n'.encode('ascii') + raw + b'\r\n')
+            self.wfile.flush()
+
+        for piece in stub.stream_chunks:
+            chunk = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'created': 0,
+                'model': payload.get('model', 'stub-model'),
+                'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+            }
+            _write(f'data: {json.dumps(chunk)}\n\n')
+            if stub.stream_chunk_delay:
+                time.sleep(stub.stream_chunk_delay)
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            usage_chunk = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'created': 0,
+                'model': payload.get('model', 'stub-model'),
+                'choices': [],
+                'usage': dict(stub.usage),
+            }
+            _write(f'data: {json.dumps(usage_chunk)}\n\n')
+        _write('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _handle_gemini(self, payload: Dict[str, Any]):
+        """Minimal Gemini API: cachedContents.create, generateContent and streamGenerateContent (SSE)."""
+        stub = self.server.stub
+        path = self.path.split('?', 1)[0]
+        if path.endswith('/cachedContents'):
+            with stub.lock:
+                name = f'cachedContents/stub-{len(stub.cached_contents) + 1}'
+                stub.cached_contents[name] = payload
+            ttl_seconds = float(str(payload.get('ttl') or '3600s').rstrip('s'))
+            expire_time = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + ttl_seconds))
+            self._send_json(200, {'name': name, 'model': payload.get('model'), 'expireTime': expire_time})
+            return
+
+        usage = {'promptTokenCount': 10, 'candidatesTokenCount': 2, 'totalTokenCount': 12}
+        if payload.get('cachedContent'):
+            usage['cachedContentTokenCount'] = stub.gemini_cached_tokens
+        if path.endswith(':generateContent'):
+            self._send_json(200, {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': stub.reply_text}]}, 'finishReason': 'STOP'}],
+                'usageMetadata': usage,
+            })
+            return
+        if path.endswith(':streamGenerateContent'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for index, piece in enumerate(stub.stream_chunks):
+                chunk: Dict[str, Any] = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}}]}
+                if index == len(stub.stream_chunks) - 1:
+                    chunk['usageMetadata'] = usage
+                self.wfile.write(f'data: {json.dumps(chunk)}\r\n\r\n'.encode('utf-8'))
+                self.wfile.flush()
+            self.close_connection = True
+            return
+        self._send_json(404, {'error': {'message': f'unknown route POST {self.path}'}})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, stub: 'ProviderStubServer'):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.stub = stub
+
+
+class ProviderStubServer:
+    """
+    OpenAI-compatible HTTP stub on 127.0.0.1 (plus a minimal Gemini API under gemini_base_url).
+    Counts accepted connections, can simulate per-connection setup cost and
+    returns queued faults (status, headers, body) before normal responses.
+    """
+
+    def __init__(self, handshake_delay: float = 0.0, response_delay: float = 0.0):
+        self.handshake_delay = handshake_delay
+        self.response_delay = response_delay
+        self.stream_chunk_delay = 0.0
+        self.models: List[str] = ['stub-model', 'stub-model-large']
+        self.reply_text = 'stub reply'
+        self.stream_chunks: List[str] = ['stub ', 'reply']
+        self.usage: Dict[str, Any] = {'prompt_tokens': 10, 'completion_tokens': 2, 'total_tokens': 12}
+        self.gemini_cached_tokens = 8
+        self.cached_contents: Dict[str, Dict[str, Any]] = {}
+        self.faults: List[tuple] = []
+        self.requests: List[Dict[str, Any]] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._server = _StubHTTPServer(self)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True,
+        )
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    @property
+    def gemini_base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self) -> 'ProviderStubServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'ProviderStubServer':
+        return self.start()
+
+    def __exit__(self, *_exc):
+        self.stop()
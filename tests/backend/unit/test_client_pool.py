@@ -0,0 +1,115 @@
+import asyncio
+
+from services import llm_service
+from services.providers import client_pool, deepseek_provider, google_provider, openai_compatible_provider
+
+
+def test_sync_clients_are_pooled_by_credentials():
+    first = client_pool.get_openai_client('deepseek', 'key-a', 'https://api.example.com')
+    again = client_pool.get_openai_client('deepseek', 'key-a', 'https://api.example.com/')
+    other_key = client_pool.get_openai_client('deepseek', 'key-b', 'https://api.example.com')
+    other_url = client_pool.get_openai_client('deepseek', 'key-a', 'https://other.example.com')
+
+    assert first is again
+    assert first is not other_key
+    assert first is not other_url
+    client_pool.invalidate('deepseek')
+
+
+def test_async_clients_are_pooled_per_event_loop():
+    async def _get_twice():
+        return (
+            client_pool.get_async_openai_client('openai-compatible', 'key', 'https://api.example.com'),
+            client_pool.get_async_openai_client('openai-compatible', 'key', 'https://api.example.com'),
+        )
+
+    first_loop = asyncio.run(_get_twice())
+    second_loop = asyncio.run(_get_twice())
+
+    assert first_loop[0] is first_loop[1]
+    assert first_loop[0] is not second_loop[0]
+    client_pool.invalidate('openai-compatible')
+
+
+def test_save_config_invalidates_only_on_credential_change():
+    deepseek_provider.save_config(api_key='key-one-1234')
+    first = deepseek_provider._get_client()
+
+    deepseek_provider.save_config(api_key='key-one-1234')
+    assert deepseek_provider._get_client() is first
+
+    deepseek_provider.save_config(api_base_url='https://proxy.example.com')
+    second = deepseek_provider._get_client()
+    assert second is not first
+    assert first.is_closed()
+    client_pool.invalidate('deepseek')
+
+
+def test_google_save_api_key_invalidates_pool():
+    google_provider.save_api_key('google-key-1')
+    first = client_pool.get_google_client('google-key-1')
+
+    google_provider.save_api_key('google-key-1')
+    assert client_pool.get_google_client('google-key-1') is first
+
+    google_provider.save_api_key('google-key-2')
+    assert client_pool.get_google_client('google-key-1') is not first
+    client_pool.invalidate('google')
+
+
+def test_pooled_client_reuses_connection_against_stub(provider_stub):
+    openai_compatible_provider.save_config(api_key='stub-key-1234', api_base_url=provider_stub.base_url)
+
+    for _ in range(5):
+        assert openai_compatible_provider.list_models() == ['stub-model', 'stub-model-large']
+
+    assert provider_stub.connections == 1
+    client_pool.invalidate('openai-compatible')
+
+
+def test_async_generation_and_stream_against_stub(provider_stub):
+    openai_compatible_provider.save_config(api_key='stub-key-1234', api_base_url=provider_stub.base_url)
+
+    async def _run():
+        text = await llm_service.generate_response_async(
+            message='hi',
+            history=[{'role': 'model', 'parts': [{'text': 'earlier'}]}],
+            system_instruction='sys',
+            model_name='stub-model',
+            provider_name='openai-compatible',
+        )
+        events = [event async for event in llm_service.stream_response_events(
+            message='hi',
+            history=[],
+            system_instruction='sys',
+            model_name='stub-model',
+            provider_name='openai-compatible',
+        )]
+        return text, events
+
+    text, events = asyncio.run(_run())
+
+    assert text == 'stub reply'
+    assert [event['type'] for event in events] == ['delta', 'delta', 'done']
+    assert events[-1]['text'] == 'stub reply'
+    sent = provider_stub.requests[0]['json']['messages']
+    assert sent[0] == {'role': 'system', 'content': 'sys'}
+    assert sent[1] == {'role': 'assistant', 'content': 'earlier'}
+    client_pool.invalidate('openai-compatible')
+
+
+def test_generation_limits_reach_openai_style_request(provider_stub):
+    openai_compatible_provider.save_config(api_key='stub-key-1234', api_base_url=provider_stub.base_url)
+
+    asyncio.run(llm_service.generate_response_async(
+        message='hi',
+        history=[],
+        system_instruction='sys',
+        model_name='stub-model',
+        provider_name='openai-compatible',
+        generation_config={'max_output_tokens': 256, 'stop_sequences': ['END'], 'top_p': 0.5},
+    ))
+
+    sent = provider_stub.requests[0]['json']
+    assert (sent['max_tokens'], sent['stop'], sent['top_p']) == (256, ['END'], 0.5)
+    client_pool.invalidate('openai-compatible')
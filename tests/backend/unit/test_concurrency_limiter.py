@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from services.providers.concurrency_limiter import ConcurrencyLimitExceeded, ProviderConcurrencyLimiter
+
+KEY = ('deepseek', 'http://stub/v1')
+
+
+def _rate_limited() -> openai.APIStatusError:
+    request = httpx.Request('POST', 'http://stub/v1/chat/completions')
+    return openai.APIStatusError('rate limited', response=httpx.Response(429, request=request), body=None)
+
+
+def _stats(limiter):
+    [stats] = limiter.get_stats()
+    return stats
+
+
+def test_calls_above_the_limit_wait_for_a_slot():
+    limiter = ProviderConcurrencyLimiter(initial_limit=2, max_limit=2)
+    running = []
+    peak = []
+
+    async def _call():
+        async with limiter.limit_async(KEY):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.02)
+            running.pop()
+
+    async def _main():
+        await asyncio.gather(*(_call() for _ in range(6)))
+
+    asyncio.run(_main())
+
+    assert max(peak) == 2
+    stats = _stats(limiter)
+    assert (stats['calls'], stats['queued'], stats['in_flight'], stats['queue_depth']) == (6, 4, 0, 0)
+
+
+def test_limit_grows_while_calls_are_queued():
+    limiter = ProviderConcurrencyLimiter(initial_limit=2, max_limit=8)
+
+    async def _call():
+        async with limiter.limit_async(KEY):
+            await asyncio.sleep(0.01)
+
+    async def _main():
+        await asyncio.gather(*(_call() for _ in range(20)))
+
+    asyncio.run(_main())
+
+    assert _stats(limiter)['limit'] > 2
+    assert _stats(limiter)['increases'] > 0
+
+
+def test_rate_limiting_halves_the_limit_once_per_cooldown():
+    limiter = ProviderConcurrencyLimiter(initial_limit=8)
+
+    for _ in range(3):
+        with pytest.raises(openai.APIStatusError):
+            with limiter.limit(KEY):
+                raise _rate_limited()
+
+    stats = _stats(limiter)
+    assert (stats['limit'], stats['overloads'], stats['decreases']) == (4, 3, 1)
+
+
+def test_only_provider_side_timeouts_count_as_overload():
+    limiter = ProviderConcurrencyLimiter(initial_limit=8)
+
+    # The caller's own deadline expiring says nothing about the provider.
+    with pytest.raises(asyncio.TimeoutError):
+        with limiter.limit(KEY):
+            raise asyncio.TimeoutError()
+    assert (_stats(limiter)['limit'], _stats(limiter)['overloads']) == (8, 0)
+
+    with pytest.raises(httpx.ReadTimeout):
+        with limiter.limit(KEY):
+            raise httpx.ReadTimeout('read timed out')
+    assert (_stats(limiter)['limit'], _stats(limiter)['overloads']) == (4, 1)
+
+
+def test_latency_far_above_baseline_lowers_the_limit():
+    limiter = ProviderConcurrencyLimiter(initial_limit=10)
+    for latency in (0.1, 0.1, 0.1):
+        with limiter.limit(KEY) as permit:
+            permit.latency = latency
+    for _ in range(5):
+        with limiter.limit(KEY) as permit:
+            permit.latency = 2.0
+
+    assert _stats(limiter)['limit'] == 9
+
+
+def test_queue_length_is_bounded():
+    limiter = ProviderConcurrencyLimiter(initial_limit=1, max_queue=1)
+
+    async def _main():
+        gate = asyncio.Event()
+
+        async def _hold():
+            async with limiter.limit_async(KEY):
+                await gate.wait()
+
+        holder = asyncio.ensure_future(_hold())
+        waiter = asyncio.ensure_future(_hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(ConcurrencyLimitExceeded):
+            async with limiter.limit_async(KEY):
+                pass
+        gate.set()
+        await asyncio.gather(holder, waiter)
+
+    asyncio.run(_main())
+    assert _stats(limiter)['rejected'] == 1
+
+
+def test_waiting_is_bounded_by_time_and_deadline():
+    limiter = ProviderConcurrencyLimiter(initial_limit=1, max_wait_seconds=0.05)
+    held = threading.Event()
+    done = threading.Event()
+
+    def _hold():
+        with limiter.limit(KEY):
+            held.set()
+            done.wait(2)
+
+    thread = threading.Thread(target=_hold)
+    thread.start()
+    held.wait()
+
+    started = time.monotonic()
+    with pytest.raises(ConcurrencyLimitExceeded):
+        with limiter.limit(KEY):
+            pass
+    with pytest.raises(ConcurrencyLimitExceeded):
+        with limiter.limit(KEY, deadline=time.monotonic() + 0.01):
+            pass
+    assert time.monotonic() - started < 1
+
+    done.set()
+    thread.join()
+    assert _stats(limiter)['in_flight'] == 0
+
+
+def test_endpoints_are_limited_separately():
+    limiter = ProviderConcurrencyLimiter(initial_limit=1, max_wait_seconds=0.05)
+    with limiter.limit(('deepseek', 'http://a/v1')):
+        with limiter.limit(('deepseek', 'http://b/v1')):
+            pass
+    assert sorted(stats['base_url'] for stats in limiter.get_stats()) == ['http://a/v1', 'http://b/v1']
@@ -0,0 +1,69 @@
+from services.context_builder import (
+    DEFAULT_CONTEXT_BUDGETS,
+    ELIDED_HEAD_MARKER,
+    MIN_CONTEXT_BUDGET,
+    fit_context,
+    resolve_context_budget,
+)
+from services.token_estimator import estimate_tokens, truncate_to_tokens
+
+
+def _turns(count):
+    history = []
+    for index in range(count):
+        history.append({'role': 'user', 'parts': [{'text': f'问题{index}' * 20}]})
+        history.append({'role': 'model', 'parts': [{'text': f'回答{index}' * 20}]})
+    return history
+
+
+def test_truncate_to_tokens_keeps_requested_end():
+    text = '甲乙丙丁戊己庚辛'
+    assert truncate_to_tokens(text, 3) == '甲乙丙'
+    assert truncate_to_tokens(text, 3, keep='tail') == '己庚辛'
+    assert truncate_to_tokens(text, 100) == text
+    assert truncate_to_tokens(text, 0) == ''
+
+
+def test_resolve_context_budget():
+    assert resolve_context_budget('gemini-2.5-flash') == DEFAULT_CONTEXT_BUDGETS['gemini']
+    assert resolve_context_budget('gemini-2.5-flash', {'context_budget_tokens': 5000}) == 5000
+    assert resolve_context_budget('gpt-4o', {'context_budget_tokens': 10}) == MIN_CONTEXT_BUDGET
+
+
+def test_small_context_is_sent_unchanged():
+    texts = {'outline': '总纲', 'summary': '摘要', 'content': '正文'}
+    history = _turns(2)
+
+    plan = fit_context(10000, 100, texts, history)
+
+    assert plan.texts == texts
+    assert plan.history == history
+    assert not any(section['truncated'] for section in plan.report['sections'].values())
+
+
+def test_large_context_keeps_chapter_tail_and_recent_turns():
+    content = '\n'.join(f'第{index}段。' + '字' * 50 for index in range(200))
+    texts = {'outline': '纲' * 5000, 'summary': '摘要', 'content': content}
+    history = _turns(40)
+
+    plan = fit_context(4000, 500, texts, history)
+    report = plan.report
+
+    assert report['used_tokens'] <= 4000
+    assert plan.texts['summary'] == '摘要'
+    assert plan.texts['content'].startswith(ELIDED_HEAD_MARKER)
+    assert plan.texts['content'].endswith(content[-60:])
+    assert report['sections']['content']['truncated'] is True
+    assert plan.history == history[-len(plan.history):]
+    assert plan.history[0]['role'] == 'user'
+    assert report['sections']['history']['dropped_messages'] == len(history) - len(plan.history)
+    # Deterministic: the same input gives the same cut.
+    assert fit_context(4000, 500, texts, history).texts == plan.texts
+
+
+def test_unused_budget_is_redistributed():
+    content = '字' * 3000
+    plan = fit_context(3100, 0, {'outline': '', 'summary': '', 'content': content}, [])
+
+    assert plan.texts['content'] == content
+    assert estimate_tokens(plan.texts['content']) == 3000
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from services import gemini_cache
+from services.gemini_cache import GeminiContextCache, resolve_cache_options
+
+
+class _FakeCaches:
+    def __init__(self, ttl_seconds=3600, fail=False):
+        self.ttl_seconds = ttl_seconds
+        self.fail = fail
+        self.created = []
+
+    async def create(self, model, config):
+        if self.fail:
+            raise RuntimeError('Cached content is too small')
+        self.created.append((model, config))
+        expire_time = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        return SimpleNamespace(name=f'cachedContents/{len(self.created)}', expire_time=expire_time)
+
+
+def _resolve(cache, caches, prefix='outline', model='gemini-test'):
+    return asyncio.run(cache.resolve(SimpleNamespace(caches=caches), model, prefix, 3600))
+
+
+def test_cached_content_is_reused_per_prefix():
+    cache = GeminiContextCache()
+    caches = _FakeCaches()
+
+    first = _resolve(cache, caches)
+    again = _resolve(cache, caches)
+    other = _resolve(cache, caches, prefix='another outline')
+
+    assert first == again == 'cachedContents/1'
+    assert other == 'cachedContents/2'
+    assert caches.created[0][1]['system_instruction'] == 'outline'
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_expiring_cached_content_is_replaced():
+    cache = GeminiContextCache()
+    caches = _FakeCaches(ttl_seconds=gemini_cache.REFRESH_MARGIN_SECONDS // 2)
+
+    assert _resolve(cache, caches) == 'cachedContents/1'
+    assert _resolve(cache, caches) == 'cachedContents/2'
+    assert cache.get_stats()['expired'] == 1
+
+
+def test_failed_creation_is_not_retried_immediately():
+    cache = GeminiContextCache()
+    caches = _FakeCaches(fail=True)
+
+    assert _resolve(cache, caches) is None
+    caches.fail = False
+    assert _resolve(cache, caches) is None
+    assert caches.created == []
+
+
+def test_concurrent_first_requests_share_one_creation():
+    cache = GeminiContextCache()
+    caches = _FakeCaches()
+    create = caches.create
+
+    async def _slow_create(model, config):
+        await asyncio.sleep(0.05)
+        return await create(model, config)
+
+    caches.create = _slow_create
+    client = SimpleNamespace(caches=caches)
+
+    async def _main():
+        return await asyncio.gather(*(cache.resolve(client, 'gemini-test', 'outline', 3600) for _ in range(5)))
+
+    assert asyncio.run(_main()) == ['cachedContents/1'] * 5
+    assert len(caches.created) == 1
+    assert cache.get_stats()['single_flight']['shared'] == 4
+
+
+def test_resolve_cache_options():
+    assert resolve_cache_options(None) is None
+    assert resolve_cache_options({'gemini_context_cache': True}) == {
+        'ttl_seconds': gemini_cache.DEFAULT_TTL_SECONDS,
+        'min_tokens': gemini_cache.DEFAULT_MIN_TOKENS,
+    }
+    assert resolve_cache_options({'gemini_context_cache': {'ttl_seconds': 600, 'min_tokens': 0}}) == {
+        'ttl_seconds': 600, 'min_tokens': 0,
+    }
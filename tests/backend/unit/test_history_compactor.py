@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+
+from services.history_compactor import SUMMARY_ACK, SUMMARY_PREFIX, HistoryCompactor
+
+
+def _history(count):
+    roles = ['user', 'model']
+    return [{'role': roles[index % 2], 'parts': [{'text': f'message {index} ' + '字' * 40}]} for index in range(count)]
+
+
+class _RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous, messages):
+        self.calls.append((previous, len(messages)))
+        return f'summary of {len(messages)} after {previous}'
+
+
+def _compact(compactor, history, summarizer, **options):
+    options = {'threshold_tokens': 100, 'keep_recent': 4, 'step': 4, **options}
+    return asyncio.run(compactor.compact(history, summarizer, **options))
+
+
+def test_short_history_is_left_alone():
+    summarizer = _RecordingSummarizer()
+    history = _history(6)
+
+    compacted, report = _compact(HistoryCompactor(), history, summarizer, threshold_tokens=100000)
+
+    assert compacted == history
+    assert report is None
+    assert summarizer.calls == []
+
+
+def test_old_turns_are_replaced_by_summary():
+    summarizer = _RecordingSummarizer()
+    history = _history(14)
+
+    compacted, report = _compact(HistoryCompactor(), history, summarizer)
+
+    # 14 messages, keep 4 -> prefix aligned to 8 messages is summarized
+    assert summarizer.calls == [(None, 8)]
+    assert compacted[0] == {'role': 'user', 'parts': [{'text': SUMMARY_PREFIX + 'summary of 8 after None'}]}
+    assert compacted[1] == {'role': 'model', 'parts': [{'text': SUMMARY_ACK}]}
+    assert compacted[2:] == history[8:]
+    assert report['summarized_messages'] == 8
+    assert report['cached'] is False
+
+
+def test_summaries_roll_forward_and_persist(tmp_path):
+    cache_path = tmp_path / 'summaries.json'
+    summarizer = _RecordingSummarizer()
+    compactor = HistoryCompactor(str(cache_path))
+    history = _history(14)
+
+    _compact(compactor, history, summarizer)
+    # Same prefix on the next turn: nothing to summarize.
+    _, report = _compact(compactor, history + _history(15)[14:], summarizer)
+    assert report['cached'] is True
+    assert len(summarizer.calls) == 1
+
+    # Four more messages: only the new aligned chunk is summarized, on top of the cached summary.
+    longer = history + _history(18)[14:]
+    _, report = _compact(compactor, longer, summarizer)
+    assert summarizer.calls[-1] == ('summary of 8 after None', 4)
+    assert report['newly_summarized_messages'] == 4
+
+    # A new compactor reads the persisted summaries.
+    restarted = _RecordingSummarizer()
+    _, report = _compact(HistoryCompactor(str(cache_path)), longer, restarted)
+    assert restarted.calls == []
+    assert report['cached'] is True
+    assert len(json.loads(cache_path.read_text(encoding='utf-8'))) == 2
+
+
+def test_failed_summary_keeps_full_history():
+    async def _failing(previous, messages):
+        raise RuntimeError('provider down')
+
+    history = _history(14)
+    compacted, report = _compact(HistoryCompactor(), history, _failing)
+
+    assert compacted == history
+    assert report is None
+
+
+def test_summary_file_is_written_off_the_event_loop(tmp_path, monkeypatch):
+    compactor = HistoryCompactor(str(tmp_path / 'summaries.json'))
+    save = compactor._save
+    threads = []
+
+    def _recording_save():
+        threads.append(threading.current_thread())
+        save()
+
+    monkeypatch.setattr(compactor, '_save', _recording_save)
+    _compact(compactor, _history(14), _RecordingSummarizer())
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert len(json.loads((tmp_path / 'summaries.json').read_text(encoding='utf-8'))) == 1
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+from types import SimpleNamespace
 
 from services import llm_service
 
@@ -54,3 +56,193 @@ def test_generate_response_openai_compatible_path(monkeypatch):
     )
 
     assert result == 'openai-ok'
+
+
+def test_generate_response_async_google_path(monkeypatch):
+    async def _fake_google(**kwargs):
+        return 'google-async-ok'
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _fake_google)
+
+    result = asyncio.run(llm_service.generate_response_async(
+        message='hello',
+        history=[],
+        system_instruction='sys',
+        model_name='gemini-3-flash-preview',
+        provider_name='google'
+    ))
+
+    assert result == 'google-async-ok'
+
+
+def test_generate_response_async_deepseek_path(monkeypatch):
+    captured = {}
+
+    async def _fake_openai_style(**kwargs):
+        captured.update(kwargs)
+        return 'deepseek-async-ok'
+
+    monkeypatch.setattr(llm_service, '_generate_openai_style_response_async', _fake_openai_style)
+
+    result = asyncio.run(llm_service.generate_response_async(
+        message='hello',
+        history=[],
+        system_instruction='sys',
+        provider_name='deepseek'
+    ))
+
+    assert result == 'deepseek-async-ok'
+    assert captured['provider_name'] == 'deepseek'
+    assert captured['model_name'] == 'deepseek-chat'
+
+
+def test_generate_response_async_returns_error_for_missing_key():
+    result = asyncio.run(llm_service.generate_response_async(
+        message='hello',
+        history=[],
+        system_instruction='sys',
+        provider_name='openai-compatible'
+    ))
+
+    assert result.startswith('Error generation response: API key is not configured')
+
+
+async def _collect_events(**kwargs):
+    return [event async for event in llm_service.stream_response_events(**kwargs)]
+
+
+def test_stream_response_events_reports_deltas_and_ttft(monkeypatch):
+    async def _fake_stream(**kwargs):
+        await asyncio.sleep(0.02)
+        yield 'Hel'
+        yield 'lo'
+
+    monkeypatch.setattr(llm_service, '_stream_openai_style_response_async', _fake_stream)
+
+    events = asyncio.run(_collect_events(
+        message='hello',
+        history=[],
+        system_instruction='sys',
+        provider_name='deepseek'
+    ))
+
+    assert [event['type'] for event in events] == ['delta', 'delta', 'done']
+    assert [event['text'] for event in events[:2]] == ['Hel', 'lo']
+    done = events[-1]
+    assert done['text'] == 'Hello'
+    assert done['metrics']['chunks'] == 2
+    assert done['metrics']['model'] == 'deepseek-chat'
+    assert done['metrics']['ttft_ms'] >= 15
+    assert done['metrics']['total_ms'] >= done['metrics']['ttft_ms']
+
+
+def test_stream_response_events_emits_error_event(monkeypatch):
+    async def _failing_stream(**kwargs):
+        yield 'partial'
+        raise RuntimeError('upstream closed')
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _failing_stream)
+
+    events = asyncio.run(_collect_events(
+        message='hello',
+        history=[],
+        system_instruction='sys',
+        provider_name='google'
+    ))
+
+    assert [event['type'] for event in events] == ['delta', 'error']
+    assert events[-1]['message'] == 'Error generation response: upstream closed'
+    assert events[-1]['metrics']['chunks'] == 1
+
+
+def test_extract_stream_delta_handles_empty_chunks():
+    chunk = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content='abc'))])
+    assert llm_service._extract_stream_delta(chunk) == 'abc'
+    assert llm_service._extract_stream_delta(SimpleNamespace(choices=[])) == ''
+    assert llm_service._extract_stream_delta(
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))])
+    ) == ''
+
+
+def test_resolve_generation_config_merges_preset_task_and_request():
+    preset = {'temperature': 0.5, 'max_output_tokens': 8000, 'top_p': 0.9, 'stop_sequences': ['###']}
+
+    assert llm_service.resolve_generation_config({}, preset) == {
+        'max_output_tokens': 8000, 'top_p': 0.9, 'stop_sequences': ['###'],
+    }
+    assert llm_service.resolve_generation_config({}, preset, 'POLISH_SELECTION')['max_output_tokens'] == 2048
+    assert llm_service.resolve_generation_config({}, {}, 'POLISH_SELECTION') == {'max_output_tokens': 2048}
+
+    overridden = llm_service.resolve_generation_config({'max_tokens': 300, 'stop': 'END', 'top_k': 40}, preset)
+    assert overridden == {'max_output_tokens': 300, 'top_p': 0.9, 'stop_sequences': ['END'], 'top_k': 40}
+
+
+def test_generation_limits_map_to_provider_parameters():
+    limits = {'max_output_tokens': 512, 'top_p': 0.8, 'top_k': 20, 'stop_sequences': ['a', 'b', 'c', 'd', 'e']}
+
+    google_config = llm_service._build_google_chat_config('sys', 0.7, limits)
+    assert google_config['max_output_tokens'] == 512
+    assert google_config['top_k'] == 20
+    assert google_config['stop_sequences'] == ['a', 'b', 'c', 'd', 'e']
+
+    assert llm_service._build_openai_sampling_kwargs(limits) == {
+        'max_tokens': 512, 'top_p': 0.8, 'stop': ['a', 'b', 'c', 'd'],
+    }
+    assert llm_service._build_openai_sampling_kwargs(None) == {}
+
+
+def test_max_output_tokens_is_clamped_to_the_model_ceiling():
+    preset_limits = {'max_output_tokens': 30000, 'top_p': 0.9}
+
+    assert llm_service.clamp_generation_config('deepseek', 'deepseek-chat', preset_limits)['max_output_tokens'] == 8192
+    assert llm_service.clamp_generation_config('openai-compatible', 'gpt-4o-mini', preset_limits) == {
+        'max_output_tokens': 16384, 'top_p': 0.9,
+    }
+    # Provider fallback for unlisted DeepSeek models; unknown models are left alone.
+    assert llm_service.clamp_generation_config('deepseek', 'deepseek-new', preset_limits)['max_output_tokens'] == 8192
+    assert llm_service.clamp_generation_config('openai-compatible', 'local-llm', preset_limits) is preset_limits
+    assert llm_service.clamp_generation_config('deepseek', 'deepseek-chat', {'max_output_tokens': 2048}) == {
+        'max_output_tokens': 2048,
+    }
+    assert preset_limits['max_output_tokens'] == 30000
+
+
+def test_generation_forwards_the_clamped_limit(monkeypatch):
+    captured = {}
+
+    async def _fake_openai_style(**kwargs):
+        captured.update(kwargs)
+        return 'ok'
+
+    monkeypatch.setattr(llm_service, '_generate_openai_style_response_async', _fake_openai_style)
+
+    asyncio.run(llm_service.generate_response_async(
+        message='hello', history=[], system_instruction='sys', provider_name='deepseek',
+        model_name='deepseek-chat', generation_config={'max_output_tokens': 30000},
+    ))
+
+    assert llm_service._build_openai_sampling_kwargs(captured['generation_config']) == {'max_tokens': 8192}
+
+
+def test_layered_prompt_moves_volatile_suffix_after_history():
+    prompt = llm_service.LayeredPrompt('stable rules', 'chapter text')
+
+    messages = llm_service._build_openai_messages(
+        'question', [{'role': 'user', 'parts': [{'text': 'earlier'}]}], prompt
+    )
+
+    assert prompt == 'stable rules\n\nchapter text'
+    assert messages[0] == {'role': 'system', 'content': 'stable rules'}
+    assert messages[1] == {'role': 'user', 'content': 'earlier'}
+    assert messages[-1] == {'role': 'user', 'content': 'chapter text\n\nquestion'}
+
+
+def test_usage_reports_prompt_cache_hits():
+    deepseek = SimpleNamespace(prompt_tokens=100, completion_tokens=5, prompt_cache_hit_tokens=64)
+    openai = SimpleNamespace(prompt_tokens=100, completion_tokens=5,
+                             prompt_tokens_details=SimpleNamespace(cached_tokens=32))
+    gemini = SimpleNamespace(prompt_token_count=100, candidates_token_count=5, cached_content_token_count=None)
+
+    assert llm_service._usage_from_openai(deepseek)['cached_tokens'] == 64
+    assert llm_service._usage_from_openai(openai)['cached_tokens'] == 32
+    assert llm_service._usage_from_google(gemini) == {'prompt_tokens': 100, 'completion_tokens': 5, 'cached_tokens': 0}
@@ -0,0 +1,91 @@
+import json
+
+from services import preset_manager as preset_manager_module
+from services.preset_manager import PresetManager
+
+
+def _write_preset(directory, name, data):
+    (directory / f'{name}.json').write_text(json.dumps(data), encoding='utf-8')
+
+
+def test_reload_presets_is_incremental(tmp_path):
+    _write_preset(tmp_path, 'alpha', {'temperature': 0.5})
+    _write_preset(tmp_path, 'beta', {'temperature': 0.7})
+    manager = PresetManager(str(tmp_path))
+    assert manager.get_preset_list() == ['alpha', 'beta']
+
+    # In-memory edits of unchanged files survive a reload.
+    manager.set_active_preset('alpha')
+    manager.update_active_preset_data({'temperature': 0.9})
+    assert manager.reload_presets() is False
+    assert manager.presets['alpha']['temperature'] == 0.9
+
+    _write_preset(tmp_path, 'beta', {'temperature': 1.1})
+    (tmp_path / 'broken.json').write_text('{', encoding='utf-8')
+    assert manager.reload_presets() is True
+    assert manager.get_preset('beta')['temperature'] == 1.1
+    assert manager.get_preset('alpha')['temperature'] == 0.9
+    assert manager.set_active_preset('broken') is False
+    assert 'broken' not in manager.get_preset_list()
+
+    (tmp_path / 'alpha.json').unlink()
+    manager.reload_presets()
+    assert manager.get_preset_list() == ['beta']
+
+
+def test_presets_are_indexed_without_reading_contents(tmp_path, mocker):
+    _write_preset(tmp_path, 'alpha', {'temperature': 0.5})
+    _write_preset(tmp_path, 'beta', {'temperature': 0.7})
+    loads = mocker.spy(json, 'loads')
+
+    manager = PresetManager(str(tmp_path))
+    manager.reload_presets()
+
+    assert manager.get_preset_list() == ['alpha', 'beta']
+    assert loads.call_count == 0
+    assert manager.set_active_preset('alpha') is True
+    assert manager.get_active_preset() == {'temperature': 0.5}
+    assert loads.call_count == 1
+
+
+def test_parsed_presets_are_reused_from_sidecar_cache(tmp_path, mocker):
+    _write_preset(tmp_path, 'alpha', {'temperature': 0.5, 'prompts': [{'content': 'hi'}]})
+    PresetManager(str(tmp_path)).get_preset('alpha')
+    assert (tmp_path / '.cache' / 'alpha.json.marshal').exists()
+
+    loads = mocker.spy(json, 'loads')
+    manager = PresetManager(str(tmp_path))
+    assert manager.get_preset('alpha') == {'temperature': 0.5, 'prompts': [{'content': 'hi'}]}
+    assert loads.call_count == 0
+
+    # A changed file (different size) invalidates its sidecar.
+    _write_preset(tmp_path, 'alpha', {'temperature': 0.25})
+    manager.reload_presets()
+    assert manager.get_preset('alpha') == {'temperature': 0.25}
+    assert loads.call_count == 1
+
+
+def test_system_prompt_is_cached_per_revision(tmp_path, mocker):
+    _write_preset(tmp_path, 'alpha', {
+        'temperature': 0.5,
+        'prompts': [
+            {'identifier': 'main', 'role': 'system', 'content': 'Main prompt'},
+            {'identifier': 'extra', 'role': 'system', 'content': 'Extra', 'enabled': False},
+            {'identifier': 'marker', 'role': 'system', 'marker': True},
+        ],
+    })
+    manager = PresetManager(str(tmp_path))
+    manager.set_active_preset('alpha')
+    assemble = mocker.spy(preset_manager_module, 'assemble_system_prompt')
+
+    assert manager.construct_system_prompt() == 'Main prompt'
+    assert manager.get_generation_config() == {'temperature': 0.5}
+    assert manager.get_system_prompt_tokens() > 0
+    assert assemble.call_count == 1
+
+    revision = manager.get_preset_revision()
+    manager.update_active_preset_data({'active_prompts_map': {'extra': True}, 'temperature': 0.8})
+    assert manager.get_preset_revision() > revision
+    assert manager.construct_system_prompt() == 'Main prompt\n\nExtra'
+    assert manager.get_generation_config() == {'temperature': 0.8}
+    assert assemble.call_count == 2
@@ -40,3 +40,140 @@ def test_corrupted_store_file_falls_back_to_empty(monkeypatch, tmp_path):
 
     state = provider_store.get_provider_state('google')
     assert state == {}
+
+
+def _count_parses(monkeypatch):
+    calls = {'count': 0}
+    original_sanitize = provider_store._sanitize_store_payload
+
+    def _counting_sanitize(payload):
+        calls['count'] += 1
+        return original_sanitize(payload)
+
+    monkeypatch.setattr(provider_store, '_sanitize_store_payload', _counting_sanitize)
+    return calls
+
+
+def test_reads_reuse_cached_snapshot_until_file_changes(monkeypatch, tmp_path):
+    store_path = tmp_path / 'provider_store.json'
+    store_path.write_text(json.dumps({'providers': {'google': {'api_key': 'first'}}}), encoding='utf-8')
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(store_path))
+    calls = _count_parses(monkeypatch)
+
+    for _ in range(5):
+        assert provider_store.get_provider_state('google')['api_key'] == 'first'
+    assert calls['count'] == 1
+
+    store_path.write_text(json.dumps({'providers': {'google': {'api_key': 'second-key'}}}), encoding='utf-8')
+    assert provider_store.get_provider_state('google')['api_key'] == 'second-key'
+    assert calls['count'] == 2
+
+
+def test_own_writes_refresh_snapshot_without_reparse(monkeypatch, tmp_path):
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(tmp_path / 'provider_store.json'))
+    calls = _count_parses(monkeypatch)
+
+    provider_store.update_provider_state('deepseek', {'api_key': 'abc'})
+    provider_store.set_provider_models('deepseek', ['deepseek-chat'])
+
+    assert provider_store.get_provider_state('deepseek')['models'] == ['deepseek-chat']
+    assert calls['count'] == 0
+
+
+def test_returned_state_is_isolated_from_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(tmp_path / 'provider_store.json'))
+    provider_store.set_provider_models('google', ['gemini-a'])
+
+    state = provider_store.get_provider_state('google')
+    state['models'].append('mutated')
+    snapshot = provider_store.get_all_provider_states()
+    snapshot['google']['models'].append('mutated')
+
+    assert provider_store.get_provider_state('google')['models'] == ['gemini-a']
+
+
+def test_get_all_provider_states_returns_every_provider(monkeypatch, tmp_path):
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(tmp_path / 'provider_store.json'))
+    provider_store.update_provider_state('google', {'api_key': 'g'})
+    provider_store.update_provider_state('deepseek', {'api_key': 'd'})
+
+    states = provider_store.get_all_provider_states()
+
+    assert states == {'google': {'api_key': 'g'}, 'deepseek': {'api_key': 'd'}}
+
+
+def _count_writes(monkeypatch):
+    calls = {'count': 0}
+    original_write = provider_store._write_store_unlocked
+
+    def _counting_write(store):
+        calls['count'] += 1
+        return original_write(store)
+
+    monkeypatch.setattr(provider_store, '_write_store_unlocked', _counting_write)
+    return calls
+
+
+def test_batch_applies_several_updates_with_one_write(monkeypatch, tmp_path):
+    store_path = tmp_path / 'provider_store.json'
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(store_path))
+    writes = _count_writes(monkeypatch)
+
+    with provider_store.batch():
+        provider_store.update_provider_state('openai-compatible', {'api_key': 'k'})
+        provider_store.set_provider_models('openai-compatible', ['gpt-4o-mini'])
+        with provider_store.batch():
+            provider_store.set_provider_connection_state('openai-compatible', 'error')
+        assert provider_store.get_provider_state('openai-compatible')['connection_state'] == 'error'
+        assert not store_path.exists()
+
+    assert writes['count'] == 1
+    raw = json.loads(store_path.read_text(encoding='utf-8'))
+    assert raw['providers']['openai-compatible'] == {
+        'api_key': 'k',
+        'models': ['gpt-4o-mini'],
+        'connection_state': 'error',
+        'selected_model': 'gpt-4o-mini',
+    }
+
+
+def test_batch_discards_updates_when_block_raises(monkeypatch, tmp_path):
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(tmp_path / 'provider_store.json'))
+    provider_store.update_provider_state('google', {'api_key': 'kept'})
+
+    with pytest.raises(ValueError, match='Invalid connection state'):
+        with provider_store.batch():
+            provider_store.update_provider_state('google', {'api_key': 'discarded'})
+            provider_store.set_provider_connection_state('google', 'invalid')
+
+    assert provider_store.get_provider_state('google') == {'api_key': 'kept'}
+
+
+def test_update_provider_states_writes_once(monkeypatch, tmp_path):
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(tmp_path / 'provider_store.json'))
+    writes = _count_writes(monkeypatch)
+
+    result = provider_store.update_provider_states({
+        'google': {'connection_state': 'connected'},
+        'deepseek': {'connection_state': 'error'},
+    })
+
+    assert writes['count'] == 1
+    assert result['deepseek'] == {'connection_state': 'error'}
+    assert provider_store.get_provider_state('google') == {'connection_state': 'connected'}
+
+
+def test_cleanup_removes_only_stale_store_temp_files(monkeypatch, tmp_path):
+    store_path = tmp_path / 'provider_settings.json'
+    monkeypatch.setenv('LOCALAPP_PROVIDER_STORE_PATH', str(store_path))
+    provider_store.update_provider_state('google', {'api_key': 'k'})
+
+    (tmp_path / '.provider_settings.json.abc123.tmp').write_text('{', encoding='utf-8')
+    (tmp_path / 'tmpqmhl7z1o').write_text('{"providers": {}}', encoding='utf-8')
+    (tmp_path / 'tmpunrelate').write_text('user data', encoding='utf-8')
+    (tmp_path / 'notes.json').write_text('{"providers": {}}', encoding='utf-8')
+
+    removed = provider_store.cleanup_stale_temp_files()
+
+    assert removed == 2
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ['notes.json', 'provider_settings.json', 'tmpunrelate']
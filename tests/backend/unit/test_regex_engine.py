@@ -0,0 +1,493 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import pytest
+
+from services import regex_engine
+from services.regex_engine import RegexEngine, RegexPlacement, parse_find_regex, translate_replacement
+
+
+def _write_scripts(directory, filename, scripts):
+    (directory / filename).write_text(json.dumps(scripts, ensure_ascii=False), encoding='utf-8')
+
+
+def _script(name, find_regex, replace_string='', placement=None, **extra):
+    script = {
+        'scriptName': name,
+        'findRegex': find_regex,
+        'replaceString': replace_string,
+        'placement': placement if placement is not None else [RegexPlacement.AI_OUTPUT],
+    }
+    script.update(extra)
+    return script
+
+
+@pytest.fixture
+def regex_dir(tmp_path):
+    directory = tmp_path / 'regex'
+    directory.mkdir()
+    return directory
+
+
+def test_parse_find_regex_flags():
+    assert parse_find_regex('/apple/gi') == ('apple', re.IGNORECASE)
+    assert parse_find_regex('/a/b/ms') == ('a/b', re.MULTILINE | re.DOTALL)
+    assert parse_find_regex('^plain$') == ('^plain$', re.MULTILINE)
+
+
+@pytest.mark.parametrize('js_replacement, expected', [
+    ('[$1]', '[\\g<1>]'),
+    ('$&!', '\\g<0>!'),
+    ('{{match}}', '\\g<0>'),
+    ('cost: $$5', 'cost: $5'),
+    ('$3 stays', '$3 stays'),
+    ('a\\nb', 'a\\\\nb'),
+    ('$<word>', '\\g<word>'),
+])
+def test_translate_replacement(js_replacement, expected):
+    assert translate_replacement(js_replacement, group_count=2) == expected
+
+
+def test_process_string_applies_scripts_in_file_order(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [_script('first', '/apple/gi', 'ORANGE')])
+    _write_scripts(regex_dir, 'b.json', [_script('second', '/ORANGE (\\w+)/g', '$1-orange')])
+
+    engine = RegexEngine(str(regex_dir))
+    result = engine.process_string('Apple pie', RegexPlacement.AI_OUTPUT)
+
+    assert result == 'pie-orange'
+    assert all(compiled.is_valid for compiled in engine.compiled_scripts)
+
+
+def test_backslashes_in_replacement_are_literal(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [_script('slashes', '/x/g', 'a\\nb')])
+
+    engine = RegexEngine(str(regex_dir))
+
+    assert engine.process_string('x', RegexPlacement.AI_OUTPUT) == 'a\\nb'
+
+
+def test_invalid_pattern_is_reported_once_and_skipped(regex_dir, capsys):
+    _write_scripts(regex_dir, 'a.json', [
+        _script('broken', '/(unclosed/g', 'x'),
+        _script('ok', '/b/g', 'B'),
+    ])
+
+    engine = RegexEngine(str(regex_dir))
+    assert 'invalid regex' in capsys.readouterr().out
+
+    assert engine.process_string('abc', RegexPlacement.AI_OUTPUT) == 'aBc'
+    assert capsys.readouterr().out == ''
+
+
+def test_macro_patterns_use_context_and_cache_variants(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [_script('char', '/{{char}}\\?/g', 'NAME')])
+    engine = RegexEngine(str(regex_dir))
+    compiled = engine.compiled_scripts[0]
+
+    assert engine.process_string('Mr.X? hi', RegexPlacement.AI_OUTPUT, context={'char': 'Mr.X'}) == 'NAME hi'
+    assert engine.process_string('MrzX? hi', RegexPlacement.AI_OUTPUT, context={'char': 'Mr.X'}) == 'MrzX? hi'
+    first_variant = compiled.resolve_pattern({'char': 'Mr.X'})
+    assert compiled.resolve_pattern({'char': 'Mr.X', 'user': 'ignored'}) is first_variant
+    assert compiled.resolve_pattern({'char': 'Alice'}) is not first_variant
+
+
+def test_placement_and_flag_filtering(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [
+        _script('user-only', '/a/g', 'U', placement=[RegexPlacement.USER_INPUT]),
+        _script('markdown-only', '/b/g', 'M', markdownOnly=True),
+        _script('prompt-only', '/c/g', 'P', promptOnly=True),
+        _script('disabled', '/d/g', 'D', disabled=True),
+    ])
+    engine = RegexEngine(str(regex_dir))
+
+    assert engine.process_string('abcd', RegexPlacement.AI_OUTPUT) == 'abcd'
+    assert engine.process_string('abcd', RegexPlacement.AI_OUTPUT, is_markdown=True) == 'aMcd'
+    assert engine.process_string('abcd', RegexPlacement.AI_OUTPUT, is_prompt=True) == 'abPd'
+    assert engine.process_string('abcd', RegexPlacement.AI_OUTPUT, overrides={'disabled': True}) == 'abcD'
+    assert engine.process_string('abcd', RegexPlacement.USER_INPUT, overrides={'user-only': False}) == 'abcd'
+
+
+def _linear_applicable(scripts, placement, is_markdown=False, is_prompt=False, overrides=None):
+    """Reference: the original per-call linear scan."""
+    applicable = []
+    for script in scripts:
+        script_name = script.get('scriptName')
+        is_disabled = script.get('disabled', False)
+        if overrides and script_name and script_name in overrides:
+            is_disabled = not overrides[script_name]
+        if is_disabled:
+            continue
+        script_placement = script.get('placement', [])
+        if not isinstance(script_placement, list):
+            script_placement = [script_placement]
+        if placement not in script_placement:
+            continue
+        if script.get('markdownOnly', False) and not is_markdown:
+            continue
+        if script.get('promptOnly', False) and not is_prompt:
+            continue
+        applicable.append(script)
+    return applicable
+
+
+def test_indexed_selection_matches_linear_scan(regex_dir):
+    import random
+
+    rng = random.Random(7)
+    placements = [0, 1, 2, 3, 5, 6]
+    for file_index in range(5):
+        scripts = []
+        for script_index in range(40):
+            scripts.append(_script(
+                f'name-{rng.randrange(60)}',
+                f'/p{file_index}_{script_index}/g',
+                placement=rng.sample(placements, rng.randint(0, 3)) if rng.random() > 0.1 else rng.choice(placements),
+                disabled=rng.random() < 0.3,
+                markdownOnly=rng.random() < 0.3,
+                promptOnly=rng.random() < 0.3,
+            ))
+        _write_scripts(regex_dir, f'{file_index:02d}.json', scripts)
+
+    engine = RegexEngine(str(regex_dir))
+    for _ in range(200):
+        placement = rng.choice(placements + [4])
+        is_markdown = rng.random() < 0.5
+        is_prompt = rng.random() < 0.5
+        overrides = {f'name-{rng.randrange(60)}': rng.random() < 0.5 for _ in range(rng.randrange(6))} or None
+
+        expected = _linear_applicable(engine.scripts, placement, is_markdown, is_prompt, overrides)
+        actual = engine._get_applicable_scripts(placement, is_markdown, is_prompt, overrides)
+        assert actual == expected
+
+
+def test_selection_preserves_file_name_order(regex_dir):
+    _write_scripts(regex_dir, 'b.json', [_script('from-b', '/b/g')])
+    _write_scripts(regex_dir, 'a.json', [_script('from-a1', '/a/g'), _script('from-a2', '/c/g', disabled=True)])
+
+    engine = RegexEngine(str(regex_dir))
+    selected = engine._get_applicable_scripts(RegexPlacement.AI_OUTPUT, overrides={'from-a2': True})
+
+    assert [script['scriptName'] for script in selected] == ['from-a1', 'from-a2', 'from-b']
+
+
+def _count_parses(monkeypatch):
+    calls = []
+    original = RegexEngine._compile_file
+
+    def counting(self, file_path):
+        calls.append(file_path)
+        return original(self, file_path)
+
+    monkeypatch.setattr(RegexEngine, '_compile_file', counting)
+    return calls
+
+
+def test_reload_only_parses_changed_files(regex_dir, monkeypatch):
+    _write_scripts(regex_dir, 'a.json', [_script('a', '/a/g', 'A')])
+    _write_scripts(regex_dir, 'b.json', [_script('b', '/b/g', 'B')])
+    engine = RegexEngine(str(regex_dir))
+    revision = engine.revision
+    calls = _count_parses(monkeypatch)
+
+    assert engine.reload_scripts() is False
+    assert calls == []
+    assert engine.revision == revision
+
+    _write_scripts(regex_dir, 'b.json', [_script('b', '/b/g', 'BB')])
+    _write_scripts(regex_dir, 'c.json', [_script('c', '/c/g', 'C')])
+    assert engine.reload_scripts() is True
+    assert sorted(os.path.basename(path) for path in calls) == ['b.json', 'c.json']
+    assert engine.revision == revision + 1
+    assert engine.process_string('abc', RegexPlacement.AI_OUTPUT) == 'ABBC'
+
+    (regex_dir / 'a.json').unlink()
+    assert engine.reload_scripts() is True
+    assert [script['scriptName'] for script in engine.scripts] == ['b', 'c']
+    assert [compiled.ordinal for compiled in engine.compiled_scripts] == [0, 1]
+
+
+def test_delete_script_uses_name_index(regex_dir):
+    _write_scripts(regex_dir, 'single.json', _script('single', '/x/g'))
+    _write_scripts(regex_dir, 'bundle.json', [_script('in-list', '/y/g')])
+    engine = RegexEngine(str(regex_dir))
+
+    assert engine.delete_script('in-list') is False
+    assert engine.delete_script('single') is True
+    assert not (regex_dir / 'single.json').exists()
+    assert [script['scriptName'] for script in engine.scripts] == ['in-list']
+
+    # Files added behind the engine's back are found after one refresh.
+    _write_scripts(regex_dir, 'late.json', _script('late', '/z/g'))
+    assert engine.delete_script('late') is True
+
+
+def test_watcher_reloads_on_change(regex_dir):
+    engine = RegexEngine(str(regex_dir))
+    watcher = engine.start_watching(poll_interval=0.05)
+    try:
+        _write_scripts(regex_dir, 'new.json', [_script('new', '/n/g', 'N')])
+        deadline = time.monotonic() + 5
+        while not engine.scripts and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        engine.stop_watching()
+
+    assert watcher.backend in ('native', 'polling')
+    assert [script['scriptName'] for script in engine.scripts] == ['new']
+
+
+def test_script_over_budget_is_flagged_after_repeated_strikes(regex_dir, monkeypatch):
+    monkeypatch.setattr(regex_engine, 'HARD_TIMEOUT_AVAILABLE', False)
+    _write_scripts(regex_dir, 'a.json', [_script('slow', '/a/g', 'A'), _script('fast', '/b/g', 'B')])
+    engine = RegexEngine(str(regex_dir))
+    engine.script_time_budget_ms = -1  # every run counts as over budget
+
+    # Overruns that could not be interrupted keep their result until they repeat.
+    for _ in range(regex_engine.OVER_BUDGET_STRIKES):
+        assert engine.process_string('ab', RegexPlacement.AI_OUTPUT) == 'AB'
+    # Both scripts are flagged now; later calls leave the text alone.
+    assert engine.process_string('ab', RegexPlacement.AI_OUTPUT) == 'ab'
+
+    stats = {entry['scriptName']: entry for entry in engine.get_script_stats()['scripts']}
+    assert stats['slow']['flagged'] == 'over_budget'
+    assert stats['slow']['over_budget'] == regex_engine.OVER_BUDGET_STRIKES
+    assert stats['slow']['skipped'] == 1
+
+    engine.reset_script_stats()
+    engine.script_time_budget_ms = 1000
+    assert engine.process_string('ab', RegexPlacement.AI_OUTPUT) == 'AB'
+
+
+def test_single_slow_run_does_not_disable_a_script(regex_dir, monkeypatch):
+    monkeypatch.setattr(regex_engine, 'HARD_TIMEOUT_AVAILABLE', False)
+    _write_scripts(regex_dir, 'a.json', [_script('swap', '/(\\w+)\\s+(\\w+)/g', '$2 $1')])
+    engine = RegexEngine(str(regex_dir))
+    engine.script_time_budget_ms = -1
+
+    assert engine.process_string('hello world', RegexPlacement.AI_OUTPUT) == 'world hello'
+    engine.script_time_budget_ms = 1000
+    # An in-budget run clears the strike.
+    assert engine.process_string('hello world', RegexPlacement.AI_OUTPUT) == 'world hello'
+    assert engine.compiled_scripts[0].strikes == 0
+    assert engine.get_script_stats()['scripts'][0]['flagged'] is None
+
+
+def test_budgets_scale_with_input_length():
+    assert regex_engine.budget_scale('short') == 1.0
+    assert regex_engine.budget_scale('x' * regex_engine.BUDGET_SCALE_CHARS * 4) == 4.0
+
+
+def test_hard_timeout_flags_the_script_and_later_scripts_still_run(regex_dir):
+    pytest.importorskip('regex')
+    _write_scripts(regex_dir, 'a.json', [_script('nested', '/(a|aa)+$/g', ''), _script('after', '/$/g', '.')])
+    engine = RegexEngine(str(regex_dir))
+    engine.script_time_budget_ms = 50
+    text = 'a' * 40 + 'b'
+
+    assert regex_engine.HARD_TIMEOUT_AVAILABLE
+    assert isinstance(engine.compiled_scripts[0].pattern, type(regex_engine._timeout_re.compile('')))
+    started = time.perf_counter()
+    assert engine.process_string(text, RegexPlacement.AI_OUTPUT) == text + '.'
+    assert time.perf_counter() - started < 1
+
+    stats = {entry['scriptName']: entry for entry in engine.get_script_stats()['scripts']}
+    assert stats['nested']['flagged'] == 'timeout'
+    assert stats['after']['flagged'] is None
+
+
+def test_hard_timeout_from_the_call_budget_only_skips_once(regex_dir):
+    pytest.importorskip('regex')
+    _write_scripts(regex_dir, 'a.json', [_script('nested', '/(a|aa)+$/g', '')])
+    engine = RegexEngine(str(regex_dir))
+    text = 'a' * 40 + 'b'
+
+    assert engine.process_string(text, RegexPlacement.AI_OUTPUT, time_budget_ms=20) == text
+    stats = engine.get_script_stats()['scripts'][0]
+    assert stats['flagged'] is None
+    assert stats['skipped'] == 1
+
+
+def test_call_budget_skips_remaining_scripts(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [_script('a', '/a/g', 'A')])
+    engine = RegexEngine(str(regex_dir))
+
+    assert engine.process_string('a', RegexPlacement.AI_OUTPUT, time_budget_ms=0) == 'a'
+    stats = engine.get_script_stats()['scripts'][0]
+    assert stats['skipped'] == 1
+    assert stats['flagged'] is None
+
+
+def test_nested_quantifiers_are_reported_as_risky(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [_script('nested', '/(a+)+$/g'), _script('lazy', '/<think>[\\s\\S]*?<\\/think>/g')])
+    engine = RegexEngine(str(regex_dir))
+
+    assert [entry['risky'] for entry in engine.get_script_stats()['scripts']] == [True, False]
+
+
+def test_literal_scripts_are_merged_into_one_pass(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [
+        _script('fruit', '/apple/gi', 'KIWI'),
+        _script('either', '/foo|bar/g', '[$&]'),
+        _script('tag', '/<think>[\\s\\S]*?<\\/think>/g', ''),
+        _script('set', '/[xy]/g', 'Z'),
+        _script('word', '/qq/g', 'W'),
+    ])
+    engine = RegexEngine(str(regex_dir))
+    scripts = engine._get_applicable_compiled(RegexPlacement.AI_OUTPUT)
+    plan = engine._execution_plan(scripts)
+
+    assert len(plan) == 3
+    assert [compiled.name for compiled in plan[0].scripts] == ['fruit', 'either']
+    assert plan[1].name == 'tag'
+    assert [compiled.name for compiled in plan[2].scripts] == ['set', 'word']
+    assert engine.process_string('Apple foo <think>x</think> y qq', RegexPlacement.AI_OUTPUT) == 'KIWI [foo]  Z W'
+
+
+def test_merged_pass_skipped_by_the_budget_is_reported_and_not_memoized(regex_dir):
+    _write_scripts(regex_dir, 'a.json', [_script('fruit', '/apple/g', 'KIWI'), _script('word', '/qq/g', 'W')])
+    engine = RegexEngine(str(regex_dir))
+    assert len(engine._execution_plan(engine._get_applicable_compiled(RegexPlacement.AI_OUTPUT))) == 1
+
+    assert engine.process_string_report('apple qq', RegexPlacement.AI_OUTPUT, time_budget_ms=0) == (
+        'apple qq', ['fruit', 'word'],
+    )
+
+    history = [{'role': 'model', 'parts': [{'text': 'apple qq'}]}]
+    engine.call_time_budget_ms = 0
+    assert engine.process_history(history)[0]['parts'][0]['text'] == 'apple qq'
+    engine.call_time_budget_ms = 1000
+    assert engine.process_history(history)[0]['parts'][0]['text'] == 'KIWI W'
+    assert engine.get_script_stats()['history_memo']['hits'] == 0
+
+
+@pytest.mark.parametrize('first, second', [
+    (('ab', 'X'), ('b', 'Y')),      # overlapping literals
+    (('b', 'X'), ('ab', 'Y')),      # later literal contains an earlier one
+    (('x', 'a'), ('ab', 'Y')),      # replacement creates a later match
+    (('x', ''), ('ab', 'Y')),       # empty replacement joins its neighbours
+    (('A', 'c'), ('/C/i', 'Y')),    # case-insensitive overlap with a replacement
+])
+def test_unsafe_literal_scripts_are_not_merged(regex_dir, first, second):
+    _write_scripts(regex_dir, 'a.json', [_script('first', *first), _script('second', *second)])
+    engine = RegexEngine(str(regex_dir))
+
+    plan = engine._execution_plan(engine._get_applicable_compiled(RegexPlacement.AI_OUTPUT))
+    assert [getattr(step, 'name', None) for step in plan] == ['first', 'second']
+
+
+def test_merged_execution_matches_sequential_application(regex_dir):
+    rng = random.Random(1234)
+    alphabet = 'abcAB你'
+    scripts = []
+    for index in range(40):
+        literals = [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 3))) for _ in range(rng.randint(1, 2))]
+        flags = rng.choice(['g', 'gi'])
+        replacement = rng.choice(['', 'X', '$&', '<$&>', 'q\\n', 'Z$$'])
+        scripts.append(_script(f's{index}', f"/{'|'.join(literals)}/{flags}", replacement))
+    _write_scripts(regex_dir, 'a.json', scripts)
+    engine = RegexEngine(str(regex_dir))
+
+    plan = engine._execution_plan(engine._get_applicable_compiled(RegexPlacement.AI_OUTPUT))
+    assert len(plan) < len(scripts)
+    for _ in range(200):
+        text = ''.join(rng.choice(alphabet + 'xyz ') for _ in range(rng.randint(0, 60)))
+        engine.merge_literal_scripts = True
+        merged = engine.process_string(text, RegexPlacement.AI_OUTPUT)
+        engine.merge_literal_scripts = False
+        assert merged == engine.process_string(text, RegexPlacement.AI_OUTPUT), text
+
+
+def test_depth_limits_filter_scripts(regex_dir):
+    _write_scripts(regex_dir, 'depth.json', [
+        _script('recent', '/apple/g', 'APPLE', minDepth=None, maxDepth=1),
+        _script('old', '/pear/g', 'PEAR', minDepth=2, maxDepth=float('nan')),
+    ])
+    engine = RegexEngine(str(regex_dir))
+
+    assert engine.process_string('apple pear', RegexPlacement.AI_OUTPUT, depth=0) == 'APPLE pear'
+    assert engine.process_string('apple pear', RegexPlacement.AI_OUTPUT, depth=3) == 'apple PEAR'
+    # Without a depth (display / output processing) the limits do not apply.
+    assert engine.process_string('apple pear', RegexPlacement.AI_OUTPUT) == 'APPLE PEAR'
+
+
+def test_process_history_uses_role_placement_and_depth(regex_dir):
+    _write_scripts(regex_dir, 'history.json', [
+        _script('user_only', '/hi/g', 'HI', placement=[RegexPlacement.USER_INPUT]),
+        _script('ai_recent', '/ok/g', 'OK', maxDepth=1),
+    ])
+    engine = RegexEngine(str(regex_dir))
+    history = [
+        {'role': 'user', 'parts': [{'text': 'hi ok'}]},
+        {'role': 'model', 'parts': [{'text': 'hi ok'}]},
+        {'role': 'user', 'parts': [{'text': 'hi ok'}]},
+        {'role': 'model', 'parts': [{'text': 'hi ok'}]},
+    ]
+
+    processed = engine.process_history(history)
+
+    assert [message['parts'][0]['text'] for message in processed] == ['HI ok', 'hi ok', 'HI ok', 'hi OK']
+    assert [message['role'] for message in processed] == ['user', 'model', 'user', 'model']
+    assert history[0]['parts'][0]['text'] == 'hi ok'
+
+
+def test_process_history_memoizes_unchanged_turns(regex_dir):
+    _write_scripts(regex_dir, 'memo.json', [_script('fruit', '/apple/g', 'APPLE')])
+    engine = RegexEngine(str(regex_dir))
+    history = [{'role': 'model', 'parts': [{'text': f'apple {index}'}]} for index in range(5)]
+
+    first = engine.process_history(history)
+    second = engine.process_history(history + [{'role': 'model', 'parts': [{'text': 'apple new'}]}])
+
+    assert second[:5] == first
+    memo = engine.get_script_stats()['history_memo']
+    assert memo['misses'] == 6
+    assert memo['hits'] == 5
+
+    # A changed script set invalidates the memoized results.
+    time.sleep(0.01)
+    _write_scripts(regex_dir, 'memo.json', [_script('fruit', '/apple/g', 'PEAR')])
+    engine.reload_scripts()
+    assert engine.process_history(history)[0]['parts'][0]['text'] == 'PEAR 0'
+
+
+def test_plan_and_macro_variant_caches_are_thread_safe(regex_dir, monkeypatch):
+    monkeypatch.setattr(regex_engine, 'EXECUTION_PLAN_CACHE_SIZE', 1)
+    monkeypatch.setattr(regex_engine, 'MACRO_VARIANT_CACHE_SIZE', 1)
+    _write_scripts(regex_dir, 'a.json', [
+        _script('a', '/a/g', 'A'), _script('b', '/b/g', 'B'), _script('c', '/c/g', 'C'),
+        _script('name', '/{{char}}/g', 'N'),
+    ])
+    engine = RegexEngine(str(regex_dir))
+    scripts = engine.compiled_scripts
+    subsets = [scripts[:2], scripts[1:3], scripts[:3], [scripts[0], scripts[2]]]
+    errors = []
+
+    def _worker(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(2000):
+                engine._execution_plan(rng.choice(subsets))
+                char = rng.choice(['x', 'y', 'z'])
+                assert scripts[3].resolve_pattern({'char': char}).pattern == char
+        except Exception as error:  # pragma: no cover - only on failure
+            errors.append(error)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible to expose races
+    try:
+        threads = [threading.Thread(target=_worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert engine.process_string('abcx', RegexPlacement.AI_OUTPUT, context={'char': 'x'}) == 'ABCN'
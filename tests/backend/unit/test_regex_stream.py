@@ -0,0 +1,143 @@
+import json
+import random
+import time
+
+import pytest
+
+from services import regex_engine
+from services.regex_engine import RegexEngine, RegexPlacement
+
+SCRIPTS = [
+    ('think', '/<think>[\\s\\S]*?<\\/think>/g', ''),
+    ('apple', '/apple/gi', 'ORANGE'),
+    ('heading', '/^# (.+)$/gm', '<h>$1</h>'),
+    ('word', '/\\bcat\\b/g', 'dog'),
+    ('percent', '/(\\d{1,3})%/g', '$1 pct'),
+    ('lookahead', '/foo(?=bar)/g', 'F'),
+    ('bold', '/\\*\\*([^*\\n]{1,40})\\*\\*/g', '<b>$1</b>'),
+    ('chained', '/ORANGE dog/g', 'PET'),
+    ('trailing', '/[ \\t]+$/gm', ''),
+]
+PIECES = ['<think>', '</think>', 'apple', 'APPLE', '# title\n', 'cat', 'concat', ' ', '  ', '\n', '12%',
+          'foobar', 'foo', '**bold**', '**', 'x', '你好', 'ORANGE ', 'dog']
+
+
+def _engine(tmp_path, scripts):
+    (tmp_path / 'scripts.json').write_text(json.dumps([
+        {'scriptName': name, 'findRegex': find, 'replaceString': replace, 'placement': [RegexPlacement.AI_OUTPUT]}
+        for name, find, replace in scripts
+    ]), encoding='utf-8')
+    return RegexEngine(str(tmp_path))
+
+
+def _stream(processor, text, rng):
+    out = []
+    index = 0
+    while index < len(text):
+        size = rng.randint(1, 8)
+        out.append(processor.feed(text[index:index + size]))
+        index += size
+    out.append(processor.flush())
+    return out
+
+
+def test_stream_rules_are_classified(tmp_path):
+    engine = _engine(tmp_path, SCRIPTS + [('spaces', '/\\s+$/g', '')])
+    rules = engine.create_stream_processor(RegexPlacement.AI_OUTPUT).stream_rules
+
+    assert rules['think'] == 'delimited'
+    assert rules['apple'] == 'bounded'
+    assert rules['heading'] == 'line'
+    assert rules['spaces'] == 'whole'
+
+
+def test_streamed_output_matches_processing_the_full_text(tmp_path):
+    engine = _engine(tmp_path, SCRIPTS)
+    rng = random.Random(42)
+
+    for _ in range(300):
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 40)))
+        processor = engine.create_stream_processor(RegexPlacement.AI_OUTPUT)
+        assert ''.join(_stream(processor, text, rng)) == engine.process_string(text, RegexPlacement.AI_OUTPUT), text
+        assert processor.exact
+
+
+def test_unclosed_think_block_is_held_back_then_removed(tmp_path):
+    engine = _engine(tmp_path, SCRIPTS[:2])
+    processor = engine.create_stream_processor(RegexPlacement.AI_OUTPUT)
+
+    emitted = [processor.feed('an apple a day keeps the doctor away. ')]
+    assert emitted[0].startswith('an ORANGE a day')
+    emitted.append(processor.feed('<think>plan the '))
+    emitted.append(processor.feed('apple scene'))
+    assert processor.held_chars >= len('<think>plan the apple scene')
+    emitted.append(processor.feed('</think>The end of chapter one.'))
+    emitted.append(processor.flush())
+
+    assert not any('plan' in chunk for chunk in emitted)
+    assert ''.join(emitted) == 'an ORANGE a day keeps the doctor away. The end of chapter one.'
+
+
+def test_holdback_is_bounded_and_marks_output_inexact(tmp_path):
+    engine = _engine(tmp_path, SCRIPTS[:1])
+    processor = engine.create_stream_processor(RegexPlacement.AI_OUTPUT, max_holdback=1000)
+
+    emitted = ''.join(processor.feed('<think>' + 'x' * 100) for _ in range(50))
+
+    assert processor.held_chars <= 1000
+    assert emitted.startswith('<think>')
+    assert not processor.exact
+
+
+@pytest.mark.parametrize('chunk_count', [200, 2000])
+def test_open_block_work_is_proportional_to_chunk_size(tmp_path, monkeypatch, chunk_count):
+    engine = _engine(tmp_path, SCRIPTS[:1])
+    processor = engine.create_stream_processor(RegexPlacement.AI_OUTPUT, max_holdback=10 ** 7)
+    stage = processor.stages[0]
+    scans = []
+    original = stage._matches
+    monkeypatch.setattr(stage, '_matches', lambda: scans.append(len(stage.pending)) or original())
+
+    processor.feed('<think>')
+    for _ in range(chunk_count):
+        processor.feed('reasoning ')
+    processor.feed('</think>done.')
+
+    # Only opening and closing the block scan the buffer; the chunks in between do not.
+    assert len(scans) <= 3
+    assert processor.flush() == 'done.'
+
+
+def test_pathological_stage_is_bypassed_and_the_stream_completes(tmp_path):
+    pytest.importorskip('regex')
+    engine = _engine(tmp_path, [('nested', '/(a|aa)+$/g', ''), ('apple', '/apple/g', 'ORANGE')])
+    engine.script_time_budget_ms = 50
+    processor = engine.create_stream_processor(RegexPlacement.AI_OUTPUT)
+    text = 'apple ' + 'a' * 40 + 'b'
+
+    started = time.perf_counter()
+    out = _stream(processor, text, random.Random(1))
+    assert time.perf_counter() - started < 2
+
+    # The nested stage passes its input through; later stages still run.
+    assert ''.join(out) == 'ORANGE ' + 'a' * 40 + 'b'
+    assert processor.skipped == ['nested']
+    stats = {entry['scriptName']: entry for entry in engine.get_script_stats()['scripts']}
+    assert stats['nested']['flagged'] == 'timeout'
+    assert stats['apple']['flagged'] is None
+
+
+def test_stage_over_budget_without_hard_timeout_is_bypassed_after_strikes(tmp_path, monkeypatch):
+    monkeypatch.setattr(regex_engine, 'HARD_TIMEOUT_AVAILABLE', False)
+    engine = _engine(tmp_path, [('line', '/^x+$/gm', 'y')])
+    engine.script_time_budget_ms = -1  # every scan counts as over budget
+    processor = engine.create_stream_processor(RegexPlacement.AI_OUTPUT)
+
+    emitted = [processor.feed('xx\n') for _ in range(regex_engine.OVER_BUDGET_STRIKES + 2)]
+    emitted.append(processor.flush())
+
+    # Overruns keep their result until the script is flagged; from then on lines pass through.
+    strikes = regex_engine.OVER_BUDGET_STRIKES
+    assert ''.join(emitted) == 'y\n' * (strikes - 1) + 'xx\n' * 3
+    assert processor.skipped == ['line']
+    assert engine.compiled_scripts[0].flagged == 'over_budget'
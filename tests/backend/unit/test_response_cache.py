@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+from services import llm_service
+from services.response_cache import ResponseCache, response_cache, response_cache_key
+
+
+def test_key_is_canonical():
+    assert response_cache_key({'a': 1, 'b': [1, 2]}) == response_cache_key({'b': [1, 2], 'a': 1})
+    assert response_cache_key({'a': 1}) != response_cache_key({'a': 2})
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResponseCache(str(tmp_path)).put('ab' * 32, 'cached text', {'prompt_tokens': 3})
+
+    restarted = ResponseCache(str(tmp_path))
+
+    assert restarted.get('ab' * 32) == {'text': 'cached text', 'usage': {'prompt_tokens': 3}}
+    assert restarted.get('ab' * 32)['text'] == 'cached text'
+    assert (restarted.get_stats()['disk_hits'], restarted.get_stats()['memory_hits']) == (1, 1)
+
+
+def test_entries_expire_in_both_tiers(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=-1)
+    cache.put('cd' * 32, 'stale')
+
+    assert cache.get('cd' * 32) is None
+    assert ResponseCache(str(tmp_path)).get('cd' * 32) is None
+    assert list(tmp_path.rglob('*.json')) == []
+
+
+def test_memory_tier_is_bounded():
+    cache = ResponseCache(max_memory_entries=2)
+    for index in range(3):
+        cache.put(f'{index:064d}', str(index))
+
+    assert cache.get(f'{0:064d}') is None
+    assert cache.get(f'{2:064d}')['text'] == '2'
+
+
+def test_async_access_does_disk_io_off_the_event_loop(tmp_path, monkeypatch):
+    writer, reader = ResponseCache(str(tmp_path)), ResponseCache(str(tmp_path))
+    threads = []
+    for cache, name in ((writer, '_save'), (reader, '_load')):
+        original = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *args, _original=original: (
+            threads.append(threading.current_thread()) or _original(*args)))
+
+    async def _roundtrip():
+        await writer.put_async('ef' * 32, 'cached text')
+        first = await reader.get_async('ef' * 32)
+        second = await reader.get_async('ef' * 32)
+        return first, second
+
+    first, second = asyncio.run(_roundtrip())
+
+    assert first == second == {'text': 'cached text', 'usage': {}}
+    # One write and one read hit the disk, both on worker threads; the memory hit did no I/O.
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def _generate(**overrides):
+    kwargs = {'message': 'polish this', 'history': [], 'system_instruction': 'sys',
+              'model_name': 'gemini-test', 'provider_name': 'google', 'temperature': 0.0, **overrides}
+    return asyncio.run(llm_service.generate_response_async(**kwargs))
+
+
+def test_deterministic_requests_are_served_from_cache(monkeypatch):
+    response_cache.clear()
+    calls = []
+
+    async def _fake_google(**kwargs):
+        calls.append(kwargs)
+        return 'polished'
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _fake_google)
+
+    usage = {}
+    assert _generate() == 'polished'
+    assert _generate(usage=usage) == 'polished'
+    assert _generate(message='other text') == 'polished'
+    assert _generate(temperature=0.7) == 'polished'
+    assert _generate(temperature=0.7, use_cache=True) == 'polished'
+    assert _generate(temperature=0.7, use_cache=True) == 'polished'
+
+    assert len(calls) == 4
+    assert usage['response_cache'] == 'hit'
+    response_cache.clear()
+
+
+def test_errors_are_not_cached(monkeypatch):
+    response_cache.clear()
+    calls = []
+
+    async def _failing_google(**kwargs):
+        calls.append(kwargs)
+        raise RuntimeError('quota exceeded')
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _failing_google)
+
+    assert _generate().startswith(llm_service.ERROR_RESPONSE_PREFIX)
+    assert _generate().startswith(llm_service.ERROR_RESPONSE_PREFIX)
+    assert len(calls) == 2
+
+
+def test_stream_replays_cached_response(monkeypatch):
+    response_cache.clear()
+    calls = []
+
+    async def _fake_stream(**kwargs):
+        calls.append(kwargs)
+        for piece in ['first ', 'second']:
+            yield piece
+
+    async def _collect():
+        return [event async for event in llm_service.stream_response_events(
+            message='hi', history=[], system_instruction='sys', model_name='gemini-test',
+            provider_name='google', temperature=0.0,
+        )]
+
+    monkeypatch.setattr(llm_service, '_stream_google_response_async', _fake_stream)
+
+    asyncio.run(_collect())
+    replayed = asyncio.run(_collect())
+
+    assert len(calls) == 1
+    assert [event['type'] for event in replayed] == ['delta', 'done']
+    assert replayed[-1]['text'] == 'first second'
+    assert replayed[-1]['metrics']['usage'] == {'response_cache': 'hit'}
+    response_cache.clear()
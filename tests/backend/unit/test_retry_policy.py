@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from services import retry_policy
+from services.retry_policy import (
+    RetryPolicy,
+    call_with_retry,
+    call_with_retry_async,
+    deadline_after,
+    is_transient,
+    next_retry_wait,
+    retry_after_seconds,
+)
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+
+
+def _status_error(status: int, headers=None) -> openai.APIStatusError:
+    request = httpx.Request('POST', 'http://stub/v1/chat/completions')
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return openai.APIStatusError(f'status {status}', response=response, body=None)
+
+
+def test_only_transient_errors_are_retryable():
+    assert is_transient(_status_error(429))
+    assert is_transient(_status_error(503))
+    assert is_transient(openai.APIConnectionError(request=httpx.Request('GET', 'http://stub')))
+    assert not is_transient(_status_error(400))
+    assert not is_transient(_status_error(401))
+    assert not is_transient(ValueError('bad request'))
+
+
+def test_retry_after_headers_are_parsed():
+    assert retry_after_seconds(_status_error(429, {'Retry-After': '2'})) == 2.0
+    assert retry_after_seconds(_status_error(429, {'retry-after-ms': '250'})) == 0.25
+    date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 30))
+    assert 25 < retry_after_seconds(_status_error(429, {'Retry-After': date})) <= 30
+    assert retry_after_seconds(_status_error(429, {'Retry-After': 'soon'})) is None
+    assert retry_after_seconds(_status_error(429)) is None
+
+
+def test_backoff_uses_full_jitter_within_the_bound(monkeypatch):
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+    monkeypatch.setattr(retry_policy.random, 'uniform', lambda low, high: high)
+    assert [policy.backoff(attempt) for attempt in (1, 2, 3, 4)] == [0.5, 1.0, 2.0, 2.0]
+
+
+def test_wait_respects_retry_after_and_deadline():
+    error = _status_error(429, {'Retry-After': '5'})
+    assert next_retry_wait(FAST, 1, error, deadline_after(10)) == 5.0
+    # Waiting would end past the caller's budget
+    assert next_retry_wait(FAST, 1, error, deadline_after(3)) is None
+    # Out of attempts
+    assert next_retry_wait(FAST, 3, _status_error(503), None) is None
+    # Providers asking for very long waits are not waited for
+    assert next_retry_wait(FAST, 1, _status_error(429, {'Retry-After': '3600'}), None) is None
+
+
+def test_call_with_retry_recovers_from_transient_errors():
+    failures = [_status_error(503), _status_error(429)]
+
+    def _call():
+        if failures:
+            raise failures.pop(0)
+        return 'ok'
+
+    assert call_with_retry(_call, policy=FAST) == 'ok'
+    assert failures == []
+
+
+def test_call_with_retry_raises_permanent_errors_immediately():
+    calls = []
+
+    def _call():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(openai.APIStatusError):
+        call_with_retry(_call, policy=FAST)
+    assert len(calls) == 1
+
+
+def test_deadline_bounds_retries_but_not_a_running_attempt():
+    calls = []
+
+    async def _slow_then_failing():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        if len(calls) == 1:
+            return 'slow result'
+        raise _status_error(503)
+
+    # The attempt outlives the deadline and still delivers its result.
+    assert asyncio.run(call_with_retry_async(_slow_then_failing, policy=FAST, deadline=deadline_after(0.02))) == 'slow result'
+    # A transient failure after the deadline is raised instead of retried.
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(call_with_retry_async(_slow_then_failing, policy=FAST, deadline=deadline_after(0.02)))
+    assert len(calls) == 2
@@ -0,0 +1,78 @@
+from services.llm_service import SessionHistory, _convert_history_for_openai, _format_history_for_openai
+from services.session_store import SessionStore, merge_delta
+
+
+def test_merge_delta_merges_nested_dicts():
+    base = {'current_node': {'id': 'c1', 'content': 'old'}, 'novel_outline': 'outline'}
+
+    merged = merge_delta(base, {'current_node': {'content': 'new'}, 'active_task': None})
+
+    assert merged == {'current_node': {'id': 'c1', 'content': 'new'}, 'novel_outline': 'outline', 'active_task': None}
+    assert base['current_node']['content'] == 'old'
+
+
+def test_session_history_converts_only_new_messages():
+    calls = []
+
+    def _counting_formatter(messages):
+        calls.append(len(messages))
+        return _convert_history_for_openai(messages)
+
+    history = SessionHistory([{'role': 'user', 'parts': [{'text': 'hi'}]}])
+    assert history.formatted('openai', _counting_formatter) == [{'role': 'user', 'content': 'hi'}]
+
+    history.append({'role': 'model', 'parts': [{'text': 'hello'}]})
+    formatted = history.formatted('openai', _counting_formatter)
+    history.formatted('openai', _counting_formatter)
+
+    assert formatted == _format_history_for_openai(list(history))
+    assert calls == [1, 1]
+
+
+def test_sessions_are_spilled_and_reloaded(tmp_path):
+    store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+    first = store.create(state={'novel_outline': 'one'})
+    first.append_turn('question', 'answer')
+    second = store.create(state={'novel_outline': 'two'})
+
+    assert len(store) == 1
+    assert (tmp_path / f'{first.session_id}.json').exists()
+
+    reloaded = store.get(first.session_id)
+
+    assert reloaded is not first
+    assert reloaded.state == {'novel_outline': 'one'}
+    assert [message['parts'][0]['text'] for message in reloaded.history] == ['question', 'answer']
+    assert not (tmp_path / f'{first.session_id}.json').exists()
+    assert (tmp_path / f'{second.session_id}.json').exists()
+
+
+def test_flushed_sessions_survive_a_restart(tmp_path):
+    store = SessionStore(spill_dir=str(tmp_path))
+    session = store.create(state={'novel_outline': 'one'})
+    session.append_turn('question', 'answer')
+
+    assert store.flush() == 1
+    assert store.get(session.session_id) is session
+
+    restarted = SessionStore(spill_dir=str(tmp_path))
+    reloaded = restarted.get(session.session_id)
+
+    assert reloaded.state == {'novel_outline': 'one'}
+    assert [message['parts'][0]['text'] for message in reloaded.history] == ['question', 'answer']
+
+
+def test_evicted_sessions_are_dropped_without_spill_dir():
+    store = SessionStore(max_sessions=1)
+    first = store.create()
+    store.create()
+
+    assert store.get(first.session_id) is None
+
+
+def test_unknown_and_malformed_session_ids(tmp_path):
+    store = SessionStore(spill_dir=str(tmp_path))
+
+    assert store.get('0' * 32) is None
+    assert store.get('../provider_settings') is None
+    assert store.delete('../provider_settings') is False
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import llm_service
+from services.providers.model_list_cache import ModelListCache
+from services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def _slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', _slow))) for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['result'] * 4
+    assert len(calls) == 1
+    assert flight.get_stats() == {'in_flight': 0, 'calls': 1, 'shared': 3}
+
+
+def test_errors_are_shared_and_not_remembered():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def _failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError('upstream down')
+
+    async def _run():
+        return await asyncio.gather(flight.do('key', _failing), flight.do('key', _failing), return_exceptions=True)
+
+    first = asyncio.run(_run())
+    second = asyncio.run(_run())
+
+    assert all(isinstance(result, RuntimeError) for result in first + second)
+    assert len(calls) == 2
+
+
+def test_waiter_takes_over_when_leader_is_cancelled():
+    flight = AsyncSingleFlight()
+
+    async def _slow():
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def _run():
+        leader = asyncio.create_task(flight.do('key', _slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do('key', _slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(_run()) == 'done'
+
+
+def test_identical_generations_in_flight_share_one_provider_call(monkeypatch):
+    calls = []
+
+    async def _slow_google(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.05)
+        kwargs['usage'].update({'prompt_tokens': 5})
+        return 'shared reply'
+
+    monkeypatch.setattr(llm_service, '_generate_google_response_async', _slow_google)
+
+    async def _run():
+        kwargs = {'message': 'hi', 'history': [], 'system_instruction': 'sys', 'model_name': 'gemini-test',
+                  'provider_name': 'google', 'temperature': 0.7}
+        usages = [{}, {}, {}]
+        texts = await asyncio.gather(
+            llm_service.generate_response_async(**kwargs, usage=usages[0]),
+            llm_service.generate_response_async(**kwargs, usage=usages[1]),
+            llm_service.generate_response_async(**{**kwargs, 'message': 'other'}, usage=usages[2]),
+        )
+        return texts, usages
+
+    texts, usages = asyncio.run(_run())
+
+    assert texts == ['shared reply'] * 3
+    assert len(calls) == 2
+    assert usages[0] == usages[1] == {'prompt_tokens': 5}
+
+
+class _FakeProvider:
+    PROVIDER_NAME = 'fake'
+
+    def __init__(self):
+        self.api_key = 'key-1'
+        self.calls = 0
+
+    def get_current_api_key(self):
+        return self.api_key
+
+    def list_models(self):
+        self.calls += 1
+        return [f'model-{self.calls}']
+
+
+def test_model_lists_are_cached_per_credentials():
+    cache = ModelListCache(ttl_seconds=60)
+    provider = _FakeProvider()
+
+    assert cache.list_models(provider) == (['model-1'], False)
+    assert cache.list_models(provider) == (['model-1'], True)
+    assert cache.list_models(provider, force_refresh=True) == (['model-2'], False)
+    provider.api_key = 'key-2'
+    assert cache.list_models(provider) == (['model-3'], False)
+
+
+def test_expired_model_lists_are_fetched_again():
+    cache = ModelListCache(ttl_seconds=0)
+    provider = _FakeProvider()
+
+    cache.list_models(provider)
+    assert cache.list_models(provider) == (['model-2'], False)
@@ -0,0 +1,12 @@
+from services.token_estimator import MESSAGE_OVERHEAD_TOKENS, estimate_message_tokens, estimate_tokens
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('你好世界') == 4
+    assert estimate_tokens('hello world!') == 3
+    assert estimate_tokens('第一章 chapter') == 3 + 2
+
+
+def test_estimate_message_tokens_adds_overhead():
+    assert estimate_message_tokens([{'text': '你好'}, {'text': ''}]) == MESSAGE_OVERHEAD_TOKENS + 2